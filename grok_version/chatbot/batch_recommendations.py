@@ -0,0 +1,207 @@
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog_snapshot import DEFAULT_SNAPSHOT_DIR, current_snapshot_path
+from recommendation_engine import RecommendationEngine, match_value
+
+logger = logging.getLogger(__name__)
+
+# Colonnes acceptées en entrée (noms alternatifs : clés de session du chatbot)
+COLUMNS = {
+    "student": ("student", "student_name"),
+    "level": ("level", "user_level", "niveau"),
+    "subjects": ("subjects", "user_subjects", "matieres"),
+    "school": ("school", "user_school", "ecole"),
+    "centre": ("centre", "center", "user_center"),
+    "forfait": ("forfait", "forfaits", "id_forfait"),
+    "type_duree": ("type_duree", "duration_type", "types_duree"),
+    "teachers": ("teachers", "user_teachers", "professeurs"),
+}
+
+# Colonnes du CSV de sortie (une ligne par matière)
+OUTPUT_FIELDS = ["student", "level", "subject", "status", "error", "id_cours", "name_cours", "centre", "jour",
+                 "heure_debut", "heure_fin", "id_forfait", "nom_forfait", "type_duree", "remaining_sessions",
+                 "tarif_unitaire", "tarif_total", "total_student"]
+
+_engine = None
+
+
+def _split(value):
+    """'a; b' ou 'a, b' -> ['a', 'b'] (les listes JSON sont acceptées telles quelles)"""
+    if isinstance(value, list):
+        return [str(item).strip() for item in value]
+    separator = ";" if ";" in (value or "") else ","
+    return [item.strip() for item in (value or "").split(separator)]
+
+
+def read_students(path):
+    """Élèves à traiter depuis un CSV, un JSON (liste d'objets) ou un JSONL"""
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    elif path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+
+    students = []
+    for row in rows:
+        lowered = {str(key).strip().lower(): value for key, value in row.items()}
+        students.append({column: next((lowered[alias] for alias in aliases if lowered.get(alias) not in (None, "")), "")
+                         for column, aliases in COLUMNS.items()})
+    return students
+
+
+def _init_worker(snapshot_path, seed):
+    # Chaque processus mappe le même fichier snapshot : les pages sont partagées via le cache du système
+    global _engine
+    logging.basicConfig(level=logging.WARNING)
+    _engine = RecommendationEngine(snapshot_path=snapshot_path)
+    random.seed(seed)
+
+
+def _pick(options, wanted):
+    """Option choisie par id, par nom approché, ou la première si rien n'est demandé"""
+    if not options:
+        return None
+    if not wanted:
+        return next(iter(options))
+    if wanted in options:
+        return wanted
+    names = {info["name"]: key for key, info in options.items()}
+    name, valid = match_value(wanted, list(names))
+    return names[name] if valid else None
+
+
+def quote_student(student, engine=None):
+    """Recommandations + devis d'un élève : meilleur groupe sans chevauchement par matière"""
+    engine = engine or _engine
+    result = {"student": student["student"], "level": student["level"], "status": "ok", "error": None,
+              "groups": {}, "tariff_message": "", "total": None}
+
+    level, valid_level = match_value(student["level"], engine.levels_list)
+    if not valid_level:
+        result.update(status="erreur", error=f"Niveau inconnu : {student['level']}")
+        return result
+    result["level"] = level
+
+    subjects = [match_value(subject, engine.subjects_list)[0] for subject in _split(student["subjects"]) if subject]
+    forfait_choices = _split(student["forfait"])
+    type_choices = _split(student["type_duree"])
+    forfaits_info, selected_forfaits, selected_types, duree_names = {}, {}, {}, {}
+    for i, subject in enumerate(subjects):
+        forfaits_info[subject] = engine.get_available_forfaits(level, subject)
+        id_forfait = _pick(forfaits_info[subject], forfait_choices[i] if i < len(forfait_choices) else "")
+        if id_forfait is None:
+            result.update(status="erreur", error=f"Forfait introuvable pour {subject}")
+            return result
+        types_duree = forfaits_info[subject][id_forfait]["types_duree"]
+        type_id = _pick(types_duree, type_choices[i] if i < len(type_choices) else "")
+        if type_id is None:
+            result.update(status="erreur", error=f"Type de durée introuvable pour {subject}")
+            return result
+        selected_forfaits[subject], selected_types[subject] = id_forfait, type_id
+        duree_names[subject] = types_duree[type_id]["name"]
+
+    _, _, groups_for_selection, matched_subjects = engine.get_recommendations(
+        student["student"], level, ", ".join(subjects), student["teachers"], student["school"], student["centre"],
+        selected_forfaits, selected_types, forfaits_info
+    )
+    missing = [subject for subject in matched_subjects if not groups_for_selection.get(subject)]
+    if missing:
+        result.update(status="sans_groupe", error=f"Aucun groupe pour {', '.join(missing)}")
+        return result
+
+    # Première combinaison (dans l'ordre des recommandations) sans chevauchement d'horaires
+    combinations = itertools.product(*(groups_for_selection[subject] for subject in matched_subjects))
+    selected_groups = None
+    for combination in combinations:
+        candidate = dict(zip(matched_subjects, combination))
+        if not engine.check_overlaps(candidate):
+            selected_groups = candidate
+            break
+    if selected_groups is None:
+        selected_groups = {subject: groups_for_selection[subject][0] for subject in matched_subjects}
+        result.update(status="conflit", error="Aucune combinaison de groupes sans chevauchement")
+
+    tariffs_by_group, tariff_message, total = engine.calculate_tariffs(selected_groups, duree_names, selected_types, forfaits_info)
+    if not tariffs_by_group:
+        result.update(status="erreur", error=tariff_message)
+        return result
+
+    for subject, tariff in tariffs_by_group.items():
+        group = engine.get_groups([tariff["id_cours"]])[0]
+        result["groups"][subject] = {
+            **tariff, "name_cours": group.name_cours, "centre": group.centre, "jour": group.jour,
+            "heure_debut": group.heure_debut, "heure_fin": group.heure_fin, "type_duree": duree_names[subject],
+        }
+    result["tariff_message"] = tariff_message
+    result["total"] = round(total, 2)
+    return result
+
+
+def write_results(path, results):
+    """JSONL : un objet par élève ; CSV : une ligne par matière"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if path.endswith(".jsonl"):
+        with open(path, "w", encoding="utf-8") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return
+
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=OUTPUT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for result in results:
+            base = {"student": result["student"], "level": result["level"], "status": result["status"],
+                    "error": result["error"] or "", "total_student": result["total"]}
+            if not result["groups"]:
+                writer.writerow(base)
+            for subject, group in result["groups"].items():
+                writer.writerow({**base, **group, "subject": subject})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recommandations et devis pour une liste d'élèves (sans conversation)")
+    parser.add_argument("input", help="Fichier CSV, JSON ou JSONL des élèves")
+    parser.add_argument("output", help="Fichier de résultats (.csv ou .jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=16)
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument("--seed", type=int, default=0, help="Graine du tirage aléatoire des groupes sans critère")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    snapshot_path = current_snapshot_path(args.snapshot_dir)
+    if not snapshot_path:
+        print(f"Aucun snapshot publié dans {args.snapshot_dir} : lancez d'abord catalog_snapshot.py")
+        sys.exit(1)
+
+    students = read_students(args.input)
+    print(f"{len(students)} élève(s) à traiter avec {args.workers} processus (snapshot {os.path.basename(snapshot_path)})")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(snapshot_path, args.seed)) as pool:
+        results = list(pool.map(quote_student, students, chunksize=args.chunksize))
+    elapsed = time.perf_counter() - start
+
+    write_results(args.output, results)
+    by_status = {}
+    for result in results:
+        by_status[result["status"]] = by_status.get(result["status"], 0) + 1
+    print(f"Terminé en {elapsed:.2f} s : {len(students) / elapsed:.1f} élèves/s, statuts {by_status}")
+    print(f"Résultats enregistrés dans {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+from metadata_schema import build_group_metadata
+from recommendation_cache import RecommendationCache
+from recommendation_engine import (RecommendationEngine, match_value, GROUPS_COLLECTION, SEANCES_COLLECTION,
+                                   COMBINAISONS_COLLECTION, REFERENCE_DATE)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_BENCH_DIR = os.path.join(parent_dir, "benchmarks")
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+BATCH_SIZE = 5000
+EMBEDDING_DIM = 8           # embeddings factices : aucun modèle n'est chargé
+REGRESSION_THRESHOLD = 0.20  # +20 % sur le p50 = régression
+
+# Forme du catalogue synthétique (proche de groupes_vectorises9)
+LEVELS = [f"BL - Niveau {i}" for i in range(20)]
+SUBJECTS = ["Mathématiques", "Physique - Chimie", "Français", "Anglais", "SVT", "Histoire - Géographie",
+            "Philosophie", "Arabe", "Informatique", "Économie", "Comptabilité", "Espagnol"]
+CENTERS = [f"Centre {i}" for i in range(15)]
+DAYS = ["Lundi", "Mardi", "Mercredi", "Jeudi", "Vendredi", "Samedi"]
+SLOTS = [("08:00", "10:00"), ("10:00", "12:00"), ("14:00", "16:00"), ("16:00", "18:00"), ("18:00", "20:00")]
+PERIODS = ["Période 1", "Période 2", "Période 3", "Période 4"]
+
+
+def forfait_id(level_index, subject_index, variant):
+    return str(12600000 + (level_index * len(SUBJECTS) + subject_index) * 2 + variant)
+
+
+def synthetic_groups(size, seed=42):
+    """Métadonnées de groupes synthétiques (schéma de l'ingestion), générées de façon déterministe"""
+    rng = random.Random(seed)
+    for i in range(size):
+        level_index = rng.randrange(len(LEVELS))
+        subject_index = rng.randrange(len(SUBJECTS))
+        id_forfait = forfait_id(level_index, subject_index, rng.randrange(2))
+        num_students = rng.randint(1, 12)
+        periods = rng.sample(PERIODS, rng.randint(1, 3))
+        tarifs = [rng.choice((90, 100, 120, 150)) for _ in periods]
+        heure_debut, heure_fin = rng.choice(SLOTS)
+        students = [(f"Élève {rng.randrange(size * 3)}", f"École {rng.randrange(200)}") for _ in range(num_students)]
+        yield build_group_metadata({
+            "id_cours": str(10000000 + i),
+            "name_cours": f"Groupe {i}",
+            "id_forfait": id_forfait,
+            "nom_forfait": f"FORFAIT-{LEVELS[level_index]}-{SUBJECTS[subject_index]}",
+            "total_students": num_students,
+            "student": ", ".join(student for student, _ in students),
+            "ecole": ", ".join(school for _, school in students),
+            "centre": rng.choice(CENTERS),
+            "teacher": f"Professeur {rng.randrange(500)}",
+            "date_debut": "2024/09/01",
+            "date_fin": "2025/06/30",
+            "heure_debut": heure_debut,
+            "heure_fin": heure_fin,
+            "jour": rng.choice(DAYS),
+            "niveau": LEVELS[level_index],
+            "matiere": SUBJECTS[subject_index],
+        }, students, [(str(PERIODS.index(period) + 1), period, id_forfait, tarif) for period, tarif in zip(periods, tarifs)])
+
+
+def synthetic_seances(size, group_count, seed=43):
+    """Séances réparties sur les groupes, autour de la date de référence"""
+    rng = random.Random(seed)
+    start = date(2024, 9, 1)
+    for i in range(size):
+        day = start + timedelta(days=rng.randrange(300))
+        yield {"id_cours": str(10000000 + rng.randrange(group_count)), "date_seance": day.strftime("%Y/%m/%d")}
+
+
+def synthetic_combinaisons(seed=44):
+    rng = random.Random(seed)
+    for i in range(50):
+        level_index = rng.randrange(len(LEVELS))
+        subjects = rng.sample(range(len(SUBJECTS)), 2)
+        reduction = str(rng.choice((5, 10, 15)))
+        for subject_index in subjects:
+            yield {"id_combinaison": f"C{i}", "id_forfait": forfait_id(level_index, subject_index, 0), "reduction": reduction}
+
+
+def build_catalog(client, size, seed=42):
+    """Crée (ou réutilise) les trois collections du catalogue synthétique dans un client ChromaDB"""
+    existing = {collection.name if hasattr(collection, "name") else collection for collection in client.list_collections()}
+    if GROUPS_COLLECTION in existing and client.get_collection(GROUPS_COLLECTION).count() == size:
+        return False
+
+    for name in (GROUPS_COLLECTION, SEANCES_COLLECTION, COMBINAISONS_COLLECTION):
+        if name in existing:
+            client.delete_collection(name)
+
+    rng = random.Random(seed)
+    sources = [
+        (GROUPS_COLLECTION, synthetic_groups(size, seed), lambda m, i: m["id_cours"]),
+        (SEANCES_COLLECTION, synthetic_seances(size, size, seed + 1), lambda m, i: f"s{i}"),
+        (COMBINAISONS_COLLECTION, synthetic_combinaisons(seed + 2), lambda m, i: f"{m['id_combinaison']}_{m['id_forfait']}"),
+    ]
+    for name, metadatas, make_id in sources:
+        collection = client.create_collection(name=name)
+        batch = []
+        for i, metadata in enumerate(metadatas):
+            batch.append((make_id(metadata, i), metadata))
+            if len(batch) >= BATCH_SIZE:
+                _add_batch(collection, batch, rng)
+                batch = []
+        if batch:
+            _add_batch(collection, batch, rng)
+    return True
+
+
+def _add_batch(collection, batch, rng):
+    collection.add(
+        ids=[item[0] for item in batch],
+        metadatas=[item[1] for item in batch],
+        documents=[item[0] for item in batch],
+        embeddings=[[rng.random() for _ in range(EMBEDDING_DIM)] for _ in batch],
+    )
+
+
+def time_call(function, iterations):
+    """Durées (ms) de `iterations` appels ; function reçoit l'indice de l'itération"""
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        function(i)
+        durations.append((time.perf_counter() - start) * 1000)
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "min_ms": round(durations[0], 4),
+        "p50_ms": round(statistics.median(durations), 4),
+        "p95_ms": round(durations[int(0.95 * (len(durations) - 1))], 4),
+        "mean_ms": round(statistics.fmean(durations), 4),
+    }
+
+
+def benchmark_engine(engine, iterations=50, seed=7):
+    """Chronomètre les chemins critiques du moteur sur une charge de requêtes fixe.
+
+    get_recommendations mesure le calcul (moteur créé avec cache_size=0) ; get_recommendations_cached
+    mesure le même appel servi par un cache de recommandations préchauffé.
+    """
+    rng = random.Random(seed)
+    groups = list(engine.catalog)
+    queries = []
+    for _ in range(iterations):
+        group = rng.choice(groups)
+        other = rng.choice(engine.catalog.find(group.niveau, rng.choice(SUBJECTS)) or [group])
+        queries.append((group, other))
+
+    def forfaits_info(group):
+        return {group.matiere: engine.get_available_forfaits(group.niveau, group.matiere)}
+
+    def recommendations(i):
+        group, _ = queries[i]
+        engine.get_recommendations("Élève test", group.niveau, group.matiere, "", "École 1", group.centre,
+                                   {group.matiere: group.id_forfait}, {group.matiere: group.type_duree_id},
+                                   forfaits_info(group))
+
+    def tariffs(i):
+        group, other = queries[i]
+        selected = {group.matiere: group.id_cours}
+        info = forfaits_info(group)
+        type_ids = {group.matiere: group.type_duree_id}
+        if other.matiere != group.matiere:
+            selected[other.matiere] = other.id_cours
+            info.update(forfaits_info(other))
+            type_ids[other.matiere] = other.type_duree_id
+        engine.calculate_tariffs(selected, {subject: "Période" for subject in selected}, type_ids, info)
+
+    def cached_recommendations():
+        # Cache temporaire préchauffé sur la même charge, puis cache d'origine restauré
+        cache = engine.recommendation_cache
+        engine.recommendation_cache = RecommendationCache()
+        try:
+            for i in range(iterations):
+                recommendations(i)
+            return time_call(recommendations, iterations)
+        finally:
+            engine.recommendation_cache = cache
+
+    return {
+        "get_available_forfaits": time_call(lambda i: engine.get_available_forfaits(queries[i][0].niveau, queries[i][0].matiere), iterations),
+        "get_recommendations": time_call(recommendations, iterations),
+        "get_recommendations_cached": cached_recommendations(),
+        "get_remaining_sessions": time_call(lambda i: engine.get_remaining_sessions(queries[i][0].id_cours), iterations),
+        "calculate_tariffs": time_call(tariffs, iterations),
+        "check_overlaps": time_call(lambda i: engine.check_overlaps({"a": queries[i][0].id_cours, "b": queries[i][1].id_cours}), iterations),
+        "match_value": time_call(lambda i: match_value(queries[i][0].matiere.lower()[:-1], engine.subjects_list), iterations),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=current_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "inconnu"
+
+
+def compare(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """Lignes de comparaison des p50 et liste des régressions"""
+    lines = []
+    regressions = []
+    for size, results in current["results"].items():
+        for name, stats in results.get("functions", {}).items():
+            base = baseline.get("results", {}).get(size, {}).get("functions", {}).get(name)
+            if not base or not base["p50_ms"]:
+                continue
+            ratio = stats["p50_ms"] / base["p50_ms"]
+            marker = ""
+            if ratio > 1 + threshold:
+                marker = "  <-- régression"
+                regressions.append(f"{name}@{size}")
+            lines.append(f"{size:>8} {name:<28} {base['p50_ms']:>10.3f} -> {stats['p50_ms']:>10.3f} ms  x{ratio:.2f}{marker}")
+    return lines, regressions
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Benchmarks du moteur de recommandation sur catalogues synthétiques (hors ligne)")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Tailles de catalogue (nombre de groupes et de séances)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--directory", default=DEFAULT_BENCH_DIR, help="Répertoire des bases ChromaDB synthétiques et des résultats")
+    parser.add_argument("--output", help="Fichier JSON de résultats (défaut : <directory>/results/<commit>.json)")
+    parser.add_argument("--compare", help="Fichier JSON de référence (ex. résultats d'un commit précédent)")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    commit = git_commit()
+    report = {"commit": commit, "python": platform.python_version(), "reference_date": REFERENCE_DATE.strftime("%Y/%m/%d"),
+              "iterations": args.iterations, "results": {}}
+    for size in (int(value) for value in args.sizes.split(",")):
+        chroma_path = os.path.join(args.directory, f"chroma_{size}")
+        client = chromadb.PersistentClient(path=chroma_path)
+        start = time.perf_counter()
+        created = build_catalog(client, size)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # Alias résolus via le manifeste du répertoire de benchmarks (jamais publié : noms synthétiques tels quels),
+        # pas via celui de chroma_db5 ; sans cache de recommandations pour mesurer le calcul
+        engine = RecommendationEngine(chroma_path=chroma_path, client=client, snapshot_dir=None, tariff_matrix_path=None,
+                                      cache_size=0)
+        load_s = time.perf_counter() - start
+
+        functions = benchmark_engine(engine, args.iterations)
+        report["results"][str(size)] = {"catalog_built": created, "build_s": round(build_s, 2),
+                                        "engine_load_s": round(load_s, 3), "functions": functions}
+        print(f"--- {size} groupes (chargement {load_s:.2f} s)")
+        for name, stats in functions.items():
+            print(f"    {name:<28} p50 {stats['p50_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms")
+
+    output = args.output or os.path.join(args.directory, "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Résultats enregistrés dans {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        lines, regressions = compare(report, baseline, args.threshold)
+        print(f"Comparaison avec {baseline.get('commit', args.compare)} :")
+        print("\n".join(lines))
+        if regressions:
+            print(f"Régressions : {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000   # si le client n'expose pas sa taille maximale
+WORKERS = 4
+RETRIES = 3
+RETRY_BACKOFF = 0.5         # secondes, doublées à chaque nouvelle tentative
+
+
+class BulkWriteError(Exception):
+    pass
+
+
+def max_batch_size(client, default=DEFAULT_BATCH_SIZE):
+    """Taille de lot maximale acceptée par le client ChromaDB (dépend de la version de SQLite)"""
+    for attribute in ("get_max_batch_size", "max_batch_size"):
+        value = getattr(client, attribute, None)
+        try:
+            value = value() if callable(value) else value
+        except Exception:
+            continue
+        if isinstance(value, int) and value > 0:
+            return value
+    return default
+
+
+def fetch_batches(cursor, size):
+    """Lots de lignes d'un curseur psycopg2 (fetchmany)"""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+def slice_batches(rows, size):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+class BulkWriter:
+    """Écriture en lots parallèles dans une collection ChromaDB.
+
+    Le thread appelant lit les lots de la source (curseur, liste) ; chaque lot est transformé
+    (documents, métadonnées, embeddings) puis écrit par un pool de threads. Le nombre de lots
+    en cours est borné (contre-pression sur la lecture) et un lot en échec est retenté avec
+    un délai croissant avant d'être compté comme perdu.
+    """
+
+    def __init__(self, collection, client=None, batch_size=None, workers=WORKERS, max_pending=None,
+                 retries=RETRIES, backoff=RETRY_BACKOFF, method="upsert"):
+        limit = max_batch_size(client) if client is not None else DEFAULT_BATCH_SIZE
+        self.collection = collection
+        self.batch_size = min(batch_size, limit) if batch_size else limit
+        self.workers = workers
+        self.max_pending = max_pending or workers * 2
+        self.retries = retries
+        self.backoff = backoff
+        self.method = method
+        self._lock = threading.Lock()
+
+    def _write_batch(self, rows, build, stats):
+        for attempt in range(self.retries + 1):
+            try:
+                # Transformation rejouée avec l'écriture (échec transitoire du service d'embeddings)
+                batch = build(rows)
+                ids = batch["ids"]
+                # Sous-lots si la transformation a produit plus d'éléments que la limite du client
+                for start in range(0, len(ids), self.batch_size):
+                    getattr(self.collection, self.method)(**{key: values[start:start + self.batch_size]
+                                                             for key, values in batch.items() if values is not None})
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"Lot de {len(rows)} lignes en échec ({str(e)}), nouvel essai dans {delay:.1f} s")
+                time.sleep(delay)
+        with self._lock:
+            stats["rows"] += len(ids)
+            stats["batches"] += 1
+
+    def write(self, batches, build):
+        """Écrit chaque lot de la source ; build(rows) -> {ids, metadatas, documents[, embeddings]}.
+
+        Retourne les statistiques {rows, batches, failed, seconds, rows_per_s} ; lève BulkWriteError
+        si des lots sont perdus après toutes les tentatives.
+        """
+        stats = {"rows": 0, "batches": 0, "failed": 0}
+        slots = threading.BoundedSemaphore(self.max_pending)
+        errors = []
+
+        def done(future):
+            slots.release()
+            error = future.exception()
+            if error is not None:
+                with self._lock:
+                    stats["failed"] += 1
+                    errors.append(error)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk") as pool:
+            for rows in batches:
+                slots.acquire()
+                pool.submit(self._write_batch, rows, build, stats).add_done_callback(done)
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        stats["rows_per_s"] = round(stats["rows"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        print(f"{self.collection.name} : {stats['rows']} éléments en {stats['batches']} lots de {self.batch_size} max, "
+              f"{stats['seconds']} s ({stats['rows_per_s']} éléments/s)")
+        if errors:
+            raise BulkWriteError(f"{stats['failed']} lot(s) perdu(s) dans {self.collection.name} : {errors[0]}")
+        return stats
@@ -0,0 +1,209 @@
+import logging
+import math
+import sys
+from array import array
+
+from metadata_schema import normalize_key, read_group_metadata
+
+logger = logging.getLogger(__name__)
+
+# Clés de métadonnées obligatoires pour qu'un groupe soit retenu dans le catalogue
+REQUIRED_KEYS = ['id_cours', 'name_cours', 'id_forfait', 'type_duree_id', 'centre', 'heure_debut', 'heure_fin', 'jour', 'matiere', 'niveau', 'nom_forfait']
+
+# Champs texte d'un groupe et valeur par défaut si absente
+TEXT_FIELDS = {
+    'id_cours': '',
+    'name_cours': '',
+    'id_forfait': '',
+    'nom_forfait': '',
+    'type_duree_id': '',
+    'centre': '',
+    'teacher': 'N/A',
+    'niveau': '',
+    'matiere': '',
+    'jour': '',
+    'heure_debut': '',
+    'heure_fin': '',
+    'date_debut': 'N/A',
+    'date_fin': 'N/A',
+    'ecole': 'Inconnu',
+    'student': '',
+    'duree_tarifs': '',
+}
+
+# Champs à faible cardinalité : une seule copie de chaque valeur en mémoire
+INTERNED_FIELDS = ('id_forfait', 'nom_forfait', 'type_duree_id', 'centre', 'teacher', 'niveau', 'matiere',
+                   'jour', 'heure_debut', 'heure_fin', 'date_debut', 'date_fin')
+
+# Champs numériques stockés en colonnes
+NUMERIC_FIELDS = ('num_students', 'tarif_unitaire', 'start_minutes', 'end_minutes')
+
+
+class GroupRecord:
+    """Groupe du catalogue : champs texte en slots (valeurs internées), champs numériques lus dans les colonnes.
+
+    Les clés normalisées, les écoles par élève et les tarifs du forfait sont décodés au chargement :
+    les requêtes ne reparsent plus les métadonnées. Supporte aussi l'accès par clé (group['centre']) pour rester compatible avec le code qui manipule des dicts.
+    """
+
+    __slots__ = tuple(TEXT_FIELDS) + ('niveau_key', 'matiere_key', 'centre_key', 'schools', 'tarifs', 'row', 'catalog')
+
+    def __init__(self, catalog, row, metadata, schools=(), tarifs=()):
+        self.catalog = catalog
+        self.row = row
+        for field, default in TEXT_FIELDS.items():
+            value = str(metadata.get(field, default))
+            setattr(self, field, sys.intern(value) if field in INTERNED_FIELDS else value)
+        # Clés pré-normalisées du schéma 2, calculées ici pour les métadonnées plus anciennes
+        self.niveau_key = sys.intern(metadata.get('niveau_key') or normalize_key(self.niveau))
+        self.matiere_key = sys.intern(metadata.get('matiere_key') or normalize_key(self.matiere))
+        self.centre_key = sys.intern(metadata.get('centre_key') or normalize_key(self.centre))
+        self.schools = tuple(sys.intern(school) for school in schools)
+        self.tarifs = tuple(tarifs)
+        if self.tarifs:
+            # Durée par défaut du groupe : première durée de son forfait (identifiant de la matrice tarifaire)
+            self.type_duree_id = sys.intern(self.tarifs[0][0])
+
+    @property
+    def num_students(self):
+        return self.catalog.num_students[self.row]
+
+    @property
+    def tarif_unitaire(self):
+        value = self.catalog.tarif_unitaire[self.row]
+        return None if math.isnan(value) else value
+
+    @property
+    def start_minutes(self):
+        return self.catalog.start_minutes[self.row]
+
+    @property
+    def end_minutes(self):
+        return self.catalog.end_minutes[self.row]
+
+    def __getitem__(self, key):
+        if key in TEXT_FIELDS or key in NUMERIC_FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def as_dict(self):
+        data = {field: getattr(self, field) for field in TEXT_FIELDS}
+        data.update({field: getattr(self, field) for field in NUMERIC_FIELDS})
+        return data
+
+    def __repr__(self):
+        return f"GroupRecord({self.id_cours!r}, {self.matiere!r}, {self.centre!r})"
+
+
+class GroupCatalog:
+    """Catalogue compact des groupes : enregistrements à slots + colonnes numériques (array)."""
+
+    def __init__(self, metadatas=()):
+        self.records = []
+        self.index = {}
+        self.by_level_subject = {}
+        self.num_students = array('i')
+        self.tarif_unitaire = array('d')
+        self.start_minutes = array('h')
+        self.end_minutes = array('h')
+        self.rejected = 0
+
+        for metadata in metadatas:
+            missing_keys = [key for key in REQUIRED_KEYS if key not in metadata]
+            if missing_keys:
+                logger.error(f"Invalid group (id_cours: {metadata.get('id_cours', 'unknown')}): Missing required keys: {missing_keys}")
+                self.rejected += 1
+                continue
+            if metadata['id_cours'] in self.index:
+                continue
+
+            num_students, tarif, start_minutes, end_minutes, schools, tarifs = read_group_metadata(metadata)
+            self.num_students.append(num_students)
+            self.tarif_unitaire.append(tarif if tarif is not None else math.nan)
+            self.start_minutes.append(start_minutes)
+            self.end_minutes.append(end_minutes)
+
+            self._add(GroupRecord(self, len(self.records), metadata, schools, tarifs))
+
+    @classmethod
+    def from_columns(cls, text_columns, numeric_columns, schools=None, tarifs=None):
+        """Catalogue reconstruit à partir de colonnes (ex. snapshot mappé en mémoire).
+
+        Les colonnes numériques sont utilisées telles quelles (memoryview possible, sans copie) ;
+        schools et tarifs donnent, par ligne, les écoles par élève et les tarifs déjà décodés.
+        """
+        catalog = cls()
+        for field in NUMERIC_FIELDS:
+            setattr(catalog, field, numeric_columns[field])
+        fields = list(text_columns)
+        for row, values in enumerate(zip(*(text_columns[field] for field in fields))):
+            catalog._add(GroupRecord(catalog, row, dict(zip(fields, values)),
+                                     schools[row] if schools else (), tarifs[row] if tarifs else ()))
+        return catalog
+
+    def _add(self, record):
+        self.records.append(record)
+        self.index[record.id_cours] = record.row
+        self.by_level_subject.setdefault((record.niveau_key, record.matiere_key), []).append(record.row)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def get(self, id_cours):
+        row = self.index.get(str(id_cours))
+        return self.records[row] if row is not None else None
+
+    def find(self, niveau, matiere):
+        """Groupes d'un niveau et d'une matière (comparaison insensible à la casse, aux accents et aux espaces)"""
+        rows = self.by_level_subject.get((normalize_key(niveau), normalize_key(matiere)), [])
+        return [self.records[row] for row in rows]
+
+
+def build_forfait_tree(catalog, tariff_matrix=None):
+    """Forfaits disponibles par niveau puis matière (clés normalisées), avec leurs types de durée.
+
+    Avec une matrice tarifaire, toutes les durées proposées pour le forfait ; sinon celles portées par les groupes.
+    """
+    tree = {}
+    for group in catalog:
+        id_forfait = group.id_forfait
+        if not id_forfait:
+            continue
+        forfaits = tree.setdefault(group.niveau_key, {}).setdefault(group.matiere_key, {})
+        if id_forfait not in forfaits:
+            forfaits[id_forfait] = {'name': group.nom_forfait or 'Forfait inconnu', 'types_duree': {}}
+            if tariff_matrix is not None:
+                forfaits[id_forfait]['types_duree'] = {type_duree_id: dict(entry) for type_duree_id, entry
+                                                       in tariff_matrix.durations(id_forfait).items()}
+        if tariff_matrix is not None:
+            continue
+        for type_duree_id, type_duree, tarif in group.tarifs:
+            forfaits[id_forfait]['types_duree'][type_duree_id] = {'name': type_duree, 'tarif_unitaire': tarif}
+    return tree
+
+
+def build_vocabularies(catalog):
+    """Listes de référence (écoles, niveaux, matières, centres, professeurs) triées"""
+    schools, levels, subjects, centers, teachers = set(), set(), set(), set(), set()
+    for group in catalog:
+        schools.add(group.ecole.split(", ")[0])
+        levels.add(group.niveau)
+        subjects.add(group.matiere)
+        centers.add(group.centre)
+        teachers.add(group.teacher)
+    return {
+        "schools_list": sorted(schools),
+        "levels_list": sorted(levels),
+        "subjects_list": sorted(subjects),
+        "centers_list": sorted(centers),
+        "teachers_list": sorted(teachers),
+    }
@@ -0,0 +1,273 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+from array import array
+from datetime import datetime
+
+from catalog import GroupCatalog, TEXT_FIELDS, NUMERIC_FIELDS, build_forfait_tree, build_vocabularies
+from collection_aliases import resolve_collection
+from tariff_matrix import DEFAULT_TARIFF_MATRIX_PATH, TariffMatrix
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_SNAPSHOT_DIR = os.path.join(parent_dir, "catalog_snapshots")
+CURRENT_FILE = "CURRENT"
+KEEP_SNAPSHOTS = 3
+
+# Format : MAGIC | longueur de l'en-tête (uint32) | en-tête JSON | sections binaires alignées sur 8 octets
+MAGIC = b"CMCATSNP"
+FORMAT_VERSION = 2  # 2 : écoles par élève et tarifs décodés (schéma de métadonnées 2)
+ALIGNMENT = 8
+
+# Type des colonnes numériques (codes du module array)
+NUMERIC_TYPECODES = {"num_students": "i", "tarif_unitaire": "d", "start_minutes": "h", "end_minutes": "h"}
+
+
+def _parse_date(date_str):
+    return datetime.strptime(date_str, "%Y/%m/%d").toordinal()
+
+
+def write_snapshot(path, group_metadatas, seance_metadatas, combinaison_metadatas, version, tariff_matrix=None):
+    """Écrit le modèle de lecture (groupes, séances, combinaisons, vocabulaires, forfaits) dans un fichier mappable"""
+    catalog = GroupCatalog(group_metadatas)
+
+    # Table de chaînes partagée : chaque valeur distincte n'est stockée qu'une fois
+    string_ids = {}
+    string_data = bytearray()
+    string_offsets = array('I', [0])
+
+    def string_id(value):
+        if value not in string_ids:
+            string_ids[value] = len(string_ids)
+            string_data.extend(value.encode("utf-8"))
+            string_offsets.append(len(string_data))
+        return string_ids[value]
+
+    sections = {}
+    for field in TEXT_FIELDS:
+        sections[f"group_{field}"] = array('I', (string_id(getattr(group, field)) for group in catalog))
+    for field in NUMERIC_FIELDS:
+        column = getattr(catalog, field)
+        sections[f"group_{field}"] = array(NUMERIC_TYPECODES[field], column)
+
+    # Écoles par élève et tarifs du forfait de chaque groupe (format CSR : bornes par groupe, valeurs)
+    school_offsets, school_ids = array('I', [0]), array('I')
+    tarif_offsets, tarif_ids, tarif_names, tarif_values = array('I', [0]), array('I'), array('I'), array('d')
+    for group in catalog:
+        school_ids.extend(string_id(school) for school in group.schools)
+        school_offsets.append(len(school_ids))
+        for type_duree_id, type_duree, tarif in group.tarifs:
+            tarif_ids.append(string_id(type_duree_id))
+            tarif_names.append(string_id(type_duree))
+            tarif_values.append(tarif)
+        tarif_offsets.append(len(tarif_values))
+    sections.update(group_school_offsets=school_offsets, group_schools=school_ids, group_tarif_offsets=tarif_offsets,
+                    group_tarif_ids=tarif_ids, group_tarif_names=tarif_names, group_tarif_values=tarif_values)
+
+    # Dates de séances par cours (format CSR : cours, bornes, dates ordinales triées)
+    dates_by_course = {}
+    for metadata in seance_metadatas:
+        try:
+            dates_by_course.setdefault(str(metadata['id_cours']), []).append(_parse_date(metadata['date_seance']))
+        except (KeyError, ValueError, TypeError):
+            continue
+    session_courses = array('I')
+    session_offsets = array('I', [0])
+    session_dates = array('i')
+    for id_cours in sorted(dates_by_course):
+        session_courses.append(string_id(id_cours))
+        session_dates.extend(sorted(dates_by_course[id_cours]))
+        session_offsets.append(len(session_dates))
+    sections.update(session_courses=session_courses, session_offsets=session_offsets, session_dates=session_dates)
+    sections["string_offsets"] = string_offsets
+
+    combinaisons = {}
+    for metadata in combinaison_metadatas:
+        combinaisons.setdefault(metadata['id_combinaison'], []).append(
+            (str(metadata['id_forfait']), float(metadata['reduction']))
+        )
+
+    header = {
+        "format": FORMAT_VERSION,
+        "version": version,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "group_count": len(catalog),
+        "rejected_groups": catalog.rejected,
+        "vocabularies": build_vocabularies(catalog),
+        "forfaits": build_forfait_tree(catalog, tariff_matrix),
+        "combinaisons": combinaisons,
+        "sections": {},
+    }
+
+    # Calcul des positions : l'en-tête contient les offsets, on itère jusqu'à stabilité de sa taille
+    blobs = [(name, column.typecode, column.tobytes()) for name, column in sections.items()]
+    blobs.append(("string_data", "B", bytes(string_data)))
+    header_size = 0
+    while True:
+        offset = _align(len(MAGIC) + 4 + header_size)
+        for name, typecode, blob in blobs:
+            header["sections"][name] = {"offset": offset, "length": len(blob), "typecode": typecode}
+            offset = _align(offset + len(blob))
+        encoded = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        if len(encoded) == header_size:
+            break
+        header_size = len(encoded)
+
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(encoded)) + encoded)
+        for name, _, blob in blobs:
+            f.write(b"\0" * (header["sections"][name]["offset"] - f.tell()))
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    return header
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class CatalogSnapshot:
+    """Snapshot du catalogue mappé en mémoire (lecture seule, pages partagées entre processus)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"Fichier snapshot invalide : {path}")
+        (header_size,) = struct.unpack_from("<I", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[start:start + header_size].decode("utf-8"))
+        if self.header["format"] != FORMAT_VERSION:
+            raise ValueError(f"Format de snapshot non supporté : {self.header['format']}")
+        self.version = self.header["version"]
+        self._buffer = memoryview(self._mmap)
+        self._strings = None
+
+    def column(self, name):
+        section = self.header["sections"][name]
+        view = self._buffer[section["offset"]:section["offset"] + section["length"]]
+        return view.cast(section["typecode"]) if section["typecode"] != "B" else view
+
+    def strings(self):
+        """Table de chaînes décodée (une seule fois par processus)"""
+        if self._strings is None:
+            offsets = self.column("string_offsets")
+            data = self.column("string_data")
+            self._strings = [str(data[offsets[i]:offsets[i + 1]], "utf-8") for i in range(len(offsets) - 1)]
+        return self._strings
+
+    def catalog(self):
+        strings = self.strings()
+        text_columns = {field: [strings[i] for i in self.column(f"group_{field}")] for field in TEXT_FIELDS}
+        numeric_columns = {field: self.column(f"group_{field}") for field in NUMERIC_FIELDS}
+        offsets, ids = self.column("group_school_offsets"), self.column("group_schools")
+        schools = [[strings[i] for i in ids[offsets[row]:offsets[row + 1]]] for row in range(len(offsets) - 1)]
+        offsets = self.column("group_tarif_offsets")
+        tarif_ids, names, values = self.column("group_tarif_ids"), self.column("group_tarif_names"), self.column("group_tarif_values")
+        tarifs = [[(strings[tarif_ids[i]], strings[names[i]], values[i]) for i in range(offsets[row], offsets[row + 1])]
+                  for row in range(len(offsets) - 1)]
+        return GroupCatalog.from_columns(text_columns, numeric_columns, schools, tarifs)
+
+    def sessions_by_course(self):
+        """id_cours -> dates ordinales triées (vues sur le fichier, sans copie)"""
+        strings = self.strings()
+        offsets = self.column("session_offsets")
+        dates = self.column("session_dates")
+        return {strings[course]: dates[offsets[i]:offsets[i + 1]] for i, course in enumerate(self.column("session_courses"))}
+
+    def combinaisons(self):
+        return {id_combinaison: [tuple(pair) for pair in pairs] for id_combinaison, pairs in self.header["combinaisons"].items()}
+
+
+def current_snapshot_path(directory=DEFAULT_SNAPSHOT_DIR):
+    """Chemin du snapshot publié, ou None s'il n'y en a pas"""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(directory, name)
+    return path if name and os.path.exists(path) else None
+
+
+def load_current_snapshot(directory=DEFAULT_SNAPSHOT_DIR):
+    path = current_snapshot_path(directory)
+    if not path:
+        return None
+    try:
+        return CatalogSnapshot(path)
+    except ValueError as e:
+        # Snapshot d'un format antérieur : lecture depuis ChromaDB jusqu'à la prochaine publication
+        logger.warning(f"Snapshot ignoré ({str(e)})")
+        return None
+
+
+def _snapshot_number(name):
+    return int(name[len("catalog-v"):-len(".bin")])
+
+
+def publish_snapshot(client, directory=DEFAULT_SNAPSHOT_DIR, groups_collection="groupes_vectorises9",
+                     seances_collection="seances_vectorises", combinaisons_collection="combinaisons_vectorises", chroma_path=None,
+                     tariff_matrix_path=DEFAULT_TARIFF_MATRIX_PATH):
+    """Lit les collections ChromaDB et publie une nouvelle version du snapshot (bascule atomique de CURRENT).
+
+    Avec chroma_path, les noms sont des alias résolus via le manifeste des collections publiées ;
+    si la matrice tarifaire publiée par l'ingestion existe, l'arbre des forfaits liste toutes ses durées.
+    """
+    if chroma_path:
+        groups_collection = resolve_collection(groups_collection, chroma_path)
+        seances_collection = resolve_collection(seances_collection, chroma_path)
+        combinaisons_collection = resolve_collection(combinaisons_collection, chroma_path)
+    os.makedirs(directory, exist_ok=True)
+    current = current_snapshot_path(directory)
+    version = _snapshot_number(os.path.basename(current)) + 1 if current else 1
+
+    group_metadatas = client.get_collection(name=groups_collection).get(include=["metadatas"])['metadatas']
+    seance_metadatas = client.get_or_create_collection(name=seances_collection).get(include=["metadatas"])['metadatas']
+    combinaison_metadatas = client.get_or_create_collection(name=combinaisons_collection).get(include=["metadatas"])['metadatas']
+
+    tariff_matrix = TariffMatrix.load(tariff_matrix_path) if tariff_matrix_path and os.path.exists(tariff_matrix_path) else None
+
+    name = f"catalog-v{version}.bin"
+    header = write_snapshot(os.path.join(directory, name), group_metadatas, seance_metadatas, combinaison_metadatas, version,
+                            tariff_matrix)
+
+    temp_current = os.path.join(directory, f"{CURRENT_FILE}.tmp")
+    with open(temp_current, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(temp_current, os.path.join(directory, CURRENT_FILE))
+
+    # Les processus qui mappent encore un ancien fichier le gardent ouvert : on ne supprime que les plus anciens
+    snapshots = sorted((entry for entry in os.listdir(directory) if entry.startswith("catalog-v") and entry.endswith(".bin")),
+                       key=_snapshot_number)
+    for old in snapshots[:-KEEP_SNAPSHOTS]:
+        os.remove(os.path.join(directory, old))
+
+    print(f"Snapshot du catalogue publié : {name} ({header['group_count']} groupes)")
+    return os.path.join(directory, name)
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Publie un snapshot mappable du catalogue à partir de chroma_db5")
+    parser.add_argument("--chroma-path", default=os.path.join(parent_dir, "chroma_db5"))
+    parser.add_argument("--directory", default=DEFAULT_SNAPSHOT_DIR)
+    parser.add_argument("--tariff-matrix", default=DEFAULT_TARIFF_MATRIX_PATH)
+    args = parser.parse_args()
+
+    publish_snapshot(chromadb.PersistentClient(path=args.chroma_path), args.directory, chroma_path=args.chroma_path,
+                     tariff_matrix_path=args.tariff_matrix)
+
+
+if __name__ == "__main__":
+    main()
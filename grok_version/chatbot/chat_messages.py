@@ -0,0 +1,82 @@
+import hashlib
+import html as html_lib
+import re
+
+TAG_RE = re.compile(r"<[^>]+>")
+WORD_RE = re.compile(r"\w+")
+
+# Paramètres par défaut de la détection de redondance
+DEFAULT_WINDOW = 5          # nombre de derniers messages comparés
+DEFAULT_SHINGLE_SIZE = 3    # nombre de mots par shingle
+DEFAULT_NEAR_THRESHOLD = 0.9  # similarité de Jaccard conseillée pour la détection des quasi-doublons
+
+
+def normalize_text(html):
+    """Texte brut normalisé d'un message HTML (balises retirées, entités décodées, espaces uniformisés).
+
+    La casse est conservée : deux messages qui ne diffèrent que par la casse ne sont pas des doublons.
+    """
+    return " ".join(html_lib.unescape(TAG_RE.sub(" ", html)).split())
+
+
+def shingles(text, size=DEFAULT_SHINGLE_SIZE):
+    """Ensemble des séquences de `size` mots consécutifs du texte."""
+    words = WORD_RE.findall(text)
+    if len(words) <= size:
+        return frozenset([" ".join(words)]) if words else frozenset()
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+class ChatMessage(tuple):
+    """Message du chat : se comporte comme le tuple (html, is_bot) et porte son empreinte précalculée."""
+
+    def __new__(cls, html, is_bot, shingle_size=DEFAULT_SHINGLE_SIZE):
+        message = super().__new__(cls, (html, is_bot))
+        message.text = normalize_text(html)
+        message.fingerprint = hashlib.blake2b(message.text.encode("utf-8"), digest_size=16).digest()
+        message.shingle_size = shingle_size
+        message.shingles = shingles(message.text, shingle_size)
+        return message
+
+    def __reduce__(self):
+        # Sérialisation (pickle/copy) : recalculer l'empreinte à partir du tuple
+        return (ChatMessage, (self[0], self[1], self.shingle_size))
+
+    @property
+    def html(self):
+        return self[0]
+
+    @property
+    def is_bot(self):
+        return self[1]
+
+
+def as_chat_message(message, shingle_size=DEFAULT_SHINGLE_SIZE):
+    """Convertit un tuple (html, is_bot) ou un texte brut en ChatMessage (sans recalcul si déjà converti)."""
+    if isinstance(message, ChatMessage) and message.shingle_size == shingle_size:
+        return message
+    if isinstance(message, str):
+        return ChatMessage(message, True, shingle_size)
+    html, is_bot = message
+    return ChatMessage(html, is_bot, shingle_size)
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_redundant(messages, new_message, window=DEFAULT_WINDOW, near_threshold=None,
+                 shingle_size=DEFAULT_SHINGLE_SIZE):
+    """Vrai si new_message est identique (empreinte) à l'un des `window` derniers messages.
+
+    Avec near_threshold (ex. DEFAULT_NEAR_THRESHOLD), les quasi-doublons (Jaccard sur les shingles) sont aussi détectés.
+    """
+    candidate = as_chat_message(new_message, shingle_size)
+    recent = [as_chat_message(message, shingle_size) for message in messages[-window:]] if window > 0 else []
+    if candidate.fingerprint in {message.fingerprint for message in recent}:
+        return True
+    if near_threshold is not None and near_threshold < 1:
+        return any(jaccard(candidate.shingles, message.shingles) >= near_threshold for message in recent)
+    return False
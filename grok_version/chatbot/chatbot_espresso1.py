@@ -2,13 +2,13 @@ import streamlit as st
 import json
 import chromadb
 from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
 import random
 import re
 import logging
+from collection_aliases import AliasedCollection
 
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
@@ -35,10 +35,10 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 
 # Définition de la structure attendue pour un groupe
 GROUP_STRUCTURE = {
@@ -90,13 +90,12 @@ all_groups = collection_groupes.get(include=["metadatas"])
 available_levels = set(metadata.get('niveau', '').strip().lower() for metadata in all_groups['metadatas'])
 available_subjects = set(metadata.get('matiere', '').strip().lower() for metadata in all_groups['metadatas'])
 
-# Fonction pour charger le modèle SentenceTransformer
+# Fonction pour charger le modèle SentenceTransformer à la demande (torch n'est importé qu'au premier appel)
 @st.cache_resource
 def load_model():
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer('all-MiniLM-L6-v2')
 
-model = load_model()
-
 # Récupérer les valeurs uniques depuis ChromaDB
 schools = set()
 levels = set()
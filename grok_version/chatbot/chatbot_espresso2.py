@@ -2,14 +2,14 @@ import streamlit as st
 import json
 import chromadb
 from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
 import random
 import re
 import logging
-from bs4 import BeautifulSoup
+from chat_messages import ChatMessage, as_chat_message, is_redundant
+from collection_aliases import AliasedCollection
 
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,10 +36,10 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 
 # Définition de la structure attendue pour un groupe
 GROUP_STRUCTURE = {
@@ -89,13 +89,12 @@ all_groups = collection_groupes.get(include=["metadatas"])
 available_levels = set(metadata.get('niveau', '').strip().lower() for metadata in all_groups['metadatas'])
 available_subjects = set(metadata.get('matiere', '').strip().lower() for metadata in all_groups['metadatas'])
 
-# Fonction pour charger le modèle SentenceTransformer
+# Fonction pour charger le modèle SentenceTransformer à la demande (torch n'est importé qu'au premier appel)
 @st.cache_resource
 def load_model():
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer('all-MiniLM-L6-v2')
 
-model = load_model()
-
 # Récupérer les valeurs uniques depuis ChromaDB
 schools = set()
 levels = set()
@@ -506,18 +505,16 @@ def get_recommendations(student_name, user_level, user_subjects, user_teachers,
     output.append(f"Recommandations générées pour l'étudiant {student_name}.")
     return output, all_recommendations, all_groups_for_selection, matched_subjects
 
+# Détection des messages redondants : fenêtre des derniers messages et seuil de quasi-doublon (None = identiques seulement)
+REDUNDANCY_WINDOW = 5
+NEAR_DUPLICATE_THRESHOLD = None
+
 def filter_redundant_messages(messages, new_message):
-    """Filtre les messages redondants en comparant le contenu HTML"""
-    def clean_html(html):
-        soup = BeautifulSoup(html, 'html.parser')
-        return ' '.join(soup.get_text().split())
-
-    new_cleaned = clean_html(new_message)
-    for msg, _ in messages[-5:]:
-        msg_cleaned = clean_html(msg)
-        if new_cleaned == msg_cleaned:
-            logger.debug(f"Message redondant détecté : {new_cleaned}")
-            return False
+    """Filtre les messages redondants en comparant les empreintes précalculées du texte"""
+    candidate = as_chat_message(new_message)
+    if is_redundant(messages, candidate, window=REDUNDANCY_WINDOW, near_threshold=NEAR_DUPLICATE_THRESHOLD):
+        logger.debug(f"Message redondant détecté : {candidate.text}")
+        return False
     return True
 
 # Styles CSS
@@ -704,10 +701,10 @@ def handle_input_submission(step, response_text):
             st.session_state.step = llm_response["next_step"]
             st.session_state.responses.update(llm_response["data"])
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='user-message'>{response_text}</div>", False))
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='user-message'>{response_text}</div>", False))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
             if llm_response["error"]:
-                st.session_state.messages.append((f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
             return
 
     for pattern, target_step in return_patterns:
@@ -717,10 +714,10 @@ def handle_input_submission(step, response_text):
             st.session_state.step = llm_response["next_step"]
             st.session_state.responses.update(llm_response["data"])
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='user-message'>{response_text}</div>", False))
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='user-message'>{response_text}</div>", False))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
             if llm_response["error"]:
-                st.session_state.messages.append((f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
             return
 
     # Traitement des étapes
@@ -1042,10 +1039,10 @@ def handle_input_submission(step, response_text):
     
     # Ajouter les messages filtrés
     if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-        st.session_state.messages.append((f"<div class='user-message'>{response_text}</div>", False))
-        st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+        st.session_state.messages.append(ChatMessage(f"<div class='user-message'>{response_text}</div>", False))
+        st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
         if llm_response["error"]:
-            st.session_state.messages.append((f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
+            st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>Erreur : {llm_response['error']}</div>", True))
 
     # Gestion des étapes spécifiques
     if llm_response["step"] == 5 and "course_choices" in llm_response["data"]:
@@ -1069,13 +1066,13 @@ def handle_input_submission(step, response_text):
             st.session_state.step = llm_response["next_step"]
             st.session_state.responses.update(llm_response["data"])
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
         else:
             system_data = {"action": "no_group_subjects", "indiv_subjects": indiv_subjects}
             llm_response = process_with_llm("", 15, st.session_state, lists, system_data)
             st.session_state.step = llm_response["next_step"]
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
 
     elif llm_response["step"] == 6 and "forfait_selections" in llm_response["data"]:
         st.session_state.selected_forfaits = llm_response["data"]["forfait_selections"]
@@ -1093,7 +1090,7 @@ def handle_input_submission(step, response_text):
         st.session_state.step = llm_response["next_step"]
         st.session_state.responses.update(llm_response["data"])
         if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-            st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+            st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
 
     elif llm_response["step"] == 7 and "type_duree_selections" in llm_response["data"]:
         st.session_state.selected_types_duree = llm_response["data"]["type_duree_selections"]
@@ -1107,14 +1104,14 @@ def handle_input_submission(step, response_text):
             llm_response = process_with_llm(response_text, 13, st.session_state, lists, system_data)
             st.session_state.step = llm_response["next_step"]
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
         elif choice in ['non', 'no']:
             st.session_state.total_with_frais = st.session_state.total_tariff_base
             system_data = {"no_frais": True, "total": st.session_state.total_tariff_base}
             llm_response = process_with_llm(response_text, 13, st.session_state, lists, system_data)
             st.session_state.step = llm_response["next_step"]
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
 
     elif llm_response["step"] == 15 and "new_case_choice" in llm_response["data"]:
         choice = llm_response["data"]["new_case_choice"]
@@ -1132,13 +1129,13 @@ def handle_input_submission(step, response_text):
             st.session_state.selected_types_duree = {}
             st.session_state.reduction_percentage = 0
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
         elif choice in ['non', 'no']:
             system_data = {"action": "end_conversation"}
             llm_response = process_with_llm(response_text, 0, st.session_state, lists, system_data)
             st.session_state.step = llm_response["next_step"]
             if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-                st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+                st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
 
 # Interface Streamlit
 logo_path = os.path.join(parent_dir, "images", "logo.png")
@@ -1158,7 +1155,7 @@ with st.sidebar:
     if st.button("Réinitialiser la conversation"):
         st.session_state.clear()
         st.session_state.step = 0
-        st.session_state.messages = [("<div class='bot-message'>Bonjour ! Quel est le nom de l'étudiant ?</div>", True)]
+        st.session_state.messages = [ChatMessage("<div class='bot-message'>Bonjour ! Quel est le nom de l'étudiant ?</div>", True)]
         st.session_state.responses = {}
         st.session_state.current_input = ""
         st.session_state.submitted = False
@@ -1184,7 +1181,7 @@ with st.sidebar:
 # Initialisation de l'état
 if 'step' not in st.session_state:
     st.session_state.step = 0
-    st.session_state.messages = [("<div class='bot-message'>Bonjour ! Quel est le nom de l'étudiant ?</div>", True)]
+    st.session_state.messages = [ChatMessage("<div class='bot-message'>Bonjour ! Quel est le nom de l'étudiant ?</div>", True)]
     st.session_state.responses = {}
     st.session_state.current_input = ""
     st.session_state.submitted = False
@@ -1257,7 +1254,7 @@ if st.session_state.step == 0:
     }, {"action": "start_conversation", "request": "student_name"})
     st.session_state.step = llm_response["next_step"]
     if filter_redundant_messages(st.session_state.messages, llm_response["message"]):
-        st.session_state.messages.append((f"<div class='bot-message'>{llm_response['message']}</div>", True))
+        st.session_state.messages.append(ChatMessage(f"<div class='bot-message'>{llm_response['message']}</div>", True))
     st.rerun()
 
 elif st.session_state.step in range(1, 16):
@@ -2,7 +2,6 @@ import streamlit as st
 import json
 import chromadb
 from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
@@ -10,6 +9,7 @@ import random
 import re
 import logging
 from typing import Dict, List, Tuple
+from collection_aliases import AliasedCollection
 
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
@@ -36,10 +36,10 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 students_list = collection_students.get(include=["metadatas"])
 
 # Définition de la structure attendue pour un groupe
@@ -92,13 +92,12 @@ all_groups = collection_groupes.get(include=["metadatas"])
 available_levels = set(metadata.get('niveau', '').strip().lower() for metadata in all_groups['metadatas'])
 available_subjects = set(metadata.get('matiere', '').strip().lower() for metadata in all_groups['metadatas'])
 
-# Fonction pour charger le modèle SentenceTransformer
+# Fonction pour charger le modèle SentenceTransformer à la demande (torch n'est importé qu'au premier appel)
 @st.cache_resource
 def load_model():
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer('all-MiniLM-L6-v2')
 
-model = load_model()
-
 # Récupérer les valeurs uniques depuis ChromaDB
 schools = set()
 levels = set()
@@ -2,11 +2,11 @@ import streamlit as st
 import json
 import chromadb
 from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
 import random
+from collection_aliases import AliasedCollection
 
 # Configuration initiale
 st.set_page_config(page_title="Chatbot de Recommandation de Groupes", page_icon="📚", layout="wide")
@@ -28,10 +28,10 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 
 # Vérification des collections
 if collection_groupes.count() == 0:
@@ -41,13 +41,12 @@ if collection_combinaisons.count() == 0:
     st.error("Erreur : La collection ChromaDB des combinaisons est vide. Veuillez exécuter la vectorisation des combinaisons d'abord.")
     st.stop()
 
-# Fonction pour charger le modèle SentenceTransformer
+# Fonction pour charger le modèle SentenceTransformer à la demande (torch n'est importé qu'au premier appel)
 @st.cache_resource
 def load_model():
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer('all-MiniLM-L6-v2')
 
-model = load_model()
-
 # Récupérer les valeurs uniques depuis ChromaDB
 all_groups = collection_groupes.get(include=["metadatas", "documents"])
 schools = set()
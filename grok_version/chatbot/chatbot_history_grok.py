@@ -2,13 +2,15 @@ import streamlit as st
 import json
 import chromadb
 from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
 from datetime import datetime, timedelta
 import os
 import random
 import re
 import logging
+from history_store import ConversationStore
+from history_browser import render_history_browser
+from collection_aliases import AliasedCollection
 
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
@@ -35,10 +37,31 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
+
+# Historique partagé (SQLite) : les en-têtes sont paginés, les messages chargés à la demande
+@st.cache_resource
+def load_history_store():
+    return ConversationStore(os.path.join(parent_dir, "conversation_history.db"))
+
+history_store = load_history_store()
+
+def archive_chat():
+    """Archive la discussion actuelle dans l'historique"""
+    session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    try:
+        history_store.save_conversation(
+            session_id,
+            st.session_state.responses.get("student_name", "Inconnu"),
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            st.session_state.messages,
+            st.session_state.responses
+        )
+    except Exception as e:
+        logger.error(f"Erreur lors de l'archivage de la discussion : {str(e)}")
 
 # Définition de la structure attendue pour un groupe
 GROUP_STRUCTURE = {
@@ -90,13 +113,12 @@ all_groups = collection_groupes.get(include=["metadatas"])
 available_levels = set(metadata.get('niveau', '').strip().lower() for metadata in all_groups['metadatas'])
 available_subjects = set(metadata.get('matiere', '').strip().lower() for metadata in all_groups['metadatas'])
 
-# Fonction pour charger le modèle SentenceTransformer
+# Fonction pour charger le modèle SentenceTransformer à la demande (torch n'est importé qu'au premier appel)
 @st.cache_resource
 def load_model():
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer('all-MiniLM-L6-v2')
 
-model = load_model()
-
 # Récupérer les valeurs uniques depuis ChromaDB
 schools = set()
 levels = set()
@@ -1258,17 +1280,7 @@ def handle_input_submission(step, response_text):
         choice = response_text.strip().lower()
         if choice in ['oui', 'yes']:
             # Sauvegarder la discussion actuelle
-            session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            history_entry = {
-                "id": session_id,
-                "student_name": st.session_state.responses.get("student_name", "Inconnu"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "messages": st.session_state.messages.copy(),
-                "responses": st.session_state.responses.copy()
-            }
-            if "chat_history" not in st.session_state:
-                st.session_state.chat_history = {}
-            st.session_state.chat_history[session_id] = history_entry
+            archive_chat()
             #st.session_state.messages.append((f"<div class='user-message'>{response_text}</div>", False))
             st.session_state.messages.append(("<div class='bot-message'>D'accord, commençons un nouveau cas. Quelles matières souhaitez-vous étudier ?</div>", True))
             st.session_state.step = 1
@@ -1290,17 +1302,7 @@ def handle_input_submission(step, response_text):
             st.session_state.available_forfaits = {}
         elif choice in ['non', 'no']:
             # Sauvegarder la discussion actuelle
-            session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            history_entry = {
-                "id": session_id,
-                "student_name": st.session_state.responses.get("student_name", "Inconnu"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "messages": st.session_state.messages.copy(),
-                "responses": st.session_state.responses.copy()
-            }
-            if "chat_history" not in st.session_state:
-                st.session_state.chat_history = {}
-            st.session_state.chat_history[session_id] = history_entry
+            archive_chat()
             #st.session_state.messages.append((f"<div class='user-message'>{response_text}</div>", False))
             st.session_state.messages.append(("<div class='bot-message'>Merci pour votre interaction. À bientôt !</div>", True))
             st.session_state.step = 0
@@ -1322,30 +1324,12 @@ with st.sidebar:
     st.markdown("<div class='profile-name'>ELARACHE Jalal</div>", unsafe_allow_html=True)
     st.header("Options")
     st.write("Bienvenue dans le Chatbot de Recommandation !")
-    if "chat_history" in st.session_state and st.session_state.chat_history:
-        st.sidebar.markdown("<h4 style='color: white;'>Historique des discussions</h4>", unsafe_allow_html=True)
-        for session_id, entry in st.session_state.chat_history.items():
-            st.sidebar.markdown(
-                f"<div class='history-item' onclick='javascript:window.parent.postMessage({{type: \"load_chat\", session_id: \"{session_id}\"}}, \"*\");'>"
-                f"{entry['student_name']} - {entry['timestamp']}</div>",
-                unsafe_allow_html=True
-            )
-    else:
-        st.sidebar.markdown("<div style='color: white;'>Aucun historique disponible.</div>", unsafe_allow_html=True)
+    st.sidebar.markdown("<h4 style='color: white;'>Historique des discussions</h4>", unsafe_allow_html=True)
+    archived_chat_id = render_history_browser(history_store)
     if st.button("Réinitialiser la conversation"):
         # Sauvegarder la discussion actuelle avant réinitialisation
         if st.session_state.messages:
-            session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            history_entry = {
-                "id": session_id,
-                "student_name": st.session_state.responses.get("student_name", "Inconnu"),
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "messages": st.session_state.messages.copy(),
-                "responses": st.session_state.responses.copy()
-            }
-            if "chat_history" not in st.session_state:
-                st.session_state.chat_history = {}
-            st.session_state.chat_history[session_id] = history_entry
+            archive_chat()
         st.session_state.clear()
         st.session_state.step = 0
         st.session_state.messages = [("<div class='bot-message'>Bonjour ! Je vais vous aider à trouver des groupes recommandés.</div>", True)]
@@ -1393,6 +1377,12 @@ if 'step' not in st.session_state:
     st.session_state.selected_types_duree = {}
     st.session_state.reduction_percentage = 0
 
+# Discussion archivée sélectionnée dans la sidebar (messages chargés à la demande)
+if archived_chat_id:
+    with st.expander("Discussion archivée", expanded=True):
+        for message, is_bot in history_store.get_messages(archived_chat_id):
+            st.markdown(message, unsafe_allow_html=True)
+
 # Affichage des messages
 st.markdown("<div class='container'>", unsafe_allow_html=True)
 for message, is_bot in st.session_state.messages:
@@ -1469,37 +1459,3 @@ elif st.session_state.step in range(1, 16):
         st.session_state.expect_input = True  # Réactiver l'input pour l'étape suivante
         st.rerun()
     # Si expect_input est False, on n'affiche rien (pas de champ de saisie)
-
-# Ajout du script JavaScript pour gérer le chargement de l'historique
-st.markdown("""
-    <script>
-    window.addEventListener('message', (event) => {
-        if (event.data.type === 'load_chat' && event.data.session_id) {
-            const sessionId = event.data.session_id;
-            fetch(`/load_chat?session_id=${sessionId}`)
-                .then(response => response.json())
-                .then(data => {
-                    if (data.messages) {
-                        // Réinitialiser la conversation actuelle
-                        window.parent.postMessage({type: 'clear_chat'}, '*');
-                        // Charger les messages de l'historique
-                        data.messages.forEach(msg => {
-                            window.parent.postMessage({type: 'add_message', content: msg[0], isBot: msg[1]}, '*');
-                        });
-                        // Restaurer les réponses et l'étape
-                        window.parent.postMessage({type: 'set_responses', responses: data.responses}, '*');
-                        window.parent.postMessage({type: 'set_step', step: 15}, '*');
-                    }
-                })
-                .catch(error => console.error('Erreur lors du chargement de la discussion:', error));
-        }
-    });
-    </script>
-""", unsafe_allow_html=True)
-
-# Fonction pour charger une discussion (déjà présente, mais incluse ici pour cohérence)
-@st.cache_resource
-def load_chat(session_id):
-    if "chat_history" in st.session_state and session_id in st.session_state.chat_history:
-        return st.session_state.chat_history[session_id]
-    return {"messages": [], "responses": {}}
\ No newline at end of file
@@ -1,16 +1,17 @@
 # Imports originaux
 
 import streamlit as st
-from sentence_transformers import SentenceTransformer # Gardé si vous l'utilisez ailleurs, sinon peut être enlevé
 from fuzzywuzzy import process
 import random
 import chromadb
 from datetime import datetime, timedelta
 import os
 import json # NOUVEAU: Pour parser les réponses JSON du LLM
+from tracing import get_tracer, span
 
 # NOUVEAU: Import pour Gemini
 import google.generativeai as genai
+from collection_aliases import AliasedCollection
 
 # --- Configuration ChromaDB (inchangée) ---
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,10 +20,10 @@ chroma_path = os.path.join(parent_dir, "chroma_db5")
 client = chromadb.PersistentClient(path=chroma_path)
 
 try:
-    collection_groupes = client.get_collection(name="groupes_vectorises9")
-    collection_seances = client.get_or_create_collection(name="seances_vectorises")
-    collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-    collection_students = client.get_or_create_collection(name="students_vectorises")
+    collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+    collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+    collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+    collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 
     if collection_groupes.count() == 0:
         st.error("Erreur : La collection ChromaDB des groupes est vide.")
@@ -1118,9 +1119,22 @@ def determine_next_action(session_state):
     # Sinon, erreur générique
     return {"action": "error", "message": "Je suis un peu perdu, pourriez-vous repréciser votre demande ?"}
 
+# Traceur des tours (durée de chaque étape, écrit dans traces/turns.jsonl)
+@st.cache_resource
+def load_tracer():
+    return get_tracer()
+
+tracer = load_tracer()
+
 # NOUVEAU: Fonction principale de traitement d'un tour utilisateur
-# --- Fonction process_user_turn (CORRIGÉE pour UnboundLocalError) ---
 def process_user_turn(user_input, session_state):
+    """Traite un tour utilisateur en traçant la durée de chaque étape."""
+    with tracer.turn() as turn:
+        next_action = _process_user_turn(user_input, session_state)
+        turn.set(next_action=next_action.get("action"))
+
+# --- Fonction process_user_turn (CORRIGÉE pour UnboundLocalError) ---
+def _process_user_turn(user_input, session_state):
     session_state.flags['needs_clarification'] = False # Réinitialiser flag
     session_state.flags['validation_errors'] = [] # Réinitialiser erreurs
     session_state.flags['last_user_input'] = user_input # Stocker pour contexte clarification
@@ -1129,8 +1143,9 @@ def process_user_turn(user_input, session_state):
     next_action = {} # <<< NOUVEAU: Initialiser next_action ici
 
     # 1. NLU
-    nlu_prompt = create_nlu_prompt(user_input, session_state)
-    llm_nlu_response = llm_call(nlu_prompt, task_type='nlu')
+    with span("nlu"):
+        nlu_prompt = create_nlu_prompt(user_input, session_state)
+        llm_nlu_response = llm_call(nlu_prompt, task_type='nlu')
 
     intent = llm_nlu_response.get("intent", "error")
     entities = llm_nlu_response.get("entities", {})
@@ -1183,7 +1198,8 @@ def process_user_turn(user_input, session_state):
          if intent != "request_discount": # Devrait déjà être géré mais sécurité
               session_state.messages.append((f"<div class='user-message'>{user_input}</div>", False))
 
-         validation_result = validate_entities(entities, session_state)
+         with span("validate_entities"):
+             validation_result = validate_entities(entities, session_state)
 
          if validation_result["valid"]:
              validated_data = validation_result["validated_data"]
@@ -1278,7 +1294,8 @@ def process_user_turn(user_input, session_state):
         }
     else:
         # Pas besoin de clarification, déterminer la prochaine étape normale
-        next_action = determine_next_action(session_state)
+        with span("determine_next_action"):
+            next_action = determine_next_action(session_state)
         action_code = next_action.get("action")
 
         # 6. Exécuter la logique métier Python si nécessaire (basé sur next_action)
@@ -1290,7 +1307,8 @@ def process_user_turn(user_input, session_state):
                 # Utiliser get avec filtre where pour recherche exacte (plus robuste)
                 # students_data = collection_students.get(where={"student_name": student_name}) # Marche si metadata indexé
                 # Alternative: récupérer tout et filtrer (moins efficace si bcp d'étudiants)
-                all_students = collection_students.get(include=["metadatas"])
+                with span("chroma_students"):
+                    all_students = collection_students.get(include=["metadatas"])
                 found_student = next((meta for meta in all_students.get('metadatas',[]) if meta.get('student_name','').strip().lower() == student_name.strip().lower()), None)
                 is_new = not bool(found_student)
 
@@ -1309,7 +1327,8 @@ def process_user_turn(user_input, session_state):
              subject = next_action.get("subject")
              level = session_state.responses.get('user_level')
              if level and subject:
-                  forfaits = get_available_forfaits(level, subject)
+                  with span("get_available_forfaits"):
+                      forfaits = get_available_forfaits(level, subject)
                   # Stocker même si vide, pour savoir qu'on a cherché
                   session_state.setdefault('available_forfaits', {})[subject] = forfaits
                   # L'action suivante sera de poser la question de sélection
@@ -1335,10 +1354,11 @@ def process_user_turn(user_input, session_state):
                  elif user_subjects_list and not all(s in selected_forfaits_dict and s in selected_types_duree_dict for s in user_subjects_list):
                       next_action = {"action": "error", "message": "Détails de forfait/durée manquants pour certaines matières de groupe."}
                  else:
-                      output_msgs, groups_select = get_recommendations(
-                           student_name, user_level, user_subjects_list, user_teachers_raw, user_school,
-                           user_center, selected_forfaits_dict, selected_types_duree_dict
-                      )
+                      with span("get_recommendations"):
+                           output_msgs, groups_select = get_recommendations(
+                                student_name, user_level, user_subjects_list, user_teachers_raw, user_school,
+                                user_center, selected_forfaits_dict, selected_types_duree_dict
+                           )
                       session_state.all_groups_for_selection = groups_select
                       session_state.flags['recommendations_shown'] = True
                       bot_action_results = {"output": output_msgs, "groups_for_selection": groups_select}
@@ -1357,7 +1377,8 @@ def process_user_turn(user_input, session_state):
              # S'assurer qu'elle modifie bien next_action ou bot_action_results
              selected_groups_details = session_state.get('selected_groups_details', {})
              if selected_groups_details:
-                 overlaps = check_overlaps(selected_groups_details)
+                 with span("check_overlaps"):
+                     overlaps = check_overlaps(selected_groups_details)
                  if overlaps:
                      session_state.flags['overlap_conflict'] = True
                      overlap_details_html = "<ul>"
@@ -1373,7 +1394,8 @@ def process_user_turn(user_input, session_state):
 
                  else: # Pas d'overlap, calculer
                      try:
-                         tariffs_by_group, tariff_msg_html, total_base_val, total_after_auto_reduc_val = calculate_tariffs(selected_groups_details)
+                         with span("calculate_tariffs"):
+                             tariffs_by_group, tariff_msg_html, total_base_val, total_after_auto_reduc_val = calculate_tariffs(selected_groups_details)
                          if tariffs_by_group is None:
                               next_action = {"action": "error", "message": tariff_msg_html or "Erreur inconnue calcul tarif."}
                          else:
@@ -1398,7 +1420,8 @@ def process_user_turn(user_input, session_state):
                  session_state.total_after_auto_reduc = 0
                  session_state.current_total_for_discount = 0
                  # Déterminer la prochaine action (probablement commentaires)
-                 next_action = determine_next_action(session_state) # Rappeler pour avancer
+                 with span("determine_next_action"):
+                     next_action = determine_next_action(session_state) # Rappeler pour avancer
 
         elif action_code == "show_final_summary":
              # ... (logique show_final_summary inchangée) ...
@@ -1449,8 +1472,9 @@ def process_user_turn(user_input, session_state):
 
     # 7. Génération de la réponse Bot (NLG)
     # next_action est maintenant garantie d'être définie
-    nlg_prompt = create_nlg_prompt(next_action, bot_action_results, session_state)
-    bot_message_html = llm_call(nlg_prompt, task_type='nlg')
+    with span("nlg"):
+        nlg_prompt = create_nlg_prompt(next_action, bot_action_results, session_state)
+        bot_message_html = llm_call(nlg_prompt, task_type='nlg')
 
     # Stocker le message généré pour l'historique (si ce n'est pas une action silencieuse)
     if next_action.get("action") not in ["end_conversation"]: # Ne pas ajouter de message si on termine juste
@@ -1460,6 +1484,8 @@ def process_user_turn(user_input, session_state):
     if next_action.get("action") == "show_tariffs":
          session_state['generated_tariff_message'] = bot_action_results.get("tariff_message_html","")
 
+    return next_action
+
 # --- Interface Streamlit (adaptée) ---
 
 st.markdown("""
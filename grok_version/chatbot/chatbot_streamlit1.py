@@ -1,6 +1,5 @@
 import streamlit as st
 import chromadb
-from sentence_transformers import SentenceTransformer
 from fuzzywuzzy import process
 
 # Initialiser ChromaDB
@@ -8,8 +7,11 @@ client = chromadb.PersistentClient(path="../chroma_db2")
 collection_name = "groupes_vectorises2"
 collection = client.get_collection(name=collection_name)
 
-# Initialiser le modèle pour les embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Modèle pour les embeddings, chargé au premier encodage (service partagé s'il tourne, sinon modèle local)
+@st.cache_resource
+def load_model():
+    from embedding_client import get_embedder
+    return get_embedder()
 
 # Récupérer toutes les écoles, niveaux et matières uniques depuis ChromaDB
 all_groups = collection.get(include=["metadatas", "documents"])
@@ -68,7 +70,7 @@ def get_recommendations(student_name, user_level, user_subjects, user_school):
     all_recommendations = {}
     for matched_subject in matched_subjects:
         query_description = f"<b>Niveau:</b> {matched_level}, <b>Matière:</b> {matched_subject}, <b>École:</b> {matched_school}"
-        query_embedding = model.encode([query_description])[0].tolist()
+        query_embedding = load_model().encode([query_description])[0]
 
         results = collection.query(
             query_embeddings=[query_embedding],
@@ -1,6 +1,5 @@
 import streamlit as st
 import chromadb
-from sentence_transformers import SentenceTransformer
 from fuzzywuzzy import process
 import random
 
@@ -14,8 +13,11 @@ if collection.count() == 0:
     st.error("Erreur : La collection ChromaDB est vide. Veuillez exécuter la vectorisation d'abord.")
     st.stop()
 
-# Initialiser le modèle pour les embeddings (si nécessaire)
-model = SentenceTransformer('all-MiniLM-L6-v2')
+# Modèle pour les embeddings chargé à la demande (si nécessaire)
+@st.cache_resource
+def load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
 
 # Récupérer toutes les valeurs uniques depuis ChromaDB
 all_groups = collection.get(include=["metadatas", "documents"])
@@ -2,12 +2,12 @@
 #import sys
 #sys.modules['sqlite3'] = sys.modules.pop('pysqlite3') 
 import streamlit as st
-from sentence_transformers import SentenceTransformer
 from fuzzywuzzy import process
 import random
 import chromadb
 from datetime import datetime, timedelta
 import os
+from collection_aliases import AliasedCollection
 
 # Get the directory where the current script is located
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -16,10 +16,10 @@ parent_dir = os.path.dirname(current_dir)
 chroma_path = os.path.join(parent_dir, "chroma_db5")
 # Initialize ChromaDB
 client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+collection_groupes = AliasedCollection(client, "groupes_vectorises9", chroma_path)
+collection_seances = AliasedCollection(client, "seances_vectorises", chroma_path, create=True)
+collection_combinaisons = AliasedCollection(client, "combinaisons_vectorises", chroma_path, create=True)
+collection_students = AliasedCollection(client, "students_vectorises", chroma_path, create=True)
 
 # Vérifier si les collections sont vides
 if collection_groupes.count() == 0:
@@ -1,22 +1,27 @@
 import streamlit as st
 import json
-import chromadb
-from fuzzywuzzy import process
-from sentence_transformers import SentenceTransformer
 import google.generativeai as genai
-from datetime import datetime, timedelta
 import os
-import random
-import re
 import logging
 import uuid
-import copy
+import sqlite3
+from datetime import datetime
+from history_store import ConversationStore, ConversationTracker
+from history_browser import render_history_browser
+from recommendation_cache import WARM_UP_HISTORY, mine_profiles
+from recommendation_engine import RecommendationEngine
+from tariff_quotes import FRAIS_INSCRIPTION
+from engine_client import EngineClient
 
 # Configuration du logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 logging.getLogger('PIL').setLevel(logging.INFO)
 
+# Chemins du projet (images, historique) relatifs au répertoire parent de chatbot/
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+
 # Configuration initiale
 st.set_page_config(page_title="Chatbot de Recommandation de Groupes", page_icon="📚", layout="wide")
 
@@ -32,515 +37,46 @@ except Exception as e:
     st.error(f"Erreur de configuration de l'API Gemini : {str(e)}")
     st.stop()
 
-# Initialisation de ChromaDB
-current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(current_dir)
-chroma_path = os.path.join(parent_dir, "chroma_db5")
-client = chromadb.PersistentClient(path=chroma_path)
-collection_groupes = client.get_collection(name="groupes_vectorises9")
-collection_seances = client.get_or_create_collection(name="seances_vectorises")
-collection_combinaisons = client.get_or_create_collection(name="combinaisons_vectorises")
-collection_students = client.get_or_create_collection(name="students_vectorises")
+# Moteur de recommandation : service partagé si ENGINE_SERVICE_URL est défini, sinon moteur local au processus
+ENGINE_SERVICE_URL = st.secrets["ENGINE_SERVICE_URL"] if "ENGINE_SERVICE_URL" in st.secrets else os.getenv("ENGINE_SERVICE_URL")
 
-# Définition de la structure attendue pour un groupe
-GROUP_STRUCTURE = {
-    "id_cours": str,
-    "name_cours": str,
-    "centre": str,
-    "heure_debut": str,
-    "heure_fin": str,
-    "jour": str,
-    "matiere": str,
-    "id_forfait": str,
-    "nom_forfait": str,
-    "type_duree_id": str,
-    "num_students": int,
-    "teacher": str,
-    "schools": list,
-    "students": list,
-    "date_debut": str,
-    "date_fin": str
-}
+@st.cache_resource
+def load_engine():
+    if ENGINE_SERVICE_URL:
+        logger.info(f"Utilisation du service de recommandation : {ENGINE_SERVICE_URL}")
+        return EngineClient(ENGINE_SERVICE_URL)
+    return RecommendationEngine()
 
-def validate_group_structure(group):
-    """Valide qu'un groupe a bien la structure attendue"""
-    if not isinstance(group, dict):
-        return False, "Le groupe doit être un dictionnaire"
-    
-    missing_keys = [key for key in GROUP_STRUCTURE if key not in group]
-    if missing_keys:
-        return False, f"Clés manquantes: {missing_keys}"
-    
-    for key, expected_type in GROUP_STRUCTURE.items():
-        if not isinstance(group.get(key), expected_type):
-            return False, f"Type incorrect pour {key} (attendu: {expected_type.__name__})"
-    
-    return True, ""
+engine = load_engine()
+vocabularies = engine.vocabularies()
 
 # Vérification des collections
-if collection_groupes.count() == 0:
+if vocabularies['group_count'] == 0:
     st.error("Erreur : La collection ChromaDB des groupes est vide. Veuillez exécuter la vectorisation d'abord.")
     st.stop()
-if collection_combinaisons.count() == 0:
+if vocabularies['combinaison_count'] == 0:
     st.error("Erreur : La collection ChromaDB des combinaisons est vide. Veuillez exécuter la vectorisation des combinaisons d'abord.")
     st.stop()
 
-# Vérification des données pour le niveau et les matières
-test_level = "BL - 2bac sc PC"
-test_subjects = ["Français", "Mathématiques"]
-all_groups = collection_groupes.get(include=["metadatas"])
-available_levels = set(metadata.get('niveau', '').strip().lower() for metadata in all_groups['metadatas'])
-available_subjects = set(metadata.get('matiere', '').strip().lower() for metadata in all_groups['metadatas'])
-
-# Fonction pour charger le modèle SentenceTransformer
-@st.cache_resource
-def load_model():
-    return SentenceTransformer('all-MiniLM-L6-v2')
-
-model = load_model()
-
-# Récupérer les valeurs uniques depuis ChromaDB
-schools = set()
-levels = set()
-subjects = set()
-centers = set()
-teachers = set()
-for metadata in all_groups['metadatas']:
-    try:
-        schools.add(metadata['ecole'].split(", ")[0])
-        levels.add(metadata['niveau'])
-        subjects.add(metadata['matiere'])
-        centers.add(metadata['centre'])
-        teachers.add(metadata['teacher'])
-    except (KeyError, IndexError):
-        continue
-
-schools_list = sorted(list(schools))
-levels_list = sorted(list(levels))
-subjects_list = sorted(list(subjects))
-centers_list = sorted(list(centers))
-teachers_list = sorted(list(teachers))
-
-# Fonctions utilitaires
-def get_available_forfaits(level, subject):
-    logger.debug(f"Récupération des forfaits pour niveau: '{level}', matière: '{subject}'")
-    forfaits = {}
-    all_groups = collection_groupes.get(include=["metadatas"])
-    target_subject = subject.strip().lower()
-    target_level = level.strip().lower()
-    available_subjects = list(set(metadata['matiere'].strip().lower() for metadata in all_groups['metadatas'] if metadata.get('matiere')))
-    
-    matched_subject = target_subject
-    if available_subjects:
-        best_match, score = process.extractOne(target_subject, available_subjects)
-        if score > 80:
-            matched_subject = best_match
-            logger.debug(f"Matière '{subject}' correspond à '{matched_subject}' (score: {score})")
-        else:
-            logger.debug(f"Aucune correspondance proche pour '{subject}' (meilleur score: {score})")
-    
-    for metadata in all_groups['metadatas']:
-        metadata_niveau = metadata.get('niveau', '').strip().lower()
-        metadata_matiere = metadata.get('matiere', '').strip().lower()
-        if metadata_niveau == target_level and metadata_matiere == matched_subject:
-            id_forfait = metadata.get('id_forfait')
-            nom_forfait = metadata.get('nom_forfait', 'Forfait inconnu')
-            duree_tarifs = metadata.get('duree_tarifs', '')
-            if id_forfait:
-                if id_forfait not in forfaits:
-                    forfaits[id_forfait] = {'name': nom_forfait, 'types_duree': {}}
-                if duree_tarifs:
-                    try:
-                        duree_entries = duree_tarifs.split(';')
-                        for i, entry in enumerate(duree_entries, 1):
-                            if entry:
-                                parts = entry.split(':')
-                                if len(parts) == 3:
-                                    type_duree, entry_id_forfait, tarif = parts
-                                    if entry_id_forfait == id_forfait:
-                                        type_duree_id = f"{id_forfait}_{i}"
-                                        forfaits[id_forfait]['types_duree'][type_duree_id] = {
-                                            'name': type_duree,
-                                            'tarif_unitaire': float(tarif)
-                                        }
-                        logger.debug(f"Forfait trouvé: {id_forfait} - {nom_forfait}, types_duree: {forfaits[id_forfait]['types_duree']}")
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"Erreur lors du parsing de duree_tarifs pour {id_forfait}: {str(e)}")
-            else:
-                logger.debug(f"Forfait ignoré: id_forfait manquant pour {metadata}")
-    
-    if not forfaits:
-        logger.warning(f"Aucun forfait trouvé pour niveau: '{level}', matière: '{subject}'")
-    return forfaits
-
-def match_value(user_input, valid_values):
-    if not user_input or not valid_values:
-        return user_input, False
-    result = process.extractOne(user_input, valid_values)
-    if result is None:
-        return user_input, False
-    best_match, score = result
-    return best_match if score > 80 else user_input, score > 80
-
-def count_school_students(group_schools, user_school):
-    return sum(1 for school in group_schools if school == user_school)
-
-def parse_time(time_str):
-    try:
-        return datetime.strptime(time_str, "%H:%M")
-    except:
-        return None
-
-def has_overlap(group1, group2):
-    """Vérifie si deux groupes ont un chevauchement horaire"""
-    # Validation des structures
-    valid1, msg1 = validate_group_structure(group1)
-    valid2, msg2 = validate_group_structure(group2)
-    
-    if not valid1 or not valid2:
-        logger.error(f"Structure de groupe invalide: {msg1 if not valid1 else msg2}")
-        return False
-    
-    # Vérification des jours différents
-    if group1['jour'] != group2['jour']:
-        return False
-        
-    try:
-        # Conversion des heures
-        start1 = parse_time(group1['heure_debut'])
-        end1 = parse_time(group1['heure_fin'])
-        start2 = parse_time(group2['heure_debut'])
-        end2 = parse_time(group2['heure_fin'])
-    except Exception as e:
-        logger.error(f"Erreur de parsing des heures: {str(e)}")
-        return False
-
-    if not all([start1, end1, start2, end2]):
-        return False
-        
-    # Marge de 15 min si centres différents
-    same_center = group1['centre'] == group2['centre']
-    margin = timedelta(minutes=15) if not same_center else timedelta(0)
-    
-    return (start1 < end2 + margin) and (start2 < end1 + margin)
-
-def check_overlaps(selected_groups):
-    """Vérifie les chevauchements entre les groupes sélectionnés"""
-    if not isinstance(selected_groups, dict):
-        logger.error("Les groupes sélectionnés doivent être dans un dictionnaire")
-        return []
-    
-    overlaps = []
-    group_list = list(selected_groups.values())
-    
-    for i in range(len(group_list)):
-        for j in range(i + 1, len(group_list)):
-            if has_overlap(group_list[i], group_list[j]):
-                overlaps.append((group_list[i], group_list[j]))
-    
-    return overlaps
-
-def get_remaining_sessions(id_cours):
-    reference_date_fixed = datetime.strptime("2025/03/06", "%Y/%m/%d")
-    seances_data = collection_seances.get(include=["metadatas"])
-    id_cours_str = str(id_cours)
-    relevant_seances = [metadata for metadata in seances_data['metadatas'] if metadata['id_cours'] == id_cours_str]
-    return sum(1 for metadata in relevant_seances if datetime.strptime(metadata['date_seance'], "%Y/%m/%d") > reference_date_fixed)
-
-def calculate_tariffs(selected_groups, user_duree_types, user_type_duree_ids, forfaits_info):
-    tariffs_by_group = {}
-    total_tariff_base = 0
-    reduction_applied = 0
-    reduction_description = ""
-    selected_forfait_ids = []
-
-    for subject, group in selected_groups.items():
-        user_duree_type = user_duree_types[subject]
-        user_type_duree_id = user_type_duree_ids[subject]
-        id_forfait = group['id_forfait']
-        nom_forfait = forfaits_info[subject][id_forfait]['name']
-        groupe_data = collection_groupes.get(ids=[group['id_cours']], include=["metadatas"])
-        if not groupe_data['metadatas']:
-            return None, f"Erreur : Données non trouvées pour le cours {group['id_cours']}.", None
-        
-        metadata = groupe_data['metadatas'][0]
-        group_id_forfait = metadata.get('id_forfait')
-        type_duree_id = metadata.get('type_duree_id')
-        tarif_unitaire = metadata.get('tarifunitaire')
-        
-        if group_id_forfait is None or type_duree_id != user_type_duree_id or tarif_unitaire is None:
-            return None, f"Erreur : Données invalides pour le cours {group['id_cours']}.", None
-        
-        selected_forfait_ids.append(id_forfait)
-        remaining_sessions = get_remaining_sessions(group['id_cours'])
-        tarif_total = remaining_sessions * float(tarif_unitaire)
-        
-        tariffs_by_group[subject] = {
-            "id_cours": group['id_cours'],
-            "id_forfait": id_forfait,
-            "nom_forfait": nom_forfait,
-            "remaining_sessions": remaining_sessions,
-            "tarif_unitaire": float(tarif_unitaire),
-            "tarif_total": tarif_total
-        }
-        total_tariff_base += tarif_total
-
-    if len(selected_forfait_ids) > 1:
-        combinaisons_data = collection_combinaisons.get(include=["metadatas"])
-        combinaisons_dict = {}
-        for metadata in combinaisons_data['metadatas']:
-            id_combinaison = metadata['id_combinaison']
-            id_forfait = str(metadata['id_forfait'])
-            reduction = float(metadata['reduction'])
-            if id_combinaison not in combinaisons_dict:
-                combinaisons_dict[id_combinaison] = []
-            combinaisons_dict[id_combinaison].append((id_forfait, reduction))
-        
-        for id_combinaison, pairs in combinaisons_dict.items():
-            forfait_ids = [pair[0] for pair in pairs]
-            reduction_percentage = pairs[0][1]
-            if all(id in selected_forfait_ids for id in forfait_ids):
-                reduction_amount = total_tariff_base * (reduction_percentage / 100)
-                total_tariff_base -= reduction_amount
-                reduction_applied = reduction_amount
-                reduction_description = f"Réduction pour combinaison ({id_combinaison}) : -{reduction_amount:.2f} DH ({reduction_percentage:.2f}%)"
-                break
-
-    tariff_message = "<b>Détails des tarifs :</b><br>"
-    for subject, info in tariffs_by_group.items():
-        tariff_message += f"- {subject} ([{info['id_forfait']}] {info['nom_forfait']}, Type de durée : {user_duree_types[subject]}) : {info['remaining_sessions']} séances restantes, tarif unitaire {info['tarif_unitaire']} DH, tarif total {info['tarif_total']:.2f} DH<br>"
-    tariff_message += f"<b>Total de base :</b> {sum(info['tarif_total'] for info in tariffs_by_group.values()):.2f} DH<br>"
-    if reduction_applied > 0:
-        tariff_message += f"{reduction_description}<br>"
-        tariff_message += f"<b>Total après réduction :</b> {total_tariff_base:.2f} DH"
-    else:
-        tariff_message += f"<b>Total :</b> {total_tariff_base:.2f} DH"
-    
-    return tariffs_by_group, tariff_message, total_tariff_base
-
-def get_recommendations(student_name, user_level, user_subjects, user_teachers, user_school, user_center, selected_forfaits, selected_types_duree, forfaits_info):
-    import random
-    logger.debug(f"get_recommendations: inputs: student_name={student_name}, level={user_level}, subjects={user_subjects}, "
-                 f"teachers={user_teachers}, school={user_school}, center={user_center}, forfaits={selected_forfaits}, "
-                 f"types_duree={selected_types_duree}")
-
-    # Initialize outputs
-    output = []
-    all_recommendations = {}
-    all_groups_for_selection = {}
-
-    # Match inputs
-    matched_level = match_value(user_level, levels)[0]
-    matched_subjects = [match_value(subj.strip(), subjects)[0] for subj in user_subjects.split(",")]
-    
-    # Handle user_teachers as string, list, or None
-    if isinstance(user_teachers, list):
-        matched_teachers = [teacher.strip() for teacher in user_teachers if teacher] if user_teachers else [None] * len(matched_subjects)
-    elif isinstance(user_teachers, str) and user_teachers:
-        matched_teachers = [teacher.strip() for teacher in user_teachers.split(",")]
-    else:
-        matched_teachers = [None] * len(matched_subjects)
-    
-    matched_school = match_value(user_school, schools)[0]
-    matched_center = match_value(user_center, centers)[0] if user_center else None
-
-    # Initialize dictionaries for each subject
-    for subject in matched_subjects:
-        all_recommendations[subject] = []
-        all_groups_for_selection[subject] = []
-
-    # Fetch groups from database
-    all_groups_data = collection_groupes.get(include=["metadatas", "documents"])
-    logger.debug(f"get_recommendations: raw groups fetched: {all_groups_data}")
-
-    # Define required and optional metadata keys
-    required_keys = ['id_cours', 'name_cours', 'id_forfait', 'type_duree_id', 'centre', 'heure_debut', 'heure_fin', 'jour', 'matiere', 'niveau', 'nom_forfait']
-    optional_keys = {
-        'num_students': 0,
-        'teacher': 'N/A',
-        'ecole': 'Inconnu',
-        'student': '',
-        'date_debut': 'N/A',
-        'date_fin': 'N/A',
-        'criteria': 'Non spécifié'
-    }
-
-    for matched_subject, matched_teacher in zip(matched_subjects, matched_teachers):
-        id_forfait = selected_forfaits.get(matched_subject)
-        type_duree_id = selected_types_duree.get(matched_subject)
-        if not id_forfait or not type_duree_id:
-            output.append(f"Aucun forfait ou type de durée sélectionné pour {matched_subject}.")
-            continue
-
-        groups = {}
-        rejected_groups = []
-        for metadata, document in zip(all_groups_data['metadatas'], all_groups_data['documents']):
-            # Validate required keys
-            missing_keys = [key for key in required_keys if key not in metadata]
-            if missing_keys:
-                logger.error(f"Invalid group (id_cours: {metadata.get('id_cours', 'unknown')}): Missing required keys: {missing_keys}")
-                rejected_groups.append((metadata, f"Missing required keys: {missing_keys}"))
-                continue
-
-            # Match group criteria
-            if (metadata['niveau'].strip().lower() == matched_level.strip().lower() and
-                metadata['matiere'].strip().lower() == matched_subject.strip().lower() and
-                metadata.get('id_forfait') == id_forfait and
-                metadata.get('type_duree_id') == type_duree_id):
-                
-                # Create validated group with defaults
-                validated_metadata = metadata.copy()
-                for key, default in optional_keys.items():
-                    validated_metadata[key] = metadata.get(key, default)
-
-                # Process schools and students
-                group_schools = [school.strip() for school in validated_metadata['ecole'].split(", ") if school.strip()] or ['Inconnu']
-                group_students = [student.strip() for student in validated_metadata.get('student', '').split(", ") if student.strip()] or []
-                num_students = int(validated_metadata['num_students'])
-
-                if len(group_students) < num_students:
-                    group_students.extend([f"Étudiant_{i}" for i in range(len(group_students), num_students)])
-                group_students = group_students[:num_students]
-
-                unique_schools = list(dict.fromkeys(group_schools))
-                if len(unique_schools) < num_students:
-                    unique_schools.extend(["Inconnu"] * (num_students - len(unique_schools)))
-                unique_schools = unique_schools[:num_students]
-
-                school_student_pairs = dict(zip(group_students, unique_schools))
-
-                # Apply filters
-                if matched_center and validated_metadata['centre'].lower() != matched_center.lower():
-                    logger.debug(f"Group {validated_metadata['id_cours']} filtered out: centre {validated_metadata['centre']} != {matched_center}")
-                    rejected_groups.append((metadata, f"Centre mismatch: {validated_metadata['centre']}"))
-                    continue
-                if matched_teacher and matched_teacher != 'N/A' and validated_metadata['teacher'] != matched_teacher:
-                    logger.debug(f"Group {validated_metadata['id_cours']} filtered out: teacher {validated_metadata['teacher']} != {matched_teacher}")
-                    rejected_groups.append((metadata, f"Teacher mismatch: {validated_metadata['teacher']}"))
-                    continue
-                # Relax school filter for testing
-                # if matched_school and matched_school not in group_schools:
-                #     logger.debug(f"Group {validated_metadata['id_cours']} filtered out: school {matched_school} not in {group_schools}")
-                #     rejected_groups.append((metadata, f"School mismatch: {matched_school}"))
-                #     continue
-
-                groups[validated_metadata['id_cours']] = {
-                    "id_cours": validated_metadata['id_cours'],
-                    "name_cours": validated_metadata['name_cours'],
-                    "num_students": num_students,
-                    "description": document,
-                    "centre": validated_metadata['centre'],
-                    "teacher": validated_metadata['teacher'],
-                    "schools": list(school_student_pairs.values()),
-                    "students": list(school_student_pairs.keys()),
-                    "date_debut": validated_metadata['date_debut'],
-                    "date_fin": validated_metadata['date_fin'],
-                    "heure_debut": validated_metadata['heure_debut'],
-                    "heure_fin": validated_metadata['heure_fin'],
-                    "jour": validated_metadata['jour'] if validated_metadata.get('jour') else "None",
-                    "niveau": validated_metadata['niveau'],
-                    "matiere": validated_metadata['matiere'],
-                    "id_forfait": validated_metadata['id_forfait'],
-                    "nom_forfait": validated_metadata['nom_forfait'],
-                    "type_duree_id": validated_metadata['type_duree_id']
-                }
-
-        if not groups:
-            output.append(f"Aucun groupe trouvé pour {matched_subject} avec le forfait [{id_forfait}] {forfaits_info[matched_subject][id_forfait]['name']} et le type de durée sélectionné.")
-            continue
+# Valeurs uniques du catalogue
+schools_list = vocabularies['schools_list']
+levels_list = vocabularies['levels_list']
+subjects_list = vocabularies['subjects_list']
+centers_list = vocabularies['centers_list']
+teachers_list = vocabularies['teachers_list']
 
-        group_list = list(groups.values())
-        for group in group_list:
-            formatted_schools = "<br>".join(sorted(set(group['schools'])))
-            group['description'] = formatted_schools
-
-        selected_groups = []
-        selected_ids = set()
-
-        def add_groups(new_groups, criteria="Non spécifié"):
-            for group in new_groups:
-                if group['id_cours'] not in selected_ids and len(selected_groups) < 3:
-                    group['criteria'] = criteria
-                    selected_groups.append(group)
-                    selected_ids.add(group['id_cours'])
-
-        # Simplified filtering logic
-        if matched_center:
-            # Priority 1: Match teacher, center, and school
-            priority_groups = [g for g in group_list if 
-                             (not matched_teacher or matched_teacher == g['teacher']) and 
-                             g['centre'].lower() == matched_center.lower()]
-                             # and matched_school in g['schools']  # Relaxed school filter
-            priority_groups.sort(key=lambda x: count_school_students(x['schools'], matched_school), reverse=True)
-            add_groups(priority_groups, "Professeur, Centre, École")
-
-            # Priority 2: Match center
-            if len(selected_groups) < 3:
-                remaining_groups = [g for g in group_list if g['centre'].lower() == matched_center.lower() and g['id_cours'] not in selected_ids]
-                add_groups(remaining_groups, "Centre")
-
-        # Fallback: No center specified
-        else:
-            # Priority 1: Match teacher and school
-            priority_groups = [g for g in group_list if 
-                             (not matched_teacher or matched_teacher == g['teacher'])]
-                             # and matched_school in g['schools']  # Relaxed school filter
-            priority_groups.sort(key=lambda x: count_school_students(x['schools'], matched_school), reverse=True)
-            add_groups(priority_groups, "Professeur, École")
+# Fonctions métier déléguées au moteur
+get_available_forfaits = engine.get_available_forfaits
+get_recommendations = engine.get_recommendations
+calculate_tariffs = engine.calculate_tariffs
+check_overlaps = engine.check_overlaps
 
-            # Priority 2: Any groups
-            if len(selected_groups) < 3:
-                remaining_groups = [g for g in group_list if g['id_cours'] not in selected_ids]
-                random.shuffle(remaining_groups)
-                add_groups(remaining_groups, "Aucun critère spécifique (aléatoire)")
+def selection_groups(subject):
+    """Groupes proposés pour une matière (la session ne garde que leurs id_cours)"""
+    return engine.get_groups(st.session_state.all_groups_for_selection.get(subject, []))
 
-        if len(selected_groups) < 3:
-            output.append(f"Attention : Seulement {len(selected_groups)} groupe(s) trouvé(s) pour {matched_subject}.")
-
-        recommendations = []
-        groups_for_selection = []
-        for i, group in enumerate(selected_groups[:3], 1):
-            recommendation = (
-                f"<h4>Groupe {i} ({matched_subject})</h4>"
-                f"<b>ID:</b> {group['id_cours']}<br>"
-                f"<b>Nom:</b> {group['name_cours']}<br>"
-                f"<b>Forfait:</b> [{group['id_forfait']}] {group['nom_forfait']}<br>"
-                f"<b>Nombre d'étudiants :</b> {group['num_students']}<br>"
-                f"<b>Professeur:</b> {group['teacher']}<br>"
-                f"<b>Centre:</b> {group['centre']}<br>"
-                f"<b>Date de début:</b> {group['date_debut']}<br>"
-                f"<b>Date de fin:</b> {group['date_fin']}<br>"
-                f"<b>Heure de début:</b> {group['heure_debut']}<br>"
-                f"<b>Heure de fin:</b> {group['heure_fin']}<br>"
-                f"<b>Jour:</b> {group['jour']}<br>"
-                f"<b>Écoles:</b><br>{group['description']}<br>"
-                f"<b>Critères de sélection :</b> {group['criteria']}"
-            )
-            recommendations.append(recommendation)
-            groups_for_selection.append({
-                "id_cours": group['id_cours'],
-                "name_cours": group['name_cours'],
-                "display": f"Groupe {i} : {group['id_cours']} - {group['name_cours']}",
-                "centre": group['centre'],
-                "heure_debut": group['heure_debut'],
-                "heure_fin": group['heure_fin'],
-                "jour": group['jour'],
-                "matiere": group['matiere'],
-                "criteria": group['criteria'],
-                "id_forfait": group['id_forfait'],
-                "nom_forfait": group['nom_forfait'],
-                "type_duree_id": group['type_duree_id']
-            })
-        
-        all_recommendations[matched_subject] = recommendations
-        all_groups_for_selection[matched_subject] = groups_for_selection
-
-    logger.debug(f"get_recommendations: all_groups_for_selection: {all_groups_for_selection}")
-    logger.debug(f"get_recommendations: all_recommendations: {all_recommendations}")
-    logger.debug(f"get_recommendations: rejected groups: {rejected_groups}")
-
-    output.append(f"<b>Les groupes recommandés pour l'étudiant</b> {student_name} :")
-    return output, all_recommendations, all_groups_for_selection, matched_subjects
+def group_display(i, group):
+    return f"Groupe {i} : {group['id_cours']} - {group['name_cours']}"
 
 # Styles CSS
 st.markdown("""
@@ -1025,7 +561,7 @@ def handle_input_submission(step, response_text):
                         if not groups:
                             raise ValueError(f"Aucun groupe disponible pour {subject}")
                         if 1 <= index <= len(groups):
-                            group_selections[subject] = groups[index - 1]['id_cours']
+                            group_selections[subject] = groups[index - 1]
                         else:
                             raise ValueError(f"Indice {index} hors plage pour {subject} (1-{len(groups)})")
                     except ValueError as e:
@@ -1037,11 +573,11 @@ def handle_input_submission(step, response_text):
                 st.session_state.messages.append((error_message, True))
                 groups_message = f"<div class='bot-message'>Veuillez sélectionner un groupe pour chaque matière (entrez les numéros dans l'ordre : {', '.join(matched_subjects)}) :<br>"
                 for subject in matched_subjects:
-                    groups = st.session_state.all_groups_for_selection.get(subject, [])
+                    groups = selection_groups(subject)
                     if groups:
                         groups_message += f"<h3>{subject}</h3>"
                         for i, group in enumerate(groups, 1):
-                            groups_message += f"{i}. {group['display']} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
+                            groups_message += f"{i}. {group_display(i, group)} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
                     else:
                         groups_message += f"<h3>{subject}</h3>Aucun groupe disponible.<br>"
                 groups_message += f"Exemple : {'1,2' if len(matched_subjects) > 1 else '1'}</div>"
@@ -1057,12 +593,12 @@ def handle_input_submission(step, response_text):
     
         for subject, id_cours in group_selections.items():
             if subject in st.session_state.all_groups_for_selection:
-                groups = st.session_state.all_groups_for_selection[subject]
-                selected_group = next((group for group in groups if group['id_cours'] == id_cours), None)
+                group_ids = st.session_state.all_groups_for_selection[subject]
+                selected_group = engine.get_groups([id_cours])[0] if id_cours in group_ids else None
                 if selected_group:
                     valid_subjects.append(subject)
-                    st.session_state.selected_groups[subject] = selected_group
-                    groups_message += f"<h3>{subject}</h3>[{id_cours}] {selected_group['display']} (Centre: {selected_group['centre']}, Jour: {selected_group['jour']}, {selected_group['heure_debut']}-{selected_group['heure_fin']})<br>"
+                    st.session_state.selected_groups[subject] = id_cours
+                    groups_message += f"<h3>{subject}</h3>[{id_cours}] {group_display(group_ids.index(id_cours) + 1, selected_group)} (Centre: {selected_group['centre']}, Jour: {selected_group['jour']}, {selected_group['heure_debut']}-{selected_group['heure_fin']})<br>"
                 else:
                     groups_message += f"<h3>{subject}</h3>Groupe {id_cours} invalide.<br>"
             else:
@@ -1075,8 +611,8 @@ def handle_input_submission(step, response_text):
     
             # Store selections in responses (as indices for display)
             st.session_state.responses['group_selections'] = ','.join(
-                str(next(i + 1 for i, g in enumerate(st.session_state.all_groups_for_selection[subject]) if g['id_cours'] == group['id_cours']))
-                for subject, group in st.session_state.selected_groups.items()
+                str(st.session_state.all_groups_for_selection[subject].index(id_cours) + 1)
+                for subject, id_cours in st.session_state.selected_groups.items()
             )
             #st.session_state.messages.append((f"<div class='user-message'>{st.session_state.responses['group_selections']}</div>", False))
     
@@ -1091,11 +627,11 @@ def handle_input_submission(step, response_text):
                 st.session_state.messages.append((conflict_msg, True))
                 groups_message = f"<div class='bot-message'>Veuillez sélectionner un groupe pour chaque matière (entrez les numéros dans l'ordre : {', '.join(matched_subjects)}) :<br>"
                 for subject in matched_subjects:
-                    groups = st.session_state.all_groups_for_selection.get(subject, [])
+                    groups = selection_groups(subject)
                     if groups:
                         groups_message += f"<h3>{subject}</h3>"
                         for i, group in enumerate(groups, 1):
-                            groups_message += f"{i}. {group['display']} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
+                            groups_message += f"{i}. {group_display(i, group)} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
                 groups_message += f"Exemple : {'1,2' if len(matched_subjects) > 1 else '1'}</div>"
                 st.session_state.messages.append((groups_message, True))
                 st.session_state.step = 11
@@ -1145,7 +681,7 @@ def handle_input_submission(step, response_text):
             # Prompt for inscription fees
             num_group_subjects = len(valid_subjects)
             if num_group_subjects > 0:
-                frais_inscription = 250 
+                frais_inscription = FRAIS_INSCRIPTION
                 groups_message += f"Groupes validés pour {', '.join(valid_subjects)}. Voulez-vous inclure les frais d'inscription ({frais_inscription} DH pour {num_group_subjects} matière(s)) ? (Oui/Non)"
                 #st.session_state.messages.append((groups_message, True))
                 st.session_state.frais_inscription = frais_inscription
@@ -1159,11 +695,11 @@ def handle_input_submission(step, response_text):
             st.session_state.messages.append((error_message, True))
             groups_message = f"<div class='bot-message'>Veuillez sélectionner un groupe pour chaque matière (entrez les numéros dans l'ordre : {', '.join(matched_subjects)}) :<br>"
             for subject in matched_subjects:
-                groups = st.session_state.all_groups_for_selection.get(subject, [])
+                groups = selection_groups(subject)
                 if groups:
                     groups_message += f"<h3>{subject}</h3>"
                     for i, group in enumerate(groups, 1):
-                            groups_message += f"{i}. {group['display']} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
+                            groups_message += f"{i}. {group_display(i, group)} (Centre: {group['centre']}, Jour: {group['jour']}, {group['heure_debut']}-{group['heure_fin']})<br>"
                 else:
                     groups_message += f"<h3>{subject}</h3>Aucun groupe disponible.<br>"
             groups_message += f"Exemple : {'1,2' if len(matched_subjects) > 1 else '1'}</div>"
@@ -1299,30 +835,31 @@ if 'step' not in st.session_state:
     st.session_state.selected_forfaits = {}
     st.session_state.selected_types_duree = {}
     st.session_state.reduction_percentage = 0
-    st.session_state.conversation_history = []  # Liste pour stocker les historiques
     st.session_state.current_conversation_id = str(uuid.uuid4())  # ID unique pour la conversation actuelle
 
-# Chemin pour sauvegarder l'historique
-history_file = os.path.join(parent_dir, "conversation_history.json")
+# Chemins de l'historique (SQLite, avec import unique de l'ancien fichier JSON)
+history_db = os.getenv("CONVERSATION_HISTORY_DB", os.path.join(parent_dir, "conversation_history.db"))
+legacy_history_file = os.path.join(parent_dir, "conversation_history.json")
 
-# Fonction pour charger l'historique
-def load_conversation_history():
-    try:
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return []
-    except Exception as e:
-        logger.error(f"Erreur lors du chargement de l'historique : {str(e)}")
-        return []
+# Store partagé par toutes les sessions du processus
+@st.cache_resource
+def load_history_store():
+    store = ConversationStore(history_db)
+    if store.count_conversations() == 0 and os.path.exists(legacy_history_file):
+        imported = store.migrate_from_json(legacy_history_file)
+        logger.info(f"{imported} conversation(s) importée(s) depuis {legacy_history_file}")
+    return store
 
-# Fonction pour sauvegarder l'historique
-def save_conversation_history(history):
-    try:
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"Erreur lors de la sauvegarde de l'historique : {str(e)}")
+history_store = load_history_store()
+
+# Préchauffage du cache de recommandations avec les profils fréquents de l'historique (moteur local uniquement)
+@st.cache_resource
+def warm_up_engine():
+    if isinstance(engine, RecommendationEngine):
+        return engine.warm_up(mine_profiles(history_store.load_states(WARM_UP_HISTORY)))
+    return 0
+
+warm_up_engine()
 
 # Initialisation de l'état
 def initialize_session_state():
@@ -1346,7 +883,6 @@ def initialize_session_state():
         'selected_forfaits': {},
         'selected_types_duree': {},
         'reduction_percentage': 0,
-        'conversation_history': load_conversation_history(),
         'current_conversation_id': str(uuid.uuid4()),
         'displayed_conversation_id': None,
         'current_messages': [("<div class='bot-message'>Bonjour ! Je vais vous aider à trouver des groupes recommandés.</div>", True)]
@@ -1365,45 +901,52 @@ def save_conversation():
         logger.debug("Aucun message à sauvegarder.")
         return
     
-    conversation = {
-        "id": st.session_state.current_conversation_id,
-        "student_name": st.session_state.responses.get("student_name", "Inconnu"),
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": copy.deepcopy(st.session_state.messages),
-        "responses": copy.deepcopy(st.session_state.responses),
-        "matched_subjects": copy.deepcopy(st.session_state.matched_subjects),
-        "selected_groups": copy.deepcopy(st.session_state.selected_groups),
-        "tariffs_by_group": copy.deepcopy(st.session_state.tariffs_by_group),
-        "total_tariff_base": st.session_state.total_tariff_base
-    }
-    
-    for i, conv in enumerate(st.session_state.conversation_history):
-        if conv["id"] == st.session_state.current_conversation_id:
-            st.session_state.conversation_history[i] = conversation
-            logger.debug(f"Conversation mise à jour : ID {conversation['id']}")
-            break
-    else:
-        st.session_state.conversation_history.append(conversation)
-        logger.debug(f"Nouvelle conversation enregistrée : ID {conversation['id']}")
+    # Le tracker retient ce qui est déjà persisté : seuls le nouveau tour et les champs modifiés sont écrits
+    tracker = st.session_state.get('history_tracker')
+    if tracker is None or tracker.conversation_id != st.session_state.current_conversation_id:
+        tracker = ConversationTracker(st.session_state.current_conversation_id)
+        st.session_state.history_tracker = tracker
     
-    save_conversation_history(st.session_state.conversation_history)
+    try:
+        written = tracker.save(
+            history_store,
+            st.session_state.responses.get("student_name", "Inconnu"),
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            st.session_state.messages,
+            {
+                "responses": st.session_state.responses,
+                "matched_subjects": st.session_state.matched_subjects,
+                "selected_groups": st.session_state.selected_groups,
+                "tariffs_by_group": st.session_state.tariffs_by_group
+            },
+            st.session_state.total_tariff_base
+        )
+        logger.debug(f"Conversation sauvegardée : ID {tracker.conversation_id} ({written} nouveau(x) message(s))")
+    except (sqlite3.Error, OSError) as e:
+        # Erreurs de la base d'historique seulement : une erreur de programmation doit remonter
+        logger.error(f"Erreur lors de la sauvegarde de l'historique : {str(e)}")
     if st.session_state.displayed_conversation_id == st.session_state.current_conversation_id:
-        st.session_state.current_messages = copy.deepcopy(st.session_state.messages)
+        # Les messages sont des tuples immuables : on partage les références au lieu de les copier
+        st.session_state.current_messages = list(st.session_state.messages)
 
 # Fonction pour charger une conversation
 def load_conversation(conversation_id):
     if conversation_id == st.session_state.current_conversation_id:
         st.session_state.displayed_conversation_id = conversation_id
-        st.session_state.current_messages = copy.deepcopy(st.session_state.messages)
+        st.session_state.current_messages = list(st.session_state.messages)
         logger.debug(f"Affichage de la conversation actuelle : ID {conversation_id}")
         return
     
-    for conv in st.session_state.conversation_history:
-        if conv["id"] == conversation_id:
-            st.session_state.displayed_conversation_id = conversation_id
-            st.session_state.current_messages = copy.deepcopy(conv["messages"])
-            logger.debug(f"Conversation chargée pour affichage : ID {conversation_id}")
-            st.rerun()
+    if conversation_id == st.session_state.displayed_conversation_id:
+        return
+    
+    # Messages chargés à la demande depuis l'historique
+    messages = history_store.get_messages(conversation_id)
+    if messages:
+        st.session_state.displayed_conversation_id = conversation_id
+        st.session_state.current_messages = messages
+        logger.debug(f"Conversation chargée pour affichage : ID {conversation_id}")
+        st.rerun()
 
 #sidebar
 with st.sidebar:
@@ -1414,31 +957,12 @@ with st.sidebar:
     st.write("Utilisez ce chatbot pour trouver des groupes adaptés à vos besoins.")
     
     st.subheader("Historique des Conversations")
-    if st.session_state.conversation_history:
-        history_options = [
-            f"{conv['student_name']} - {conv['timestamp']}" if conv['student_name'] != "Inconnu" else f"ID: {conv['id']}"
-            for conv in sorted(st.session_state.conversation_history, key=lambda x: x['timestamp'], reverse=True)
-        ]
-        history_options = ["Conversation actuelle"] + history_options
-        selected_conversation = st.selectbox(
-            "Sélectionner une conversation",
-            options=history_options,
-            index=0,
-            key="conversation_selector"
-        )
-        if selected_conversation == "Conversation actuelle":
-            load_conversation(st.session_state.current_conversation_id)
-        else:
-            selected_index = history_options.index(selected_conversation) - 1
-            load_conversation(st.session_state.conversation_history[selected_index]["id"])
-    else:
-        st.write("Aucune conversation dans l'historique.")
+    selected_conversation_id = render_history_browser(history_store)
+    load_conversation(selected_conversation_id or st.session_state.current_conversation_id)
     
     if st.button("Réinitialiser la conversation"):
         save_conversation()
-        conversation_history = st.session_state.conversation_history
         st.session_state.clear()
-        st.session_state.conversation_history = conversation_history
         initialize_session_state()
         save_conversation()
         logger.debug("Conversation réinitialisée")
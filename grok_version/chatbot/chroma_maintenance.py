@@ -0,0 +1,160 @@
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+from collection_aliases import DEFAULT_CHROMA_PATH, read_manifest
+
+logger = logging.getLogger(__name__)
+
+SQLITE_FILE = "chroma.sqlite3"
+SEGMENT_DIR_PATTERN = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$")
+
+# Ouverture mesurée dans un processus neuf (le client Chroma garde un cache par chemin)
+OPEN_TIME_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import chromadb
+client = chromadb.PersistentClient(path=sys.argv[1])
+opened = time.perf_counter()
+for collection in client.list_collections():
+    client.get_collection(name=getattr(collection, "name", collection)).count()
+print(json.dumps({"open_s": opened - start, "open_and_count_s": time.perf_counter() - start}))
+"""
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+def _format_size(size):
+    return f"{size / 1e6:.1f} Mo"
+
+
+def inspect_store(chroma_path=DEFAULT_CHROMA_PATH):
+    """Associe chaque répertoire de segment à sa collection (table segments de chroma.sqlite3)"""
+    database = os.path.join(chroma_path, SQLITE_FILE)
+    if not os.path.exists(database):
+        raise FileNotFoundError(f"{database} introuvable : ce n'est pas un répertoire ChromaDB persistant")
+
+    connection = sqlite3.connect(f"file:{database}?mode=ro", uri=True)
+    try:
+        collections = dict(connection.execute("SELECT id, name FROM collections"))
+        segments = {segment_id: (collections.get(collection_id), scope)
+                    for segment_id, scope, collection_id in connection.execute("SELECT id, scope, collection FROM segments")}
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        connection.close()
+
+    aliases = {}
+    for alias, entry in read_manifest(chroma_path)["aliases"].items():
+        aliases[entry["collection"]] = alias
+
+    directories = []
+    for name in sorted(os.listdir(chroma_path)):
+        path = os.path.join(chroma_path, name)
+        if not os.path.isdir(path) or not SEGMENT_DIR_PATTERN.match(name):
+            continue
+        collection, scope = segments.get(name, (None, None))
+        directories.append({"segment": name, "collection": collection, "alias": aliases.get(collection), "scope": scope,
+                            "size": directory_size(path), "orphan": collection is None})
+    return {
+        "collections": sorted(collections.values()),
+        "directories": directories,
+        "sqlite_size": os.path.getsize(database),
+        "sqlite_reclaimable": page_size * free_pages,
+        "total_size": directory_size(chroma_path),
+    }
+
+
+def measure_open_time(chroma_path, runs=3):
+    """Meilleur temps d'ouverture (client + count de chaque collection) sur plusieurs processus neufs"""
+    best = None
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", OPEN_TIME_SCRIPT, chroma_path], capture_output=True, text=True)
+        if result.returncode != 0:
+            logger.warning(f"Mesure du temps d'ouverture impossible : {result.stderr.strip().splitlines()[-1:]}")
+            return None
+        timing = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or timing["open_and_count_s"] < best["open_and_count_s"]:
+            best = timing
+    return best
+
+
+def remove_orphans(chroma_path, report):
+    removed = 0
+    for directory in report["directories"]:
+        if directory["orphan"]:
+            shutil.rmtree(os.path.join(chroma_path, directory["segment"]))
+            removed += directory["size"]
+    return removed
+
+
+def vacuum(chroma_path):
+    """VACUUM du magasin de métadonnées (nécessite qu'aucun processus n'écrive dans chroma_db5)"""
+    connection = sqlite3.connect(os.path.join(chroma_path, SQLITE_FILE), timeout=30)
+    try:
+        connection.execute("VACUUM")
+        connection.execute("PRAGMA optimize")
+    finally:
+        connection.close()
+
+
+def print_report(report):
+    print(f"{'segment':<38} {'collection':<30} {'alias':<22} {'portée':<8} {'taille':>10}")
+    for directory in report["directories"]:
+        print(f"{directory['segment']:<38} {directory['collection'] or '(orpheline)':<30} {directory['alias'] or '':<22} "
+              f"{directory['scope'] or '':<8} {_format_size(directory['size']):>10}")
+    orphans = [directory for directory in report["directories"] if directory["orphan"]]
+    print(f"{len(report['collections'])} collection(s) vivante(s), {len(orphans)} répertoire(s) orphelin(s) "
+          f"({_format_size(sum(directory['size'] for directory in orphans))}), "
+          f"SQLite {_format_size(report['sqlite_size'])} dont {_format_size(report['sqlite_reclaimable'])} récupérables")
+
+
+def _print_timing(label, timing):
+    if timing:
+        print(f"{label} : ouverture {timing['open_s'] * 1000:.0f} ms, ouverture + count {timing['open_and_count_s'] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance de chroma_db5 : segments orphelins et VACUUM SQLite")
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Rapport seulement, rien n'est supprimé")
+    parser.add_argument("--no-vacuum", action="store_true")
+    parser.add_argument("--no-timing", action="store_true", help="Ne mesure pas le temps d'ouverture")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    before = inspect_store(args.chroma_path)
+    print_report(before)
+    timing_before = None if args.no_timing else measure_open_time(args.chroma_path)
+    _print_timing("Avant", timing_before)
+    if args.dry_run:
+        print("Simulation : aucun changement (relancer sans --dry-run, chatbots et ingestion arrêtés)")
+        return
+
+    removed = remove_orphans(args.chroma_path, before)
+    if not args.no_vacuum:
+        vacuum(args.chroma_path)
+    after = inspect_store(args.chroma_path)
+    print(f"Orphelins supprimés : {_format_size(removed)} ; taille totale {_format_size(before['total_size'])} -> "
+          f"{_format_size(after['total_size'])}, SQLite {_format_size(before['sqlite_size'])} -> {_format_size(after['sqlite_size'])}")
+    if not args.no_timing:
+        _print_timing("Après", measure_open_time(args.chroma_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import argparse
+import json
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_CHROMA_PATH = os.path.join(parent_dir, "chroma_db5")
+MANIFEST_FILE = "collection_aliases.json"
+FORMAT_VERSION = 1
+
+VERSION_SEPARATOR = "__v"
+GRACE_PERIOD = 6 * 3600  # secondes pendant lesquelles une version remplacée reste lisible
+MAX_COUNT_DROP = 0.5     # baisse maximale du nombre d'éléments par rapport à la version publiée
+SAMPLE_QUERIES = 5
+
+
+class ValidationError(Exception):
+    pass
+
+
+def manifest_path(chroma_path=DEFAULT_CHROMA_PATH):
+    """Le manifeste est à côté de chroma_db5 (comme catalog_snapshots)"""
+    return os.path.join(os.path.dirname(os.path.abspath(chroma_path)), MANIFEST_FILE)
+
+
+def read_manifest(chroma_path=DEFAULT_CHROMA_PATH):
+    try:
+        with open(manifest_path(chroma_path), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {"format_version": FORMAT_VERSION, "aliases": {}, "retired": []}
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Format de manifeste non supporté : {manifest.get('format_version')}")
+    return manifest
+
+
+def _write_manifest(chroma_path, manifest):
+    path = manifest_path(chroma_path)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+@contextmanager
+def _manifest_lock(chroma_path):
+    # Verrou entre scripts d'ingestion (lecture-modification-écriture du manifeste)
+    try:
+        import fcntl
+    except ImportError:
+        yield
+        return
+    with open(f"{manifest_path(chroma_path)}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def resolve_collection(alias, chroma_path=DEFAULT_CHROMA_PATH):
+    """Nom réel de la collection publiée sous cet alias (l'alias lui-même tant que rien n'est publié)"""
+    entry = read_manifest(chroma_path)["aliases"].get(alias)
+    return entry["collection"] if entry else alias
+
+
+class AliasedCollection:
+    """Collection publiée sous un alias, pour les lecteurs de longue durée (GroupSearch en cache Streamlit, service).
+
+    L'alias est re-résolu quand le manifeste change (mtime) ; une requête en échec sur une version supprimée
+    entre-temps (période de grâce écoulée) est rejouée une fois sur la version publiée.
+    """
+
+    def __init__(self, client, alias, chroma_path=DEFAULT_CHROMA_PATH, create=False):
+        self._client = client
+        self._alias = alias
+        self._chroma_path = chroma_path
+        # create : collection vide créée sous le nom de l'alias si rien n'est publié (comme get_or_create_collection)
+        self._create = create
+        self._collection = None
+        self._stamp = None
+        self.collection  # version publiée actuelle (erreur immédiate si elle n'existe pas)
+
+    def _manifest_stamp(self):
+        try:
+            return os.stat(manifest_path(self._chroma_path)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @property
+    def collection(self):
+        stamp = self._manifest_stamp()
+        if self._collection is None or stamp != self._stamp:
+            name = resolve_collection(self._alias, self._chroma_path)
+            if self._collection is None or self._collection.name != name:
+                get = self._client.get_or_create_collection if self._create and name == self._alias else self._client.get_collection
+                self._collection = get(name=name)
+            self._stamp = stamp
+        return self._collection
+
+    def __getattr__(self, attribute):
+        value = getattr(self.collection, attribute)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            stale = self._collection.name
+            try:
+                return value(*args, **kwargs)
+            except Exception:
+                self._collection = None
+                try:
+                    fresh = self.collection
+                except Exception:
+                    fresh = None
+                if fresh is None or fresh.name == stale:
+                    raise
+                logger.warning(f"{stale} n'est plus lisible : alias {self._alias} re-résolu vers {fresh.name}")
+                return getattr(fresh, attribute)(*args, **kwargs)
+        return call
+
+
+def _collection_names(client):
+    # chromadb < 0.6 renvoie des objets Collection, 0.6 des noms
+    return [getattr(collection, "name", collection) for collection in client.list_collections()]
+
+
+class CollectionPublisher:
+    """Publication bleu/vert d'une collection : construction dans une collection versionnée,
+    validation, puis bascule atomique de l'alias dans le manifeste lu par les applications."""
+
+    def __init__(self, client, alias, chroma_path=DEFAULT_CHROMA_PATH, grace_period=GRACE_PERIOD):
+        self.client = client
+        self.alias = alias
+        self.chroma_path = chroma_path
+        self.grace_period = grace_period
+
+    def _next_version(self):
+        manifest = read_manifest(self.chroma_path)
+        versions = [manifest["aliases"].get(self.alias, {}).get("version", 0)]
+        prefix = f"{self.alias}{VERSION_SEPARATOR}"
+        for name in _collection_names(self.client):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                versions.append(int(name[len(prefix):]))
+        return max(versions) + 1
+
+    def create(self):
+        """Nouvelle collection versionnée, invisible des applications jusqu'à publish()"""
+        name = f"{self.alias}{VERSION_SEPARATOR}{self._next_version()}"
+        collection = self.client.create_collection(name=name, metadata={"alias": self.alias, "created_at": time.time()})
+        print(f"Construction de {self.alias} dans {name}")
+        return collection
+
+    def validate(self, collection, min_count=1, required_keys=(), max_drop=MAX_COUNT_DROP, sample_queries=SAMPLE_QUERIES):
+        """Contrôles avant bascule : nombre d'éléments, clés de métadonnées, requêtes d'échantillon"""
+        count = collection.count()
+        if count < min_count:
+            raise ValidationError(f"{collection.name} : {count} éléments (minimum {min_count})")
+
+        live_name = resolve_collection(self.alias, self.chroma_path)
+        if live_name != collection.name and live_name in _collection_names(self.client):
+            live_count = self.client.get_collection(name=live_name).count()
+            if live_count and count < (1 - max_drop) * live_count:
+                raise ValidationError(f"{collection.name} : {count} éléments contre {live_count} dans {live_name} "
+                                      f"(baisse supérieure à {max_drop:.0%})")
+
+        ids = collection.get(include=[])["ids"]
+        sample = random.sample(ids, min(sample_queries, len(ids)))
+        data = collection.get(ids=sample, include=["metadatas", "embeddings"])
+        for id_, metadata in zip(data["ids"], data["metadatas"]):
+            missing = [key for key in required_keys if key not in (metadata or {})]
+            if missing:
+                raise ValidationError(f"{collection.name} : clés manquantes {missing} pour l'élément {id_}")
+
+        # Une requête sur le vecteur d'un élément échantillonné doit le retrouver (ou un doublon exact) en tête
+        embeddings = data.get("embeddings")
+        if embeddings is not None and len(embeddings):
+            results = collection.query(query_embeddings=[[float(value) for value in embedding] for embedding in embeddings],
+                                       n_results=1, include=["distances"])
+            for id_, found, distances in zip(data["ids"], results["ids"], results["distances"]):
+                if not found or (found[0] != id_ and distances[0] > 1e-6):
+                    raise ValidationError(f"{collection.name} : la requête d'échantillon sur {id_} renvoie {found}")
+        return count
+
+    def publish(self, collection, **validation):
+        """Valide puis bascule l'alias ; en cas d'échec la version candidate est supprimée et l'alias inchangé"""
+        try:
+            count = self.validate(collection, **validation)
+        except ValidationError:
+            self.client.delete_collection(collection.name)
+            raise
+
+        with _manifest_lock(self.chroma_path):
+            manifest = read_manifest(self.chroma_path)
+            previous = manifest["aliases"].get(self.alias, {}).get("collection")
+            if previous is None and self.alias in _collection_names(self.client):
+                previous = self.alias  # collection historique non versionnée
+            manifest["aliases"][self.alias] = {
+                "collection": collection.name,
+                "version": int(collection.name.rsplit(VERSION_SEPARATOR, 1)[1]),
+                "count": count,
+                "published_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            if previous and previous != collection.name:
+                manifest["retired"].append({"alias": self.alias, "collection": previous, "retired_at": time.time()})
+            _write_manifest(self.chroma_path, manifest)
+        print(f"Alias {self.alias} -> {collection.name} ({count} éléments)")
+
+        collect_garbage(self.client, self.chroma_path, self.grace_period)
+        return collection.name
+
+
+def collect_garbage(client, chroma_path=DEFAULT_CHROMA_PATH, grace_period=GRACE_PERIOD, now=None):
+    """Supprime les versions remplacées depuis plus que la période de grâce, et les constructions abandonnées
+    (versions jamais publiées) plus anciennes que cette période"""
+    now = now or time.time()
+    removed = []
+    with _manifest_lock(chroma_path):
+        manifest = read_manifest(chroma_path)
+        live = {entry["collection"] for entry in manifest["aliases"].values()}
+        existing = set(_collection_names(client))
+        kept = []
+        for entry in manifest["retired"]:
+            if entry["collection"] in live:
+                continue
+            if now - entry["retired_at"] < grace_period:
+                kept.append(entry)
+            elif entry["collection"] in existing:
+                client.delete_collection(entry["collection"])
+                removed.append(entry["collection"])
+        retired = {entry["collection"] for entry in kept}
+
+        for name in existing - live - retired - set(removed):
+            if VERSION_SEPARATOR not in name:
+                continue
+            created_at = (client.get_collection(name=name).metadata or {}).get("created_at", now)
+            if now - created_at >= grace_period:
+                client.delete_collection(name)
+                removed.append(name)
+
+        if len(kept) != len(manifest["retired"]):
+            manifest["retired"] = kept
+            _write_manifest(chroma_path, manifest)
+    for name in removed:
+        print(f"Collection supprimée : {name}")
+    return removed
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Alias des collections publiées dans chroma_db5")
+    parser.add_argument("command", choices=["status", "gc"])
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--grace-period", type=float, default=GRACE_PERIOD, help="Secondes")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=args.chroma_path)
+    if args.command == "gc":
+        removed = collect_garbage(client, args.chroma_path, args.grace_period)
+        print(f"{len(removed)} collection(s) supprimée(s)")
+        return
+
+    manifest = read_manifest(args.chroma_path)
+    for alias, entry in sorted(manifest["aliases"].items()):
+        print(f"{alias:<26} -> {entry['collection']:<32} {entry['count']:>8} éléments, publiée le {entry['published_at']}")
+    for entry in manifest["retired"]:
+        age = (time.time() - entry["retired_at"]) / 3600
+        print(f"  remplacée : {entry['collection']} ({entry['alias']}, il y a {age:.1f} h)")
+
+
+if __name__ == "__main__":
+    main()
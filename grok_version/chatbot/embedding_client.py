@@ -0,0 +1,79 @@
+import http.client
+import logging
+import os
+
+from json_http import JsonHttpClient
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_EMBEDDING_URL = "http://127.0.0.1:8766"
+REQUEST_CHUNK = 256  # textes par requête HTTP (le service regroupe ensuite les requêtes concurrentes)
+BACKENDS = ("torch", "onnx")
+
+
+class EmbeddingServiceError(Exception):
+    pass
+
+
+class LocalEmbedder:
+    """Modèle SentenceTransformer chargé dans le processus ; encode() retourne des listes de floats"""
+
+    def __init__(self, model_name=MODEL_NAME):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+
+    def encode(self, texts, batch_size=64):
+        single = isinstance(texts, str)
+        vectors = self.model.encode([texts] if single else list(texts), batch_size=batch_size).tolist()
+        return vectors[0] if single else vectors
+
+
+def load_local_embedder(backend=None, onnx_dir=None):
+    """Encodeur dans le processus : PyTorch float (par défaut) ou ONNX int8 (EMBEDDING_BACKEND=onnx)"""
+    backend = backend or os.getenv("EMBEDDING_BACKEND", "torch")
+    if backend == "onnx":
+        from onnx_encoder import DEFAULT_ONNX_DIR, OnnxEmbedder
+        return OnnxEmbedder(onnx_dir or os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIR))
+    if backend != "torch":
+        raise ValueError(f"Backend d'embeddings inconnu : {backend} (attendu : {', '.join(BACKENDS)})")
+    return LocalEmbedder()
+
+
+class EmbeddingClient(JsonHttpClient):
+    """Client du service d'embeddings : même encode() que LocalEmbedder, le modèle reste dans le service"""
+
+    error_class = EmbeddingServiceError
+
+    def __init__(self, base_url=DEFAULT_EMBEDDING_URL, timeout=60):
+        super().__init__(base_url, timeout)
+        self.model_name = MODEL_NAME
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def stats(self):
+        return self._request("GET", "/stats")
+
+    def encode(self, texts, batch_size=REQUEST_CHUNK):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            vectors.extend(self._request("POST", "/encode", {"texts": texts[start:start + batch_size]})["embeddings"])
+        return vectors[0] if single else vectors
+
+
+def get_embedder(base_url=None, fallback=True):
+    """Client du service d'embeddings s'il répond (EMBEDDING_SERVICE_URL), sinon modèle local"""
+    base_url = base_url or os.getenv("EMBEDDING_SERVICE_URL", DEFAULT_EMBEDDING_URL)
+    try:
+        health = EmbeddingClient(base_url, timeout=5).health()
+        logger.info(f"Service d'embeddings utilisé : {base_url} ({health.get('model')})")
+        return EmbeddingClient(base_url)
+    except (EmbeddingServiceError, OSError, http.client.HTTPException) as e:
+        if not fallback:
+            raise
+        logger.warning(f"Service d'embeddings indisponible ({base_url} : {e}) : chargement du modèle local")
+        return load_local_embedder()
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+from embedding_client import BACKENDS, DEFAULT_EMBEDDING_URL, MODEL_NAME, load_local_embedder
+from json_http import JsonHttpService, route
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 8 * 1024 * 1024
+MAX_BATCH = 64        # textes encodés ensemble au maximum
+BATCH_WINDOW_MS = 5   # attente maximale pour regrouper les requêtes concurrentes
+
+
+class MicroBatcher:
+    """Regroupe les demandes d'encodage concurrentes en un seul appel au modèle.
+
+    Un lot part dès qu'il atteint max_batch textes ou que la fenêtre est écoulée depuis la première demande ;
+    l'encodage tourne sur un thread unique (une seule instance du modèle).
+    """
+
+    def __init__(self, embedder, max_batch=MAX_BATCH, window_ms=BATCH_WINDOW_MS):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embedding")
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+        self.encode_seconds = 0.0
+
+    async def submit(self, texts):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((texts, future))
+        return await future
+
+    def start(self):
+        # File créée dans la boucle du service, avant la première connexion
+        self.queue = asyncio.Queue()
+        return asyncio.create_task(self.run())
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            count = len(batch[0][0])
+            deadline = loop.time() + self.window
+            while count < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                count += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            start = time.perf_counter()
+            try:
+                vectors = await loop.run_in_executor(self.executor, self.embedder.encode, texts, self.max_batch)
+            except Exception as e:
+                logger.exception("Erreur lors de l'encodage d'un lot")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.encode_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.texts += len(texts)
+            self.requests += len(batch)
+
+            offset = 0
+            for item_texts, future in batch:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "texts_per_second": round(self.texts / self.encode_seconds, 1) if self.encode_seconds else 0.0,
+        }
+
+
+class EmbeddingService(JsonHttpService):
+    """Service HTTP local (JSON) : une seule instance du modèle partagée par l'ingestion et les chatbots"""
+
+    max_body_size = MAX_BODY_SIZE
+
+    def __init__(self, embedder, max_batch=MAX_BATCH, window_ms=BATCH_WINDOW_MS):
+        self.embedder = embedder
+        self.batcher = MicroBatcher(embedder, max_batch, window_ms)
+
+    async def dispatch(self, method, path, body):
+        path_route = route(path)
+        if method == "GET" and path_route == "health":
+            return HTTPStatus.OK, {"status": "ok", "model": getattr(self.embedder, "model_name", MODEL_NAME)}
+        if method == "GET" and path_route == "stats":
+            return HTTPStatus.OK, self.batcher.stats()
+        if method != "POST" or path_route != "encode":
+            return HTTPStatus.NOT_FOUND, {"error": f"Route inconnue : {method} {path}"}
+
+        try:
+            texts = json.loads(body).get("texts") if body else None
+        except (json.JSONDecodeError, AttributeError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"JSON invalide : {str(e)}"}
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return HTTPStatus.BAD_REQUEST, {"error": "'texts' doit être une liste de chaînes"}
+        if not texts:
+            return HTTPStatus.OK, {"embeddings": []}
+        try:
+            return HTTPStatus.OK, {"embeddings": await self.batcher.submit(texts)}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+
+    async def serve(self, host, port):
+        batcher = self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Service d'embeddings à l'écoute sur http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def main():
+    default = urlparse(DEFAULT_EMBEDDING_URL)
+    parser = argparse.ArgumentParser(description="Service local d'embeddings (un seul modèle, micro-lots)")
+    parser.add_argument("--host", default=default.hostname)
+    parser.add_argument("--port", type=int, default=default.port)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    parser.add_argument("--window-ms", type=float, default=BATCH_WINDOW_MS)
+    parser.add_argument("--backend", choices=BACKENDS, default=None, help="torch (float) ou onnx (int8, voir onnx_encoder.py)")
+    parser.add_argument("--onnx-dir", default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    embedder = load_local_embedder(args.backend, args.onnx_dir)
+    embedder.encode(["préchauffage"])
+    service = EmbeddingService(embedder, args.max_batch, args.window_ms)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
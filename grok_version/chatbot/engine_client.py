@@ -0,0 +1,154 @@
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from json_http import JsonHttpClient
+from tariff_quotes import FRAIS_INSCRIPTION
+
+
+class EngineServiceError(Exception):
+    pass
+
+
+class EngineClient(JsonHttpClient):
+    """Client léger du service de recommandation : mêmes méthodes que RecommendationEngine."""
+
+    error_class = EngineServiceError
+
+    def __init__(self, base_url="http://127.0.0.1:8765", timeout=30):
+        super().__init__(base_url, timeout)
+
+    def _call(self, operation, **kwargs):
+        return self._request("POST", f"/{operation}", kwargs)["result"]
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    @property
+    def catalog_version(self):
+        return self.health()["catalog_version"]
+
+    def vocabularies(self):
+        return self._call("vocabularies")
+
+    def refresh(self):
+        return self._call("refresh")
+
+    def get_available_forfaits(self, level, subject):
+        return self._call("get_available_forfaits", level=level, subject=subject)
+
+    def get_recommendations(self, student_name, user_level, user_subjects, user_teachers, user_school, user_center, selected_forfaits, selected_types_duree, forfaits_info):
+        output, recommendations, groups_for_selection, matched_subjects = self._call(
+            "get_recommendations", student_name=student_name, user_level=user_level, user_subjects=user_subjects,
+            user_teachers=user_teachers, user_school=user_school, user_center=user_center,
+            selected_forfaits=selected_forfaits, selected_types_duree=selected_types_duree, forfaits_info=forfaits_info)
+        return output, recommendations, groups_for_selection, matched_subjects
+
+    def calculate_tariffs(self, selected_groups, user_duree_types, user_type_duree_ids, forfaits_info):
+        tariffs_by_group, tariff_message, total_tariff_base = self._call(
+            "calculate_tariffs", selected_groups=selected_groups, user_duree_types=user_duree_types,
+            user_type_duree_ids=user_type_duree_ids, forfaits_info=forfaits_info)
+        return tariffs_by_group, tariff_message, total_tariff_base
+
+    def quote_tariffs(self, selections, include_fees=False, fee=FRAIS_INSCRIPTION):
+        return self._call("quote_tariffs", selections=list(selections), include_fees=include_fees, fee=fee)
+
+    def check_overlaps(self, selected_groups):
+        # JSON renvoie des listes : on restitue les paires sous forme de tuples
+        return [tuple(pair) for pair in self._call("check_overlaps", selected_groups=selected_groups)]
+
+    def get_groups(self, ids):
+        return self._call("get_groups", ids=list(ids))
+
+    def find_student(self, student_name):
+        return self._call("find_student", student_name=student_name)
+
+    def cache_stats(self):
+        return self._call("cache_stats")
+
+
+def load_test(client, sessions=20, requests_per_session=10, level="BL - 2bac sc PC", subject="Mathématiques",
+              school="", center=""):
+    """Simule plusieurs conseillers concurrents et mesure latences et débit du service.
+
+    Chaque itération suit le parcours d'un conseiller : forfaits disponibles, recommandations pour le premier
+    forfait et type de durée proposés, tarifs et chevauchements du premier groupe recommandé.
+    """
+    latencies = {}
+    errors = []
+    lock = threading.Lock()
+
+    def timed(operation, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        with lock:
+            latencies.setdefault(operation, []).append(time.perf_counter() - start)
+        return result
+
+    def session():
+        for _ in range(requests_per_session):
+            try:
+                forfaits = timed("get_available_forfaits", client.get_available_forfaits, level, subject)
+                if not forfaits:
+                    continue
+                id_forfait, forfait = next(iter(forfaits.items()))
+                if not forfait["types_duree"]:
+                    continue
+                type_duree_id, type_duree = next(iter(forfait["types_duree"].items()))
+                forfaits_info = {subject: forfaits}
+                _, _, groups_for_selection, _ = timed(
+                    "get_recommendations", client.get_recommendations, "Test de charge", level, subject, None, school, center,
+                    {subject: id_forfait}, {subject: type_duree_id}, forfaits_info)
+                groups = groups_for_selection.get(subject) or []
+                if not groups:
+                    continue
+                selected_groups = {subject: groups[0]}
+                timed("calculate_tariffs", client.calculate_tariffs, selected_groups, {subject: type_duree["name"]},
+                      {subject: type_duree_id}, forfaits_info)
+                timed("check_overlaps", client.check_overlaps, selected_groups)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        for _ in range(sessions):
+            executor.submit(session)
+    elapsed = time.perf_counter() - start
+
+    requests = sum(len(values) for values in latencies.values())
+    report = {"sessions": sessions, "requests": requests, "errors": len(errors),
+              "elapsed_s": round(elapsed, 3), "throughput_rps": round(requests / elapsed, 1) if elapsed else 0.0}
+    for operation, values in latencies.items():
+        values.sort()
+        report[operation] = {
+            "requests": len(values),
+            "p50_ms": round(statistics.median(values) * 1000, 2),
+            "p95_ms": round(values[int(0.95 * (len(values) - 1))] * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+        }
+    if errors:
+        report["first_error"] = errors[0]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test de charge du service de recommandation")
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--sessions", type=int, default=20, help="Nombre de conseillers simultanés")
+    parser.add_argument("--requests", type=int, default=10, help="Requêtes par conseiller")
+    parser.add_argument("--level", default="BL - 2bac sc PC")
+    parser.add_argument("--subject", default="Mathématiques")
+    parser.add_argument("--school", default="")
+    parser.add_argument("--center", default="")
+    args = parser.parse_args()
+
+    client = EngineClient(args.url)
+    print(json.dumps(load_test(client, args.sessions, args.requests, args.level, args.subject, args.school, args.center), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from catalog import GroupRecord
+from history_store import ConversationStore
+from json_http import JsonHttpService, route
+from recommendation_cache import RECOMMENDATION_CACHE_SIZE, WARM_UP_HISTORY, WARM_UP_PROFILES, mine_profiles
+from recommendation_engine import RecommendationEngine, DEFAULT_CHROMA_PATH
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Opérations exposées : nom de route -> méthode du moteur
+OPERATIONS = {
+    "get_available_forfaits": "get_available_forfaits",
+    "get_recommendations": "get_recommendations",
+    "calculate_tariffs": "calculate_tariffs",
+    "quote_tariffs": "quote_tariffs",
+    "check_overlaps": "check_overlaps",
+    "get_groups": "get_groups",
+    "find_student": "find_student",
+    "vocabularies": "vocabularies",
+    "refresh": "refresh",
+    "cache_stats": "cache_stats",
+}
+
+
+class EngineService(JsonHttpService):
+    """Service HTTP local (JSON) partageant un seul RecommendationEngine entre toutes les sessions.
+
+    Les requêtes sont lues en asynchrone ; les appels au moteur (bloquants) passent par un pool de threads.
+    """
+
+    @staticmethod
+    def json_default(value):
+        # Les groupes du catalogue sont envoyés sous forme de dict
+        if isinstance(value, GroupRecord):
+            return value.as_dict()
+        return JsonHttpService.json_default(value)
+
+    def __init__(self, engine, workers=None):
+        self.engine = engine
+        self.executor = ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) + 4),
+                                           thread_name_prefix="engine")
+
+    async def dispatch(self, method, path, body):
+        operation = route(path)
+        if method == "GET" and operation == "health":
+            return HTTPStatus.OK, {"status": "ok", "catalog_version": self.engine.catalog_version}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Méthode non supportée : {method}"}
+        if operation not in OPERATIONS:
+            return HTTPStatus.NOT_FOUND, {"error": f"Opération inconnue : {operation}"}
+
+        try:
+            kwargs = json.loads(body) if body else {}
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"JSON invalide : {str(e)}"}
+        if not isinstance(kwargs, dict):
+            return HTTPStatus.BAD_REQUEST, {"error": "Le corps doit être un objet JSON"}
+
+        function = getattr(self.engine, OPERATIONS[operation])
+        # Arguments validés avant l'appel : seule cette erreur est imputable au client (400), les autres sont des 500
+        try:
+            inspect.signature(function).bind(**kwargs)
+        except TypeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Arguments invalides pour {operation} : {str(e)}"}
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self.executor, lambda: function(**kwargs))
+        except Exception as e:
+            logger.exception(f"Erreur lors de l'opération {operation}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+        return HTTPStatus.OK, {"result": result}
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        logger.info(f"Service de recommandation à l'écoute sur http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service local du moteur de recommandation (partagé entre les sessions)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="Taille du pool de threads du moteur")
+    parser.add_argument("--cache-size", type=int, default=RECOMMENDATION_CACHE_SIZE, help="Entrées du cache de recommandations (0 = désactivé)")
+    parser.add_argument("--warm-up", type=int, default=WARM_UP_PROFILES, help="Profils fréquents de l'historique à pré-calculer (0 = aucun)")
+    parser.add_argument("--history-db", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "conversation_history.db"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = RecommendationEngine(args.chroma_path, cache_size=args.cache_size)
+    if args.warm_up and os.path.exists(args.history_db):
+        engine.warm_up(mine_profiles(ConversationStore(args.history_db).load_states(WARM_UP_HISTORY), args.warm_up))
+    service = EngineService(engine, workers=args.workers)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
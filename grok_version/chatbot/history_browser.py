@@ -0,0 +1,48 @@
+import streamlit as st
+
+# Nombre d'en-têtes de conversation chargés par page dans la sidebar
+PAGE_SIZE = 20
+CURRENT_LABEL = "Conversation actuelle"
+
+
+def _change_page(page_key, delta):
+    st.session_state[page_key] = max(0, st.session_state.get(page_key, 0) + delta)
+
+
+def render_history_browser(store, page_size=PAGE_SIZE, key_prefix="history"):
+    """Affiche l'historique paginé avec recherche. Retourne l'id choisi, ou None pour la conversation actuelle."""
+    page_key = f"{key_prefix}_page"
+    search_key = f"{key_prefix}_search"
+    last_search_key = f"{key_prefix}_last_search"
+
+    search = st.text_input("Rechercher (nom ou message)", key=search_key, placeholder="Ex: Kenza, Mathématiques")
+    if st.session_state.get(last_search_key) != search:
+        # Nouvelle recherche : revenir à la première page
+        st.session_state[page_key] = 0
+        st.session_state[last_search_key] = search
+
+    total = store.count_conversation_headers(search)
+    if total == 0:
+        st.write("Aucune conversation trouvée." if search else "Aucune conversation dans l'historique.")
+        return None
+
+    page_count = (total + page_size - 1) // page_size
+    page = min(st.session_state.get(page_key, 0), page_count - 1)
+    headers = store.list_conversation_headers(page_size, page * page_size, search)
+
+    options = {CURRENT_LABEL: None}
+    for header in headers:
+        label = f"{header['student_name']} - {header['timestamp']}" if header['student_name'] != "Inconnu" else f"ID: {header['id']}"
+        if label in options:
+            label = f"{label} ({header['id'][:8]})"
+        options[label] = header['id']
+
+    selected = st.selectbox("Sélectionner une conversation", options=list(options), index=0, key=f"{key_prefix}_selector")
+
+    col_prev, col_next = st.columns(2)
+    col_prev.button("◀ Précédent", key=f"{key_prefix}_prev", disabled=page == 0,
+                    on_click=_change_page, args=(page_key, -1))
+    col_next.button("Suivant ▶", key=f"{key_prefix}_next", disabled=page >= page_count - 1,
+                    on_click=_change_page, args=(page_key, 1))
+    st.caption(f"Page {page + 1}/{page_count} – {total} conversation(s)")
+    return options[selected]
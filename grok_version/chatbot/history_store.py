@@ -0,0 +1,392 @@
+import sqlite3
+import json
+import os
+import threading
+import logging
+import argparse
+import re
+
+logger = logging.getLogger(__name__)
+
+# Schéma de l'historique : une ligne par conversation, une ligne par message (ajout seulement)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    student_name TEXT NOT NULL DEFAULT 'Inconnu',
+    timestamp TEXT NOT NULL,
+    responses TEXT NOT NULL DEFAULT '{}',
+    matched_subjects TEXT NOT NULL DEFAULT '[]',
+    selected_groups TEXT NOT NULL DEFAULT '{}',
+    tariffs_by_group TEXT NOT NULL DEFAULT '{}',
+    total_tariff_base REAL NOT NULL DEFAULT 0,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    html TEXT NOT NULL,
+    is_bot INTEGER NOT NULL,
+    PRIMARY KEY (conversation_id, position)
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_student_name ON conversations(student_name);
+CREATE INDEX IF NOT EXISTS idx_conversations_timestamp ON conversations(timestamp);
+"""
+
+# Index plein texte sur le texte brut des messages (FTS5, accents ignorés)
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    conversation_id UNINDEXED,
+    text,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# Recherche par préfixe sur le nom de l'étudiant (index insensible à la casse pour LIKE)
+NAME_INDEX = "CREATE INDEX IF NOT EXISTS idx_conversations_student_name_nocase ON conversations(student_name COLLATE NOCASE);"
+
+TAG_RE = re.compile(r"<[^>]+>")
+
+# Champs d'état sérialisés en JSON dans la table conversations
+STATE_FIELDS = ["responses", "matched_subjects", "selected_groups", "tariffs_by_group"]
+STATE_DEFAULTS = {"responses": {}, "matched_subjects": [], "selected_groups": {}, "tariffs_by_group": {}}
+
+
+class ConversationStore:
+    """Historique des conversations dans SQLite (mode WAL), partagé entre les sessions Streamlit."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.execute(NAME_INDEX)
+        self.fts_enabled = self._init_fts(conn)
+
+    def _connection(self):
+        # Une connexion par thread : Streamlit exécute chaque session dans son propre thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def _init_fts(self, conn):
+        """Crée l'index plein texte (et le remplit pour une base existante). Retourne False si FTS5 est absent."""
+        existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone() is not None
+        try:
+            conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 indisponible, recherche par LIKE : {str(e)}")
+            return False
+        if not existed:
+            with self._transaction() as tx:
+                tx.executemany(
+                    "INSERT INTO messages_fts (conversation_id, text) VALUES (?, ?)",
+                    ((m["conversation_id"], plain_text(m["html"])) for m in tx.execute("SELECT conversation_id, html FROM messages"))
+                )
+        return True
+
+    def save_conversation(self, conversation_id, student_name, timestamp, messages, responses=None,
+                          matched_subjects=None, selected_groups=None, tariffs_by_group=None,
+                          total_tariff_base=0):
+        """Enregistre l'état de la conversation et ajoute uniquement les nouveaux messages."""
+        state = {
+            "responses": responses or {},
+            "matched_subjects": matched_subjects or [],
+            "selected_groups": selected_groups or {},
+            "tariffs_by_group": tariffs_by_group or {},
+        }
+        with self._transaction() as conn:
+            row = conn.execute("SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            stored_count = row["message_count"] if row else 0
+            if len(messages) < stored_count:
+                # La liste a été réinitialisée : on repart de zéro pour cette conversation
+                self._delete_messages(conn, conversation_id)
+                stored_count = 0
+            conn.execute(
+                """
+                INSERT INTO conversations (id, student_name, timestamp, responses, matched_subjects,
+                                           selected_groups, tariffs_by_group, total_tariff_base, message_count)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    student_name = excluded.student_name,
+                    timestamp = excluded.timestamp,
+                    responses = excluded.responses,
+                    matched_subjects = excluded.matched_subjects,
+                    selected_groups = excluded.selected_groups,
+                    tariffs_by_group = excluded.tariffs_by_group,
+                    total_tariff_base = excluded.total_tariff_base,
+                    message_count = excluded.message_count
+                """,
+                (
+                    conversation_id,
+                    student_name or "Inconnu",
+                    timestamp,
+                    *(json.dumps(state[field], ensure_ascii=False) for field in STATE_FIELDS),
+                    float(total_tariff_base or 0),
+                    len(messages),
+                ),
+            )
+            self._append_messages(conn, conversation_id, messages[stored_count:], stored_count)
+        logger.debug(f"Conversation {conversation_id} sauvegardée ({len(messages) - stored_count} nouveau(x) message(s))")
+
+    def save_delta(self, conversation_id, student_name, timestamp, new_messages, start_position,
+                   changed_state=None, total_tariff_base=None, reset=False):
+        """Écrit uniquement les changements : nouveaux messages et champs d'état modifiés (JSON déjà sérialisé)."""
+        changed_state = changed_state or {}
+        unknown_fields = set(changed_state) - set(STATE_FIELDS)
+        if unknown_fields:
+            raise ValueError(f"Champs d'état inconnus : {sorted(unknown_fields)}")
+        with self._transaction() as conn:
+            if reset:
+                self._delete_messages(conn, conversation_id)
+            conn.execute(
+                """
+                INSERT INTO conversations (id, student_name, timestamp, message_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    student_name = excluded.student_name,
+                    timestamp = excluded.timestamp,
+                    message_count = excluded.message_count
+                """,
+                (conversation_id, student_name or "Inconnu", timestamp, start_position + len(new_messages)),
+            )
+            for field, serialized in changed_state.items():
+                conn.execute(f"UPDATE conversations SET {field} = ? WHERE id = ?", (serialized, conversation_id))
+            if total_tariff_base is not None:
+                conn.execute("UPDATE conversations SET total_tariff_base = ? WHERE id = ?",
+                             (float(total_tariff_base or 0), conversation_id))
+            self._append_messages(conn, conversation_id, new_messages, start_position)
+
+    def _append_messages(self, conn, conversation_id, new_messages, start_position):
+        conn.executemany(
+            "INSERT INTO messages (conversation_id, position, html, is_bot) VALUES (?, ?, ?, ?)",
+            [
+                (conversation_id, position, html, int(bool(is_bot)))
+                for position, (html, is_bot) in enumerate(new_messages, start_position)
+            ],
+        )
+        if self.fts_enabled:
+            conn.executemany(
+                "INSERT INTO messages_fts (conversation_id, text) VALUES (?, ?)",
+                [(conversation_id, plain_text(html)) for html, _ in new_messages],
+            )
+
+    def _delete_messages(self, conn, conversation_id):
+        conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        if self.fts_enabled:
+            conn.execute("DELETE FROM messages_fts WHERE conversation_id = ?", (conversation_id,))
+
+    def get_conversation(self, conversation_id):
+        """Retourne une conversation complète au format de conversation_history.json, ou None."""
+        conn = self._connection()
+        row = conn.execute("SELECT * FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        messages = conn.execute(
+            "SELECT html, is_bot FROM messages WHERE conversation_id = ? ORDER BY position",
+            (conversation_id,),
+        ).fetchall()
+        return self._row_to_conversation(row, [(m["html"], bool(m["is_bot"])) for m in messages])
+
+    def get_messages(self, conversation_id):
+        """Retourne uniquement les messages d'une conversation (chargement à la demande)."""
+        rows = self._connection().execute(
+            "SELECT html, is_bot FROM messages WHERE conversation_id = ? ORDER BY position",
+            (conversation_id,),
+        ).fetchall()
+        return [(m["html"], bool(m["is_bot"])) for m in rows]
+
+    def list_conversation_headers(self, limit=20, offset=0, search=None):
+        """Retourne une page d'en-têtes (id, nom, date, nombre de messages), du plus récent au plus ancien."""
+        where, params = self._search_clause(search)
+        rows = self._connection().execute(
+            f"""
+            SELECT id, student_name, timestamp, message_count FROM conversations
+            {where}
+            ORDER BY timestamp DESC
+            LIMIT ? OFFSET ?
+            """,
+            (*params, limit, offset),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count_conversation_headers(self, search=None):
+        where, params = self._search_clause(search)
+        return self._connection().execute(f"SELECT COUNT(*) FROM conversations {where}", params).fetchone()[0]
+
+    def _search_clause(self, search):
+        """Filtre : préfixe du nom de l'étudiant OU texte des messages (plein texte si FTS5)."""
+        search = (search or "").strip()
+        if not search:
+            return "", ()
+        name_prefix = search.replace("%", "").replace("_", "") + "%"
+        if self.fts_enabled:
+            tokens = re.findall(r"\w+", search)
+            if tokens:
+                fts_query = " ".join(f'"{token}"*' for token in tokens)
+                return (
+                    "WHERE student_name LIKE ? OR id IN (SELECT conversation_id FROM messages_fts WHERE messages_fts MATCH ?)",
+                    (name_prefix, fts_query),
+                )
+            return "WHERE student_name LIKE ?", (name_prefix,)
+        return (
+            "WHERE student_name LIKE ? OR id IN (SELECT conversation_id FROM messages WHERE html LIKE ?)",
+            (name_prefix, f"%{search}%"),
+        )
+
+    def load_conversations(self):
+        """Retourne toutes les conversations (du plus récent au plus ancien)."""
+        conn = self._connection()
+        rows = conn.execute("SELECT * FROM conversations ORDER BY timestamp DESC").fetchall()
+        messages_by_id = {}
+        for m in conn.execute("SELECT conversation_id, html, is_bot FROM messages ORDER BY conversation_id, position"):
+            messages_by_id.setdefault(m["conversation_id"], []).append((m["html"], bool(m["is_bot"])))
+        return [self._row_to_conversation(row, messages_by_id.get(row["id"], [])) for row in rows]
+
+    def load_states(self, limit=None):
+        """Réponses enregistrées des conversations les plus récentes (sans les messages)."""
+        query = "SELECT responses FROM conversations ORDER BY timestamp DESC"
+        rows = self._connection().execute(query + " LIMIT ?", (limit,)) if limit else self._connection().execute(query)
+        return [json.loads(row["responses"]) for row in rows]
+
+    def count_conversations(self):
+        return self._connection().execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+
+    def migrate_from_json(self, json_path):
+        """Importe un fichier conversation_history.json existant. Retourne le nombre de conversations importées."""
+        with open(json_path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+        imported = 0
+        for conv in history:
+            try:
+                self.save_conversation(
+                    conv["id"],
+                    conv.get("student_name", "Inconnu"),
+                    conv.get("timestamp", ""),
+                    [(html, is_bot) for html, is_bot in conv.get("messages", [])],
+                    conv.get("responses"),
+                    conv.get("matched_subjects"),
+                    conv.get("selected_groups"),
+                    conv.get("tariffs_by_group"),
+                    conv.get("total_tariff_base", 0),
+                )
+                imported += 1
+            except (KeyError, ValueError, TypeError) as e:
+                logger.error(f"Conversation ignorée lors de la migration ({conv.get('id', 'sans id')}) : {str(e)}")
+        return imported
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    @staticmethod
+    def _row_to_conversation(row, messages):
+        conversation = {
+            "id": row["id"],
+            "student_name": row["student_name"],
+            "timestamp": row["timestamp"],
+            "messages": messages,
+        }
+        for field in STATE_FIELDS:
+            conversation[field] = json.loads(row[field])
+        conversation["total_tariff_base"] = row["total_tariff_base"]
+        return conversation
+
+
+class ConversationTracker:
+    """Mémorise ce qui a déjà été persisté pour une conversation afin de n'écrire que les deltas.
+
+    Les messages sont des tuples immuables (html, is_bot) ajoutés en fin de liste : il suffit de
+    retenir combien ont été sauvegardés et le dernier d'entre eux pour détecter une réinitialisation.
+    """
+
+    def __init__(self, conversation_id):
+        self.conversation_id = conversation_id
+        self.saved_count = 0
+        self.last_saved_message = None
+        self.state_snapshots = {}
+        self.total_tariff_base = None
+        self.first_save = True
+
+    def save(self, store, student_name, timestamp, messages, state, total_tariff_base=0):
+        """Persiste les messages ajoutés et les champs d'état modifiés. Retourne le nombre de messages écrits."""
+        reset = (
+            self.first_save
+            or len(messages) < self.saved_count
+            or (self.saved_count > 0 and messages[self.saved_count - 1] != self.last_saved_message)
+        )
+        start = 0 if reset else self.saved_count
+
+        changed_state = {}
+        for field in STATE_FIELDS:
+            serialized = json.dumps(state.get(field) or STATE_DEFAULTS[field], ensure_ascii=False, sort_keys=True)
+            if reset or self.state_snapshots.get(field) != serialized:
+                changed_state[field] = serialized
+        total_changed = reset or total_tariff_base != self.total_tariff_base
+
+        new_messages = messages[start:]
+        store.save_delta(
+            self.conversation_id, student_name, timestamp, new_messages, start,
+            changed_state, total_tariff_base if total_changed else None, reset
+        )
+
+        self.state_snapshots.update(changed_state)
+        self.total_tariff_base = total_tariff_base
+        self.saved_count = len(messages)
+        self.last_saved_message = messages[-1] if messages else None
+        self.first_save = False
+        return len(new_messages)
+
+
+def plain_text(html):
+    """Texte brut d'un message HTML (pour l'index de recherche)."""
+    return " ".join(TAG_RE.sub(" ", html).split())
+
+
+class _Transaction:
+    """Transaction explicite (BEGIN IMMEDIATE) pour sérialiser les écritures concurrentes."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+
+
+def main():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    parent_dir = os.path.dirname(current_dir)
+    parser = argparse.ArgumentParser(description="Migration de conversation_history.json vers SQLite")
+    parser.add_argument("--json", default=os.path.join(parent_dir, "conversation_history.json"))
+    parser.add_argument("--db", default=os.path.join(parent_dir, "conversation_history.db"))
+    args = parser.parse_args()
+
+    if not os.path.exists(args.json):
+        print(f"Fichier introuvable : {args.json}")
+        return
+    store = ConversationStore(args.db)
+    imported = store.migrate_from_json(args.json)
+    print(f"{imported} conversation(s) importée(s) dans {args.db} (total : {store.count_conversations()}).")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
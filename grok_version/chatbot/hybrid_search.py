@@ -0,0 +1,161 @@
+import argparse
+import json
+import logging
+import random
+import time
+
+from lexical_index import DEFAULT_BM25_PATH, load_or_build
+from semantic_search import DEFAULT_CHROMA_PATH, GroupSearch, SearchHit
+from tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+# Fusion par rang réciproque : score = somme des poids / (RRF_K + rang)
+VECTOR_WEIGHT = 1.0
+LEXICAL_WEIGHT = 1.0
+RRF_K = 60
+CANDIDATE_DEPTH = 50  # candidats pris dans chaque classement avant fusion
+
+MODES = {"vector": (1.0, 0.0), "lexical": (0.0, 1.0)}
+
+
+def reciprocal_rank_fusion(rankings, weights, rrf_k=RRF_K):
+    """rankings : listes d'identifiants classés ; retourne [(id, score)] par score décroissant"""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        if not weight:
+            continue
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
+
+
+def _matches(group, filters, subject):
+    return group is not None and (not subject or group.matiere == subject) and all(
+        not filters.get(key) or getattr(group, key) == filters[key] for key in ("niveau", "centre", "jour"))
+
+
+class HybridGroupSearch:
+    """Recherche hybride : BM25 sur les champs de description (noms propres) + vecteurs MiniLM, fusionnés par RRF"""
+
+    def __init__(self, search, index=None, index_path=DEFAULT_BM25_PATH, vector_weight=VECTOR_WEIGHT,
+                 lexical_weight=LEXICAL_WEIGHT, rrf_k=RRF_K, depth=CANDIDATE_DEPTH):
+        self.vector = search
+        self.index = index or load_or_build(index_path, search.catalog)
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.rrf_k = rrf_k
+        self.depth = depth
+
+    def search(self, text, k=3, filters=None, vector_weight=None, lexical_weight=None):
+        """Jusqu'à k groupes par matière, mêmes filtres et même format que GroupSearch.search"""
+        vector_weight = self.vector_weight if vector_weight is None else vector_weight
+        lexical_weight = self.lexical_weight if lexical_weight is None else lexical_weight
+        catalog = self.vector.catalog
+        filters = filters or self.vector.parse_request(text)
+        subjects = filters.get("matieres") or [None]
+
+        vector_hits = self.vector.search(text, k=self.depth, filters=filters) if vector_weight else {}
+        hits = {}
+        for subject in subjects:
+            distances = {hit.group.id_cours: hit.distance for hit in vector_hits.get(subject or "*", [])}
+            lexical = []
+            if lexical_weight:
+                lexical = [doc_id for doc_id, _ in self.index.search(
+                    text, self.depth, accept=lambda doc_id: _matches(catalog.get(doc_id), filters, subject))]
+            fused = reciprocal_rank_fusion([list(distances), lexical], [vector_weight, lexical_weight], self.rrf_k)
+
+            ranked = []
+            for doc_id, score in fused[:k]:
+                group = catalog.get(doc_id)
+                if group is not None:
+                    ranked.append(SearchHit(group, subject or group.matiere, distances.get(doc_id), len(ranked) + 1, score))
+            hits[subject or "*"] = ranked
+        return hits
+
+
+def generate_labels(catalog, count=100, seed=7):
+    """Jeu de requêtes étiquetées tiré du catalogue : enseignant + centre + matière (noms propres),
+    pertinents = tous les groupes qui partagent ces trois champs"""
+    rng = random.Random(seed)
+    groups = list(catalog)
+    labels = []
+    for _ in range(count):
+        group = rng.choice(groups)
+        relevant = [g.id_cours for g in groups
+                    if g.teacher == group.teacher and g.centre == group.centre and g.matiere == group.matiere]
+        labels.append({"query": f"{group.matiere} avec {group.teacher} à {group.centre}", "relevant": relevant})
+    return labels
+
+
+def read_labels(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(hybrid, labels, k=3):
+    """Rappel@k, MRR et latence pour chaque mode (vecteurs seuls, BM25 seul, hybride)"""
+    modes = dict(MODES, hybrid=(hybrid.vector_weight, hybrid.lexical_weight))
+    report = {}
+    for mode, (vector_weight, lexical_weight) in modes.items():
+        latencies, recalls, reciprocal_ranks = [], [], []
+        for label in labels:
+            relevant = {str(doc_id) for doc_id in label["relevant"]}
+            start = time.perf_counter()
+            hits = hybrid.search(label["query"], k=k, vector_weight=vector_weight, lexical_weight=lexical_weight)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            found = [hit.group.id_cours for ranked in hits.values() for hit in ranked]
+            recalls.append(len(set(found) & relevant) / min(k, len(relevant)) if relevant else 1.0)
+            first = next((rank for rank, doc_id in enumerate(found, 1) if doc_id in relevant), None)
+            reciprocal_ranks.append(1 / first if first else 0.0)
+        latencies.sort()
+        report[mode] = {
+            f"recall_at_{k}": round(sum(recalls) / len(recalls), 4),
+            "mrr": round(sum(reciprocal_ranks) / len(reciprocal_ranks), 4),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche hybride BM25 + vecteurs et évaluation sur requêtes étiquetées")
+    parser.add_argument("query", nargs="?", help="Requête libre (sans requête : évaluation)")
+    parser.add_argument("--labels", help="JSONL {\"query\": ..., \"relevant\": [id_cours, ...]}")
+    parser.add_argument("--generate-labels", type=int, metavar="N", help="Tire N requêtes étiquetées du catalogue")
+    parser.add_argument("--save-labels", help="Enregistre les requêtes générées (à relire et corriger à la main)")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--vector-weight", type=float, default=VECTOR_WEIGHT)
+    parser.add_argument("--lexical-weight", type=float, default=LEXICAL_WEIGHT)
+    parser.add_argument("--rrf-k", type=int, default=RRF_K)
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--bm25-path", default=DEFAULT_BM25_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    hybrid = HybridGroupSearch(GroupSearch(chroma_path=args.chroma_path), index_path=args.bm25_path,
+                               vector_weight=args.vector_weight, lexical_weight=args.lexical_weight, rrf_k=args.rrf_k)
+    if args.query:
+        for subject, hits in hybrid.search(args.query, k=args.k).items():
+            print(f"--- {subject}")
+            for hit in hits:
+                group = hit.group
+                print(f"  {hit.rank}. [{group.id_cours}] {group.name_cours} - {group.teacher}, {group.centre}, "
+                      f"{group.jour} {group.heure_debut}-{group.heure_fin} (score {hit.score:.4f})")
+        return
+
+    labels = read_labels(args.labels) if args.labels else generate_labels(hybrid.vector.catalog, args.generate_labels or 100)
+    if args.save_labels:
+        with open(args.save_labels, "w", encoding="utf-8") as f:
+            for label in labels:
+                f.write(json.dumps(label, ensure_ascii=False) + "\n")
+        print(f"{len(labels)} requêtes étiquetées enregistrées dans {args.save_labels}")
+
+    print(f"{len(labels)} requêtes, k={args.k}, poids vecteurs={args.vector_weight}, BM25={args.lexical_weight}, rrf_k={args.rrf_k}")
+    for mode, metrics in evaluate(hybrid, labels, args.k).items():
+        print(f"{mode:<8} " + "  ".join(f"{key} {value}" for key, value in metrics.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import ast
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Budget de démarrage à froid (imports de haut niveau d'un point d'entrée), en millisecondes
+COLD_START_BUDGET_MS = 3000
+
+# Modules lourds qui ne doivent jamais être importés au démarrage d'un bot
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "tensorflow", "onnxruntime")
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def top_level_imports(path):
+    """Instructions d'import exécutées au chargement du script (hors fonctions et classes)"""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source, filename=path)
+    statements = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            statements.append(ast.get_source_segment(source, node))
+        elif isinstance(node, ast.Try):
+            # import optionnel : try/except ImportError
+            for child in node.body:
+                if isinstance(child, (ast.Import, ast.ImportFrom)):
+                    statements.append(ast.get_source_segment(source, child))
+    return statements
+
+
+def profile_imports(path, python=sys.executable):
+    """Exécute les imports du script sous -X importtime dans un processus neuf et agrège les résultats"""
+    code = "\n".join(top_level_imports(path))
+    start = time.perf_counter()
+    result = subprocess.run([python, "-X", "importtime", "-c", code], cwd=os.path.dirname(os.path.abspath(path)),
+                            capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+
+    modules = []
+    error = None
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules.append({"module": name, "self_ms": int(self_us) / 1000,
+                            "cumulative_ms": int(cumulative_us) / 1000, "depth": len(indent) // 2})
+        elif line.strip():
+            error = line.strip()
+
+    top_level = [m for m in modules if m["depth"] == 0]
+    imported = {m["module"] for m in modules}
+    return {
+        "entry_point": os.path.basename(path),
+        "ok": result.returncode == 0,
+        "error": error if result.returncode != 0 else None,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(m["cumulative_ms"] for m in top_level), 1),
+        "module_count": len(modules),
+        "heavy_modules": sorted(m for m in HEAVY_MODULES if m in imported),
+        "slowest": sorted(top_level, key=lambda m: m["cumulative_ms"], reverse=True)[:10],
+    }
+
+
+def check_report(report, budget_ms=COLD_START_BUDGET_MS):
+    """Liste des problèmes d'un rapport (vide si le point d'entrée respecte le budget)"""
+    problems = []
+    if not report["ok"]:
+        problems.append(f"imports en échec : {report['error']}")
+    if report["heavy_modules"]:
+        problems.append(f"modules lourds importés au démarrage : {', '.join(report['heavy_modules'])}")
+    if report["import_ms"] > budget_ms:
+        problems.append(f"imports en {report['import_ms']:.0f} ms (budget {budget_ms} ms)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profil -X importtime des points d'entrée des chatbots")
+    parser.add_argument("entry_points", nargs="*", help="Scripts à profiler (défaut : chatbot*.py)")
+    parser.add_argument("--budget-ms", type=int, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--json", dest="json_path", help="Écrire le rapport complet dans ce fichier JSON")
+    args = parser.parse_args()
+
+    entry_points = args.entry_points or sorted(glob.glob(os.path.join(current_dir, "chatbot*.py")))
+    reports = []
+    failed = False
+    for path in entry_points:
+        try:
+            report = profile_imports(path)
+        except SyntaxError as e:
+            report = {"entry_point": os.path.basename(path), "ok": False, "error": f"SyntaxError: {e}",
+                      "wall_ms": 0.0, "import_ms": 0.0, "module_count": 0, "heavy_modules": [], "slowest": []}
+        report["problems"] = check_report(report, args.budget_ms)
+        failed = failed or bool(report["problems"])
+        reports.append(report)
+
+        status = "OK " if not report["problems"] else "KO "
+        print(f"{status} {report['entry_point']:<32} {report['import_ms']:>8.1f} ms  {report['module_count']:>5} modules")
+        for module in report["slowest"][:3]:
+            print(f"      {module['module']:<30} {module['cumulative_ms']:>8.1f} ms")
+        for problem in report["problems"]:
+            print(f"      ! {problem}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"budget_ms": args.budget_ms, "reports": reports}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "state.json"
+WORKERS = 4
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Stage:
+    """Étape de l'ingestion : func(context, inputs) où inputs = {dépendance: résultat}.
+
+    Le résultat d'une étape terminée est conservé dans le point de reprise (pickle) pour les étapes suivantes.
+    """
+
+    __slots__ = ("name", "func", "deps")
+
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps})"
+
+
+class Checkpoint:
+    """Point de reprise sur disque : state.json (étapes terminées, durées) et un fichier <étape>.pkl par résultat.
+
+    Les écritures sont atomiques (fichier temporaire puis renommage) : un arrêt brutal laisse l'état précédent.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.state = self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path(STATE_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (ValueError, OSError) as e:
+            logger.warning(f"Point de reprise illisible, nouvelle exécution : {str(e)}")
+            return {}
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = self._path(f"{STATE_FILE}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self._path(STATE_FILE))
+
+    def start(self, names, restart=False):
+        """Reprend l'exécution inachevée ayant les mêmes étapes, sinon en commence une nouvelle"""
+        with self._lock:
+            state = self.state
+            resumable = state and not state.get("finished") and state.get("stages_planned") == sorted(names)
+            if restart or not resumable:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                self.state = {"run_id": datetime.now().strftime("%Y%m%d-%H%M%S"), "started": datetime.now().isoformat(timespec="seconds"),
+                              "stages_planned": sorted(names), "stages": {}}
+            self._save()
+            return self.state["run_id"]
+
+    def done(self, name):
+        return self.state.get("stages", {}).get(name, {}).get("status") == "done"
+
+    def load_output(self, name):
+        entry = self.state["stages"][name]
+        if not entry.get("output"):
+            return None
+        with open(self._path(entry["output"]), "rb") as f:
+            return pickle.load(f)
+
+    def record(self, name, status, seconds, output=None, error=None):
+        entry = {"status": status, "seconds": round(seconds, 2), "finished": datetime.now().isoformat(timespec="seconds")}
+        if status == "done" and output is not None:
+            entry["output"] = f"{name}.pkl"
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self._path(f"{entry['output']}.tmp")
+            with open(temp_path, "wb") as f:
+                pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(entry["output"]))
+        if error is not None:
+            entry["error"] = error
+        with self._lock:
+            self.state["stages"][name] = entry
+            self._save()
+
+    def finish(self):
+        with self._lock:
+            self.state["finished"] = datetime.now().isoformat(timespec="seconds")
+            self._save()
+
+
+def _check_graph(stages):
+    by_name = {}
+    for stage in stages:
+        if stage.name in by_name:
+            raise PipelineError(f"Étape en double : {stage.name}")
+        by_name[stage.name] = stage
+    for stage in stages:
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise PipelineError(f"{stage.name} dépend d'une étape inconnue : {dep}")
+
+    # Tri topologique (Kahn) : détecte les cycles avant toute exécution
+    remaining = {stage.name: set(stage.deps) for stage in stages}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise PipelineError(f"Cycle entre les étapes : {', '.join(sorted(remaining))}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return by_name
+
+
+def run_pipeline(stages, context, checkpoint, workers=WORKERS, restart=False):
+    """Exécute le graphe d'étapes : chaque étape part dès que ses dépendances sont terminées (étapes indépendantes
+    en parallèle). Les étapes déjà terminées dans le point de reprise sont sautées et leurs résultats relus.
+
+    Retourne le rapport [{stage, status, seconds, start}] ; lève PipelineError si une étape échoue (les étapes
+    indépendantes en cours vont à leur terme et restent acquises pour la reprise).
+    """
+    by_name = _check_graph(stages)
+    run_id = checkpoint.start(list(by_name), restart=restart)
+    outputs, report, failed = {}, {}, {}
+    for name in by_name:
+        if checkpoint.done(name):
+            outputs[name] = checkpoint.load_output(name)
+            report[name] = {"stage": name, "status": "reprise", "seconds": checkpoint.state["stages"][name]["seconds"], "start": None}
+    if report:
+        print(f"Reprise de l'exécution {run_id} : {len(report)} étape(s) déjà terminée(s)")
+
+    origin = time.perf_counter()
+
+    def execute(stage):
+        start = time.perf_counter()
+        try:
+            output = stage.func(context, {dep: outputs[dep] for dep in stage.deps})
+        except Exception as e:
+            checkpoint.record(stage.name, "failed", time.perf_counter() - start, error=str(e))
+            raise
+        seconds = time.perf_counter() - start
+        checkpoint.record(stage.name, "done", seconds, output)
+        return output, start - origin, seconds
+
+    pending = {name: stage for name, stage in by_name.items() if name not in outputs}
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stage") as pool:
+        while pending or running:
+            if not failed:
+                for name, stage in list(pending.items()):
+                    if all(dep in outputs for dep in stage.deps):
+                        print(f"[{name}] démarrage")
+                        running[pool.submit(execute, stage)] = name
+                        del pending[name]
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    failed[name] = error
+                    logger.error(f"Étape {name} en échec : {str(error)}")
+                    print(f"[{name}] échec : {error}")
+                    continue
+                outputs[name], start, seconds = future.result()
+                report[name] = {"stage": name, "status": "ok", "seconds": round(seconds, 2), "start": round(start, 2)}
+                print(f"[{name}] terminée en {seconds:.2f} s")
+
+    for name in pending:
+        report[name] = {"stage": name, "status": "non lancée", "seconds": None, "start": None}
+    for name in failed:
+        report[name] = {"stage": name, "status": "échec", "seconds": checkpoint.state["stages"][name]["seconds"], "start": None}
+    rows = [report[name] for name in by_name]
+    print_report(rows, time.perf_counter() - origin)
+    if failed:
+        raise PipelineError(f"{len(failed)} étape(s) en échec ({', '.join(failed)}) ; relancer pour reprendre l'exécution {run_id}")
+    checkpoint.finish()
+    return rows
+
+
+def print_report(rows, wall_seconds):
+    """Durée de chaque étape, somme des durées et durée réelle (gain du parallélisme)"""
+    print(f"\n{'Étape':<24} {'Statut':<12} {'Début (s)':>10} {'Durée (s)':>10}")
+    for row in rows:
+        start = f"{row['start']:.2f}" if row["start"] is not None else "-"
+        seconds = f"{row['seconds']:.2f}" if row["seconds"] is not None else "-"
+        print(f"{row['stage']:<24} {row['status']:<12} {start:>10} {seconds:>10}")
+    total = sum(row["seconds"] for row in rows if row["status"] == "ok")
+    print(f"Somme des étapes exécutées : {total:.2f} s, durée réelle : {wall_seconds:.2f} s")
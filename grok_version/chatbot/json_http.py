@@ -0,0 +1,122 @@
+import asyncio
+import http.client
+import json
+import threading
+from http import HTTPStatus
+from urllib.parse import urlparse
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class JsonHttpService:
+    """Serveur HTTP/1.1 minimal (asyncio, JSON, connexions keep-alive) commun aux services locaux.
+
+    Les sous-classes implémentent dispatch(method, path, body) -> (HTTPStatus, payload) ;
+    json_default sérialise les types propres au service.
+    """
+
+    max_body_size = MAX_BODY_SIZE
+
+    @staticmethod
+    def json_default(value):
+        raise TypeError(f"Type non sérialisable : {type(value).__name__}")
+
+    async def dispatch(self, method, path, body):
+        raise NotImplementedError
+
+    async def handle_connection(self, reader, writer):
+        try:
+            # Connexions keep-alive : plusieurs requêtes par connexion
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "Requête invalide"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0) or 0)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                if length > self.max_body_size:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Corps trop volumineux"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self.dispatch(method, path, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False, default=self.json_default).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+
+def route(path):
+    """Chemin de la requête sans paramètres ni barres obliques"""
+    return path.split("?", 1)[0].strip("/")
+
+
+class JsonHttpClient:
+    """Client JSON keep-alive (une connexion persistante par thread) des services locaux.
+
+    error_class est l'exception levée pour une réponse autre que 200.
+    """
+
+    error_class = Exception
+
+    def __init__(self, base_url, timeout=30):
+        parsed = urlparse(base_url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        # Une connexion persistante par thread
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = json.loads(response.read() or b"{}")
+                break
+            except (http.client.HTTPException, ConnectionError, OSError):
+                # Connexion fermée par le serveur : on réessaie une fois avec une nouvelle connexion
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+        if response.status != 200:
+            raise self.error_class(f"{path} : {data.get('error', response.status)}")
+        return data
@@ -0,0 +1,135 @@
+import argparse
+import json
+import logging
+import math
+import os
+import time
+
+from collection_aliases import resolve_collection
+from semantic_search import GROUPS_COLLECTION, tokenize
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_BM25_PATH = os.path.join(parent_dir, f"bm25_{GROUPS_COLLECTION}.json")
+FORMAT_VERSION = 1
+
+# Champs de la description des groupes (chromadb_v2.py) : Niveau, Matière, Centre, Enseignant, Écoles
+DESCRIPTION_FIELDS = ("niveau", "matiere", "centre", "teacher", "ecole")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def description_tokens(metadata):
+    tokens = []
+    for field in DESCRIPTION_FIELDS:
+        tokens.extend(tokenize(metadata.get(field, "")))
+    return tokens
+
+
+class BM25Index:
+    """Index inversé BM25 sur les champs de description des groupes.
+
+    postings : terme -> [[ligne, fréquence], ...] ; les lignes renvoient à doc_ids.
+    """
+
+    def __init__(self, doc_ids, doc_lengths, postings, k1=BM25_K1, b=BM25_B):
+        self.doc_ids = doc_ids
+        self.doc_lengths = doc_lengths
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self.avgdl = sum(doc_lengths) / len(doc_lengths) if doc_lengths else 0.0
+        count = len(doc_ids)
+        self.idf = {term: math.log(1 + (count - len(entries) + 0.5) / (len(entries) + 0.5))
+                    for term, entries in postings.items()}
+
+    @classmethod
+    def build(cls, ids, metadatas, k1=BM25_K1, b=BM25_B):
+        postings, doc_lengths = {}, []
+        for row, metadata in enumerate(metadatas):
+            tokens = description_tokens(metadata)
+            doc_lengths.append(len(tokens))
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, frequency in frequencies.items():
+                postings.setdefault(token, []).append([row, frequency])
+        return cls([str(doc_id) for doc_id in ids], doc_lengths, postings, k1, b)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def save(self, path=DEFAULT_BM25_PATH):
+        """Écriture atomique (fichier temporaire puis os.replace)"""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"format_version": FORMAT_VERSION, "k1": self.k1, "b": self.b, "doc_ids": self.doc_ids,
+                       "doc_lengths": self.doc_lengths, "postings": self.postings}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_BM25_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Format d'index BM25 non supporté : {data.get('format_version')}")
+        return cls(data["doc_ids"], data["doc_lengths"], data["postings"], data["k1"], data["b"])
+
+    def search(self, text, k=10, accept=None):
+        """[(id_cours, score)] par score décroissant ; accept(id_cours) filtre les candidats (préfiltre de métadonnées)"""
+        scores = {}
+        for token in set(tokenize(text)):
+            entries = self.postings.get(token)
+            if not entries:
+                continue
+            idf = self.idf[token]
+            for row, frequency in entries:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[row] / self.avgdl)
+                scores[row] = scores.get(row, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        results = []
+        for row, score in ranked:
+            doc_id = self.doc_ids[row]
+            if accept is not None and not accept(doc_id):
+                continue
+            results.append((doc_id, score))
+            if len(results) == k:
+                break
+        return results
+
+
+def load_or_build(path=DEFAULT_BM25_PATH, catalog=None):
+    """Index publié à l'ingestion ; reconstruit en mémoire depuis le catalogue s'il manque"""
+    try:
+        return BM25Index.load(path)
+    except FileNotFoundError:
+        if catalog is None:
+            raise
+        logger.warning(f"Index BM25 absent ({path}) : reconstruction en mémoire depuis le catalogue")
+        groups = list(catalog)
+        return BM25Index.build([group.id_cours for group in groups], [group.as_dict() for group in groups])
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Construit l'index BM25 des descriptions de groupes à partir de chroma_db5")
+    parser.add_argument("--chroma-path", default=os.path.join(parent_dir, "chroma_db5"))
+    parser.add_argument("--output", default=DEFAULT_BM25_PATH)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    collection = chromadb.PersistentClient(path=args.chroma_path).get_collection(
+        name=resolve_collection(GROUPS_COLLECTION, args.chroma_path))
+    data = collection.get(include=["metadatas"])
+    index = BM25Index.build(data["ids"], data["metadatas"])
+    index.save(args.output)
+    print(f"Index BM25 enregistré dans {args.output} : {len(index)} groupes, {len(index.postings)} termes "
+          f"({time.perf_counter() - start:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import json
+import logging
+import sys
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Version du schéma des métadonnées de groupes_vectorises9 (clé schema_version, absente en version 1)
+SCHEMA_KEY = "schema_version"
+SCHEMA_VERSION = 2
+
+# Version 1 : tout en chaînes, listes jointes (", " et ";"), à reparser à chaque lecture.
+# Version 2 : valeurs numériques typées, clés de recherche normalisées, listes et tarifs déjà décomposés.
+INT_FIELDS = ("num_students", "total_students", "start_minutes", "end_minutes", "tarif_count")
+FLOAT_FIELDS = ("tarifunitaire",)
+KEY_FIELDS = {"niveau": "niveau_key", "matiere": "matiere_key", "centre": "centre_key", "teacher": "teacher_key"}
+STUDENTS_FIELD = "eleves"            # JSON : noms des élèves du groupe
+SCHOOLS_FIELD = "ecoles_eleves"      # JSON : école de chaque élève (même ordre)
+
+
+def normalize_key(value):
+    """Clé de recherche : minuscules, sans accents ni espaces superflus (internée)"""
+    text = unicodedata.normalize("NFKD", str(value or "").strip().lower())
+    return sys.intern("".join(char for char in text if not unicodedata.combining(char)))
+
+
+def time_to_minutes(time_str):
+    """'HH:MM' -> minutes depuis minuit, -1 si l'heure est invalide"""
+    try:
+        hours, minutes = str(time_str).split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except (ValueError, TypeError):
+        return -1
+
+
+def _tarif_key(i, name):
+    return f"tarif_{i}_{name}"
+
+
+def build_group_metadata(fields, students, tarifs):
+    """Métadonnées d'un groupe au schéma 2, à l'ingestion.
+
+    fields : champs texte du groupe (id_cours, niveau, centre, heure_debut, ...) ;
+    students : [(élève, école)] ; tarifs : [(type_duree_id, type_duree, id_forfait, tarif_unitaire)] dans l'ordre
+    de duree_tarifs, type_duree_id étant l'identifiant réel (cm_forfait_type_duree). Les champs texte historiques
+    (ecole, student, duree_tarifs, type_duree_id numéroté '<forfait>_1') sont conservés pour les anciens chatbots.
+    """
+    metadata = {key: str(value) for key, value in fields.items()}
+    metadata[SCHEMA_KEY] = SCHEMA_VERSION
+    for field, key in KEY_FIELDS.items():
+        metadata[key] = normalize_key(metadata.get(field, ""))
+
+    metadata["num_students"] = len(students)
+    metadata["total_students"] = int(metadata.get("total_students", len(students)))
+    metadata[STUDENTS_FIELD] = json.dumps([student for student, _ in students], ensure_ascii=False)
+    metadata[SCHOOLS_FIELD] = json.dumps([school or "Inconnu" for _, school in students], ensure_ascii=False)
+    metadata["start_minutes"] = time_to_minutes(metadata.get("heure_debut"))
+    metadata["end_minutes"] = time_to_minutes(metadata.get("heure_fin"))
+
+    # La jointure SQL répète chaque offre pour chaque élève : une seule entrée par (type_duree_id, forfait), la première
+    unique_tarifs = {}
+    for tarif in tarifs:
+        unique_tarifs.setdefault((str(tarif[0]), str(tarif[2])), tarif)
+    tarifs = list(unique_tarifs.values())
+
+    # Une entrée de tarif = quatre clés scalaires (ChromaDB n'accepte pas de listes en métadonnées)
+    metadata["tarif_count"] = len(tarifs)
+    for i, (type_duree_id, type_duree, id_forfait, tarif) in enumerate(tarifs, 1):
+        metadata[_tarif_key(i, "id")] = str(type_duree_id)
+        metadata[_tarif_key(i, "type")] = str(type_duree)
+        metadata[_tarif_key(i, "forfait")] = str(id_forfait)
+        metadata[_tarif_key(i, "value")] = float(tarif)
+    id_forfait = metadata.get("id_forfait", "")
+    metadata["type_duree"] = str(tarifs[0][1]) if tarifs else "Inconnu"
+    metadata["type_duree_id"] = f"{id_forfait}_1" if tarifs else "0"
+    metadata["tarifunitaire"] = float(tarifs[0][3]) if tarifs else 0.0
+    metadata["duree_tarifs"] = ";".join(f"{type_duree}:{forfait}:{float(tarif)}" for _, type_duree, forfait, tarif in tarifs)
+    return metadata
+
+
+def _legacy_schools(metadata, num_students):
+    # Écoles du schéma 1, une par élève (complétées par 'Inconnu'), comme l'ancien affichage
+    schools = list(dict.fromkeys(school.strip() for school in str(metadata.get("ecole", "")).split(", ") if school.strip())) or ["Inconnu"]
+    students = [student.strip() for student in str(metadata.get("student", "")).split(", ") if student.strip()]
+    if len(students) < num_students:
+        students.extend(f"Étudiant_{i}" for i in range(len(students), num_students))
+    students = students[:num_students]
+    if len(schools) < num_students:
+        schools.extend(["Inconnu"] * (num_students - len(schools)))
+    return tuple(dict(zip(students, schools[:num_students])).values())
+
+
+def _legacy_tarifs(metadata):
+    entries = []
+    for i, entry in enumerate(str(metadata.get("duree_tarifs") or "").split(";"), 1):
+        parts = entry.split(":") if entry else []
+        if len(parts) == 3:
+            entries.append((f"{parts[1]}_{i}", parts[0], parts[1], parts[2]))
+    return entries
+
+
+def read_group_metadata(metadata):
+    """Valeurs typées d'un groupe, quel que soit le schéma (décodage unique au chargement du catalogue).
+
+    Retourne (num_students, tarif_unitaire, start_minutes, end_minutes, écoles par élève, tarifs) où tarifs est
+    un tuple de (type_duree_id, type_duree, tarif_unitaire) pour le forfait du groupe ; type_duree_id est l'identifiant
+    réel au schéma 2, '<forfait>_<rang dans duree_tarifs>' au schéma 1.
+    """
+    version = metadata.get(SCHEMA_KEY, 1)
+    id_forfait = str(metadata.get("id_forfait", ""))
+    if version >= 2:
+        num_students = int(metadata.get("num_students", 0))
+        tarif = metadata.get("tarifunitaire")
+        start_minutes = int(metadata.get("start_minutes", -1))
+        end_minutes = int(metadata.get("end_minutes", -1))
+        schools = tuple(json.loads(metadata.get(SCHOOLS_FIELD) or "[]"))
+        entries = [(metadata.get(_tarif_key(i, "id")) or f"{id_forfait}_{i}", metadata[_tarif_key(i, "type")],
+                    metadata[_tarif_key(i, "forfait")], metadata[_tarif_key(i, "value")])
+                   for i in range(1, int(metadata.get("tarif_count", 0)) + 1)]
+    else:
+        try:
+            num_students = int(metadata.get("num_students", 0))
+        except (ValueError, TypeError):
+            num_students = 0
+        tarif = metadata.get("tarifunitaire")
+        start_minutes = time_to_minutes(metadata.get("heure_debut"))
+        end_minutes = time_to_minutes(metadata.get("heure_fin"))
+        schools = _legacy_schools(metadata, num_students)
+        entries = _legacy_tarifs(metadata)
+
+    try:
+        tarif = float(tarif) if tarif is not None else None
+    except (ValueError, TypeError):
+        tarif = None
+
+    tarifs = []
+    for type_duree_id, type_duree, entry_id_forfait, value in entries:
+        if entry_id_forfait != id_forfait:
+            continue
+        try:
+            tarifs.append((str(type_duree_id), type_duree, float(value)))
+        except (ValueError, TypeError) as e:
+            logger.error(f"Tarif invalide pour id_cours={metadata.get('id_cours', 'unknown')}: {type_duree}:{value} ({str(e)})")
+    return num_students, tarif, start_minutes, end_minutes, schools, tuple(tarifs)
@@ -0,0 +1,172 @@
+import argparse
+import logging
+import os
+import time
+
+from collection_aliases import resolve_collection
+from embedding_client import MODEL_NAME, LocalEmbedder
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_ONNX_DIR = os.path.join(parent_dir, "models", f"{MODEL_NAME}-int8")
+ONNX_FILE = "model.onnx"
+QUANTIZED_FILE = "model_int8.onnx"
+MAX_SEQ_LENGTH = 256  # max_seq_length de all-MiniLM-L6-v2 dans sentence-transformers
+AGREEMENT_TOLERANCE = 0.99
+
+
+class OnnxEmbedder:
+    """MiniLM exporté en ONNX et quantifié int8 (onnxruntime, CPU) ; même encode() que LocalEmbedder.
+
+    Reproduit le pipeline sentence-transformers : transformer -> moyenne masquée des tokens -> normalisation L2.
+    """
+
+    def __init__(self, model_dir=DEFAULT_ONNX_DIR, quantized=True, threads=None):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.model_name = f"{MODEL_NAME} (onnx{' int8' if quantized else ''})"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        path = os.path.join(model_dir, QUANTIZED_FILE if quantized else ONNX_FILE)
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def _encode_batch(self, texts):
+        import numpy as np
+
+        tokens = self.tokenizer(texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np")
+        inputs = {name: tokens[name].astype(np.int64) for name in ("input_ids", "attention_mask", "token_type_ids")
+                  if name in self.input_names and name in tokens}
+        if "token_type_ids" in self.input_names and "token_type_ids" not in inputs:
+            inputs["token_type_ids"] = np.zeros_like(inputs["input_ids"])
+        hidden = self.session.run(None, inputs)[0]
+        mask = tokens["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts, batch_size=64):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        # Lots de longueurs voisines : moins de padding, puis remise dans l'ordre d'origine
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            positions = order[start:start + batch_size]
+            for position, vector in zip(positions, self._encode_batch([texts[i] for i in positions]).tolist()):
+                vectors[position] = vector
+        return vectors[0] if single else vectors
+
+
+def export_model(output_dir=DEFAULT_ONNX_DIR, opset=14):
+    """Exporte MiniLM en ONNX puis le quantifie en int8 (quantification dynamique des poids)"""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    repo = f"sentence-transformers/{MODEL_NAME}"
+    tokenizer = AutoTokenizer.from_pretrained(repo)
+    model = AutoModel.from_pretrained(repo).eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["Niveau: 2bac, Matière: Mathématiques"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    onnx_path = os.path.join(output_dir, ONNX_FILE)
+    torch.onnx.export(
+        model, tuple(sample[name] for name in names), onnx_path, input_names=names, output_names=["last_hidden_state"],
+        dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names}, "last_hidden_state": {0: "batch", 1: "sequence"}},
+        opset_version=opset,
+    )
+    quantized_path = os.path.join(output_dir, QUANTIZED_FILE)
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+    print(f"Modèle exporté : {onnx_path} ({os.path.getsize(onnx_path) / 1e6:.1f} Mo), "
+          f"quantifié : {quantized_path} ({os.path.getsize(quantized_path) / 1e6:.1f} Mo)")
+    return quantized_path
+
+
+def load_texts(chroma_path, limit=None):
+    """Descriptions des groupes et noms des élèves de chroma_db5 (textes réellement encodés en production)"""
+    import chromadb
+
+    client = chromadb.PersistentClient(path=chroma_path)
+    texts = {}
+    for name in ("groupes_vectorises9", "students_vectorises"):
+        try:
+            documents = client.get_collection(name=resolve_collection(name, chroma_path)).get(
+                include=["documents"], limit=limit)["documents"]
+        except Exception as e:
+            logger.warning(f"Collection {name} illisible : {str(e)}")
+            documents = []
+        texts[name] = [document for document in documents if document]
+    return texts
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
+def compare_encoders(reference, candidate, texts, batch_size=64):
+    """Débit des deux encodeurs et accord cosinus du candidat avec la référence (float)"""
+    timings = {}
+    vectors = {}
+    for name, encoder in (("reference", reference), ("candidate", candidate)):
+        encoder.encode(texts[:batch_size], batch_size)  # préchauffage
+        start = time.perf_counter()
+        vectors[name] = encoder.encode(texts, batch_size)
+        timings[name] = time.perf_counter() - start
+
+    cosines = sorted(_cosine(a, b) for a, b in zip(vectors["reference"], vectors["candidate"]))
+    return {
+        "texts": len(texts),
+        "reference_texts_per_s": round(len(texts) / timings["reference"], 1),
+        "candidate_texts_per_s": round(len(texts) / timings["candidate"], 1),
+        "speedup": round(timings["reference"] / timings["candidate"], 2),
+        "cosine_mean": round(sum(cosines) / len(cosines), 5),
+        "cosine_p5": round(cosines[int(0.05 * (len(cosines) - 1))], 5),
+        "cosine_min": round(cosines[0], 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encodeur MiniLM ONNX int8 : export et comparaison avec le modèle float")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Exporte et quantifie le modèle")
+    export_parser.add_argument("--output-dir", default=DEFAULT_ONNX_DIR)
+    bench_parser = subparsers.add_parser("benchmark", help="Débit et accord cosinus sur les textes de chroma_db5")
+    bench_parser.add_argument("--model-dir", default=DEFAULT_ONNX_DIR)
+    bench_parser.add_argument("--chroma-path", default=os.path.join(parent_dir, "chroma_db5"))
+    bench_parser.add_argument("--limit", type=int, default=5000, help="Textes lus par collection")
+    bench_parser.add_argument("--batch-size", type=int, default=64)
+    bench_parser.add_argument("--no-quantize", action="store_true", help="Compare le modèle ONNX non quantifié")
+    bench_parser.add_argument("--tolerance", type=float, default=AGREEMENT_TOLERANCE, help="Cosinus p5 minimal accepté")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.command == "export":
+        export_model(args.output_dir)
+        return
+
+    reference = LocalEmbedder()
+    candidate = OnnxEmbedder(args.model_dir, quantized=not args.no_quantize)
+    accepted = True
+    for name, texts in load_texts(args.chroma_path, args.limit).items():
+        if not texts:
+            continue
+        report = compare_encoders(reference, candidate, texts, args.batch_size)
+        accepted = accepted and report["cosine_p5"] >= args.tolerance
+        print(f"--- {name}")
+        for key, value in report.items():
+            print(f"  {key:<22} {value}")
+    print(f"Accord {'dans' if accepted else 'hors de'} la tolérance (cosinus p5 >= {args.tolerance}) : "
+          f"{'EMBEDDING_BACKEND=onnx utilisable' if accepted else 'garder le modèle float'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_CACHE_SIZE = 4096
+WARM_UP_PROFILES = 200
+WARM_UP_HISTORY = 5000  # conversations récentes analysées
+
+
+def _normalize(value):
+    return (value or "").strip().lower()
+
+
+def profile_key(catalog_version, level, subject, id_forfait, type_duree_id, center, school, teacher):
+    """Clé du cache : profil normalisé + version du catalogue (une nouvelle version invalide tout)"""
+    return (catalog_version, _normalize(level), _normalize(subject), str(id_forfait or ""), str(type_duree_id or ""),
+            _normalize(center), _normalize(school), _normalize(teacher))
+
+
+class RecommendationCache:
+    """Cache LRU borné des recommandations par matière, partagé par les threads du moteur"""
+
+    def __init__(self, max_size=RECOMMENDATION_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
+
+
+def mine_profiles(states, limit=WARM_UP_PROFILES):
+    """Profils de recommandation les plus fréquents dans l'historique (réponses enregistrées des conversations).
+
+    Retourne une liste de dicts (level, subject, id_forfait, type_duree_id, center, school, teacher), du plus fréquent au moins fréquent.
+    """
+    counter = Counter()
+    for responses in states:
+        forfaits = responses.get("forfait_selections") or {}
+        types_duree = responses.get("type_duree_selections") or {}
+        if not isinstance(forfaits, dict) or not isinstance(types_duree, dict) or not responses.get("user_level"):
+            continue
+        teachers = responses.get("user_teachers") or ""
+        if isinstance(teachers, str):
+            teachers = [teacher.strip() for teacher in teachers.split(",")] if teachers else []
+        for i, (subject, id_forfait) in enumerate(forfaits.items()):
+            if subject not in types_duree:
+                continue
+            counter[(responses["user_level"], subject, str(id_forfait), str(types_duree[subject]),
+                     responses.get("user_center") or "", responses.get("user_school") or "",
+                     teachers[i] if i < len(teachers) else "")] += 1
+
+    fields = ("level", "subject", "id_forfait", "type_duree_id", "center", "school", "teacher")
+    return [dict(zip(fields, profile)) for profile, _ in counter.most_common(limit)]
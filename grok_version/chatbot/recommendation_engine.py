@@ -0,0 +1,435 @@
+import copy
+import os
+import random
+import logging
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+
+import chromadb
+from fuzzywuzzy import process
+
+from catalog import GroupCatalog, GroupRecord, build_forfait_tree, build_vocabularies
+from catalog_snapshot import DEFAULT_SNAPSHOT_DIR, CatalogSnapshot, load_current_snapshot
+from collection_aliases import resolve_collection
+from metadata_schema import normalize_key
+from recommendation_cache import RECOMMENDATION_CACHE_SIZE, RecommendationCache, profile_key
+from tariff_matrix import DEFAULT_TARIFF_MATRIX_PATH, load_tariff_matrix
+from tariff_quotes import FRAIS_INSCRIPTION, TariffQuoter, render_tariff_message
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_CHROMA_PATH = os.path.join(parent_dir, "chroma_db5")
+
+# Collections ChromaDB utilisées par le moteur
+GROUPS_COLLECTION = "groupes_vectorises9"
+SEANCES_COLLECTION = "seances_vectorises"
+COMBINAISONS_COLLECTION = "combinaisons_vectorises"
+STUDENTS_COLLECTION = "students_vectorises"
+
+# Date de référence pour le calcul des séances restantes
+REFERENCE_DATE = datetime.strptime("2025/03/06", "%Y/%m/%d")
+REFERENCE_ORDINAL = REFERENCE_DATE.toordinal()
+
+
+def match_value(user_input, valid_values):
+    if not user_input or not valid_values:
+        return user_input, False
+    result = process.extractOne(user_input, valid_values)
+    if result is None:
+        return user_input, False
+    best_match, score = result
+    return best_match if score > 80 else user_input, score > 80
+
+
+def count_school_students(group_schools, user_school):
+    return sum(1 for school in group_schools if school == user_school)
+
+
+def group_schools(group):
+    """Écoles des élèves du groupe, une par élève (décodées au chargement du catalogue, voir metadata_schema)"""
+    return group.schools
+
+
+def has_overlap(group1, group2):
+    """Vérifie si deux groupes ont un chevauchement horaire"""
+    if group1.jour != group2.jour:
+        return False
+
+    if min(group1.start_minutes, group1.end_minutes, group2.start_minutes, group2.end_minutes) < 0:
+        return False
+
+    # Marge de 15 min si centres différents
+    margin = 15 if group1.centre != group2.centre else 0
+    return (group1.start_minutes < group2.end_minutes + margin) and (group2.start_minutes < group1.end_minutes + margin)
+
+
+
+
+class RecommendationEngine:
+    """Moteur de recommandation partagé : catalogue ChromaDB chargé une fois et gardé en mémoire.
+
+    Le catalogue est en lecture seule après chargement ; refresh() le recharge et le remplace
+    d'un bloc, ce qui permet de servir plusieurs sessions (threads) sans verrou sur les lectures.
+    Les groupes sont des GroupRecord partagés : les sessions ne conservent que leurs id_cours.
+    """
+
+    def __init__(self, chroma_path=DEFAULT_CHROMA_PATH, client=None, snapshot_dir=DEFAULT_SNAPSHOT_DIR, snapshot_path=None,
+                 cache_size=RECOMMENDATION_CACHE_SIZE, tariff_matrix_path=DEFAULT_TARIFF_MATRIX_PATH):
+        self.chroma_path = chroma_path
+        self.tariff_matrix_path = tariff_matrix_path
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_path = snapshot_path
+        self._client = client
+        self._lock = threading.Lock()
+        self._students = None
+        self.recommendation_cache = RecommendationCache(cache_size)
+        self.catalog_version = 0
+        self.refresh()
+
+    @property
+    def client(self):
+        # Client ChromaDB ouvert à la demande : inutile au démarrage quand un snapshot est publié
+        if self._client is None:
+            self._client = chromadb.PersistentClient(path=self.chroma_path)
+        return self._client
+
+    # --- Chargement du catalogue ---
+
+    def refresh(self):
+        """(Re)charge le catalogue : snapshot imposé ou publié s'il existe, sinon collections ChromaDB."""
+        if self.snapshot_path:
+            snapshot = CatalogSnapshot(self.snapshot_path)
+        else:
+            snapshot = load_current_snapshot(self.snapshot_dir) if self.snapshot_dir else None
+        if snapshot:
+            catalog = snapshot.catalog()
+            vocabularies = snapshot.header["vocabularies"]
+            forfait_tree = snapshot.header["forfaits"]
+            sessions_by_course = snapshot.sessions_by_course()
+            combinaisons = snapshot.combinaisons()
+            version = snapshot.version
+            source = os.path.basename(snapshot.path)
+        else:
+            catalog, sessions_by_course, combinaisons = self._load_from_chroma()
+            vocabularies = build_vocabularies(catalog)
+            forfait_tree = None
+            version = self.catalog_version + 1
+            source = self.chroma_path
+        # Matrice forfait × durée publiée par l'ingestion (sinon déduite des groupes), chargée une fois par version
+        tariff_matrix = load_tariff_matrix(self.tariff_matrix_path, catalog)
+        if forfait_tree is None:
+            forfait_tree = build_forfait_tree(catalog, tariff_matrix)
+        quoter = TariffQuoter(catalog, sessions_by_course, combinaisons, REFERENCE_ORDINAL, tariff_matrix)
+
+        with self._lock:
+            self.catalog = catalog
+            self.snapshot = snapshot
+            self.schools_list = vocabularies["schools_list"]
+            self.levels_list = vocabularies["levels_list"]
+            self.subjects_list = vocabularies["subjects_list"]
+            self.centers_list = vocabularies["centers_list"]
+            self.teachers_list = vocabularies["teachers_list"]
+            self.available_subjects = sorted(set(group.matiere_key for group in catalog if group.matiere_key))
+            self.forfait_tree = forfait_tree
+            self.tariff_matrix = tariff_matrix
+            self.sessions_by_course = sessions_by_course
+            self.combinaisons = combinaisons
+            self.quoter = quoter
+            self.catalog_version = version
+        # Les entrées de l'ancienne version ne seront plus jamais lues
+        self.recommendation_cache.clear()
+        logger.info(f"Catalogue chargé (version {self.catalog_version}, {source}) : {len(catalog)} groupes, "
+                    f"{len(sessions_by_course)} cours avec séances, {len(combinaisons)} combinaisons")
+        return self.catalog_version
+
+    def _load_from_chroma(self):
+        # Noms publiés (alias -> collection versionnée) relus à chaque rechargement
+        collection_groupes = self.client.get_collection(name=resolve_collection(GROUPS_COLLECTION, self.chroma_path))
+        collection_seances = self.client.get_or_create_collection(name=resolve_collection(SEANCES_COLLECTION, self.chroma_path))
+        collection_combinaisons = self.client.get_or_create_collection(name=resolve_collection(COMBINAISONS_COLLECTION, self.chroma_path))
+
+        catalog = GroupCatalog(collection_groupes.get(include=["metadatas"])['metadatas'])
+
+        # Dates des séances par id_cours, en ordinaux triés (recherche dichotomique)
+        dates_by_course = {}
+        for metadata in collection_seances.get(include=["metadatas"])['metadatas']:
+            try:
+                dates_by_course.setdefault(metadata['id_cours'], []).append(
+                    datetime.strptime(metadata['date_seance'], "%Y/%m/%d").toordinal()
+                )
+            except (KeyError, ValueError, TypeError):
+                continue
+        sessions_by_course = {id_cours: array('i', sorted(dates)) for id_cours, dates in dates_by_course.items()}
+
+        # Combinaisons de forfaits avec réduction
+        combinaisons = {}
+        for metadata in collection_combinaisons.get(include=["metadatas"])['metadatas']:
+            combinaisons.setdefault(metadata['id_combinaison'], []).append(
+                (str(metadata['id_forfait']), float(metadata['reduction']))
+            )
+        return catalog, sessions_by_course, combinaisons
+
+    def vocabularies(self):
+        """Listes de référence utilisées pour la validation et les prompts"""
+        return {
+            "levels_list": self.levels_list,
+            "subjects_list": self.subjects_list,
+            "schools_list": self.schools_list,
+            "centers_list": self.centers_list,
+            "teachers_list": self.teachers_list,
+            "group_count": len(self.catalog),
+            "combinaison_count": len(self.combinaisons),
+            "catalog_version": self.catalog_version
+        }
+
+    def cache_stats(self):
+        return self.recommendation_cache.stats()
+
+    def warm_up(self, profiles):
+        """Pré-calcule les recommandations des profils fréquents (voir recommendation_cache.mine_profiles)"""
+        start = len(self.recommendation_cache)
+        for profile in profiles:
+            forfaits_info = {profile["subject"]: self.get_available_forfaits(profile["level"], profile["subject"])}
+            if profile["id_forfait"] not in forfaits_info[profile["subject"]]:
+                continue
+            self.get_recommendations("", profile["level"], profile["subject"], profile["teacher"], profile["school"],
+                                     profile["center"], {profile["subject"]: profile["id_forfait"]},
+                                     {profile["subject"]: profile["type_duree_id"]}, forfaits_info)
+        warmed = len(self.recommendation_cache) - start
+        logger.info(f"Cache de recommandations préchauffé : {warmed} profil(s)")
+        return warmed
+
+    def get_groups(self, ids):
+        """Enregistrements des groupes demandés (dans l'ordre, les id inconnus sont ignorés)"""
+        groups = (self.catalog.get(id_cours) for id_cours in ids)
+        return [group for group in groups if group is not None]
+
+    def _resolve(self, group):
+        # Accepte un id_cours, un GroupRecord ou un dict contenant 'id_cours'
+        if isinstance(group, GroupRecord):
+            return group
+        return self.catalog.get(group['id_cours'] if isinstance(group, dict) else group)
+
+    # --- Opérations métier ---
+
+    def get_available_forfaits(self, level, subject):
+        logger.debug(f"Récupération des forfaits pour niveau: '{level}', matière: '{subject}'")
+        target_subject = normalize_key(subject)
+
+        matched_subject = target_subject
+        if self.available_subjects:
+            best_match, score = process.extractOne(target_subject, self.available_subjects)
+            if score > 80:
+                matched_subject = best_match
+
+        # Copie : l'arbre des forfaits est partagé entre les sessions
+        forfaits = copy.deepcopy(self.forfait_tree.get(normalize_key(level), {}).get(matched_subject, {}))
+
+        if not forfaits:
+            logger.warning(f"Aucun forfait trouvé pour niveau: '{level}', matière: '{subject}'")
+        return forfaits
+
+    def get_remaining_sessions(self, id_cours):
+        dates = self.sessions_by_course.get(str(id_cours))
+        if not dates:
+            return 0
+        return len(dates) - bisect_right(dates, REFERENCE_ORDINAL)
+
+    def check_overlaps(self, selected_groups):
+        """Vérifie les chevauchements entre les groupes sélectionnés (valeurs : id_cours ou groupes)"""
+        if not isinstance(selected_groups, dict):
+            logger.error("Les groupes sélectionnés doivent être dans un dictionnaire")
+            return []
+
+        group_list = [self._resolve(group) for group in selected_groups.values()]
+        group_list = [group for group in group_list if group is not None]
+        overlaps = []
+        for i in range(len(group_list)):
+            for j in range(i + 1, len(group_list)):
+                if has_overlap(group_list[i], group_list[j]):
+                    overlaps.append((group_list[i], group_list[j]))
+        return overlaps
+
+    def find_student(self, student_name):
+        """Recherche exacte (insensible à la casse) d'un étudiant dans students_vectorises"""
+        if self._students is None:
+            collection_students = self.client.get_or_create_collection(name=resolve_collection(STUDENTS_COLLECTION, self.chroma_path))
+            names = {}
+            for metadata in collection_students.get(include=["metadatas"])['metadatas']:
+                name = metadata.get('student_name', '').strip()
+                if name:
+                    names[name.lower()] = name
+            self._students = names
+        matched = self._students.get((student_name or '').strip().lower())
+        return {"student_name": matched or student_name, "student_exists": matched is not None}
+
+    def quote_tariffs(self, selections, include_fees=False, fee=FRAIS_INSCRIPTION):
+        """Devis structurés pour un lot de sélections {matière: id_cours | (id_cours, type_duree_id)} (voir TariffQuoter.quote)"""
+        return self.quoter.quote(selections, include_fees, fee)
+
+    def calculate_tariffs(self, selected_groups, user_duree_types, user_type_duree_ids, forfaits_info):
+        selection = {}
+        for subject, selected in selected_groups.items():
+            group = self._resolve(selected)
+            id_cours = group.id_cours if group else (selected['id_cours'] if isinstance(selected, dict) else selected)
+            selection[subject] = (id_cours, user_type_duree_ids[subject])
+
+        quote = self.quoter.quote([selection])[0]
+        if not quote["valid"]:
+            return None, quote["error"], None
+
+        forfait_names = {subject: forfaits_info[subject][line["id_forfait"]]['name'] for subject, line in quote["lines"].items()}
+        tariffs_by_group = {
+            subject: {
+                "id_cours": line["id_cours"],
+                "id_forfait": line["id_forfait"],
+                "nom_forfait": forfait_names[subject],
+                "remaining_sessions": line["remaining_sessions"],
+                "tarif_unitaire": line["tarif_unitaire"],
+                "tarif_total": line["tarif_total"]
+            }
+            for subject, line in quote["lines"].items()
+        }
+        tariff_message = render_tariff_message(quote, forfait_names, user_duree_types)
+        return tariffs_by_group, tariff_message, quote["total_after_discount"]
+
+    def _recommend_subject(self, matched_level, matched_subject, matched_teacher, matched_school, center_key,
+                           id_forfait, type_duree_id, forfaits_info, rejected_groups):
+        """Jusqu'à 3 groupes pour une matière : (messages, recommandations HTML, id_cours), en tuples immuables pour le cache"""
+        # Candidats : (groupe, écoles) ; seuls les groupes retenus voient leurs écoles calculées
+        # Tout groupe du forfait convient si la matrice publiée propose la durée choisie pour ce forfait ;
+        # une matrice déduite du catalogue ne garantit pas l'offre, le groupe doit alors porter cette durée
+        offered = self.tariff_matrix.offers(id_forfait, type_duree_id)
+        candidates = []
+        for group in self.catalog.find(matched_level, matched_subject):
+            if group.id_forfait != id_forfait or (not offered and group.type_duree_id != type_duree_id):
+                continue
+            if center_key and group.centre_key != center_key:
+                rejected_groups.append((group.id_cours, f"Centre mismatch: {group.centre}"))
+                continue
+            if matched_teacher and matched_teacher != 'N/A' and group.teacher != matched_teacher:
+                rejected_groups.append((group.id_cours, f"Teacher mismatch: {group.teacher}"))
+                continue
+            candidates.append((group, group_schools(group)))
+
+        if not candidates:
+            return ((f"Aucun groupe trouvé pour {matched_subject} avec le forfait [{id_forfait}] {forfaits_info[matched_subject][id_forfait]['name']} et le type de durée sélectionné.",), (), ())
+
+        messages = []
+        selected = []
+        criteria_by_id = {}
+
+        def add_groups(new_groups, criteria="Non spécifié"):
+            for group, schools in new_groups:
+                if group.id_cours not in criteria_by_id and len(selected) < 3:
+                    criteria_by_id[group.id_cours] = criteria
+                    selected.append((group, schools))
+
+        if center_key:
+            # Priorité 1 : professeur et centre, triés par nombre d'élèves de la même école
+            priority_groups = [c for c in candidates if
+                               (not matched_teacher or matched_teacher == c[0].teacher) and
+                               c[0].centre_key == center_key]
+            priority_groups.sort(key=lambda c: count_school_students(c[1], matched_school), reverse=True)
+            add_groups(priority_groups, "Professeur, Centre, École")
+
+            # Priorité 2 : centre
+            if len(selected) < 3:
+                remaining_groups = [c for c in candidates if c[0].centre_key == center_key and c[0].id_cours not in criteria_by_id]
+                add_groups(remaining_groups, "Centre")
+        else:
+            # Priorité 1 : professeur, triés par nombre d'élèves de la même école
+            priority_groups = [c for c in candidates if (not matched_teacher or matched_teacher == c[0].teacher)]
+            priority_groups.sort(key=lambda c: count_school_students(c[1], matched_school), reverse=True)
+            add_groups(priority_groups, "Professeur, École")
+
+            # Priorité 2 : n'importe quel groupe
+            if len(selected) < 3:
+                remaining_groups = [c for c in candidates if c[0].id_cours not in criteria_by_id]
+                random.shuffle(remaining_groups)
+                add_groups(remaining_groups, "Aucun critère spécifique (aléatoire)")
+
+        if len(selected) < 3:
+            messages.append(f"Attention : Seulement {len(selected)} groupe(s) trouvé(s) pour {matched_subject}.")
+
+        recommendations = []
+        for i, (group, schools) in enumerate(selected, 1):
+            recommendations.append(
+                f"<h4>Groupe {i} ({matched_subject})</h4>"
+                f"<b>ID:</b> {group.id_cours}<br>"
+                f"<b>Nom:</b> {group.name_cours}<br>"
+                f"<b>Forfait:</b> [{group.id_forfait}] {group.nom_forfait}<br>"
+                f"<b>Nombre d'étudiants :</b> {group.num_students}<br>"
+                f"<b>Professeur:</b> {group.teacher}<br>"
+                f"<b>Centre:</b> {group.centre}<br>"
+                f"<b>Date de début:</b> {group.date_debut}<br>"
+                f"<b>Date de fin:</b> {group.date_fin}<br>"
+                f"<b>Heure de début:</b> {group.heure_debut}<br>"
+                f"<b>Heure de fin:</b> {group.heure_fin}<br>"
+                f"<b>Jour:</b> {group.jour or 'None'}<br>"
+                f"<b>Écoles:</b><br>{'<br>'.join(sorted(set(schools)))}<br>"
+                f"<b>Critères de sélection :</b> {criteria_by_id[group.id_cours]}"
+            )
+
+        return tuple(messages), tuple(recommendations), tuple(group.id_cours for group, _ in selected)
+
+
+    def get_recommendations(self, student_name, user_level, user_subjects, user_teachers, user_school, user_center, selected_forfaits, selected_types_duree, forfaits_info):
+        """Recommande jusqu'à 3 groupes par matière.
+
+        Retourne (messages, recommandations HTML par matière, id_cours proposés par matière, matières reconnues).
+        """
+        logger.debug(f"get_recommendations: inputs: student_name={student_name}, level={user_level}, subjects={user_subjects}, "
+                     f"teachers={user_teachers}, school={user_school}, center={user_center}, forfaits={selected_forfaits}, "
+                     f"types_duree={selected_types_duree}")
+
+        output = []
+        all_recommendations = {}
+        all_groups_for_selection = {}
+        rejected_groups = []
+
+        matched_level = match_value(user_level, self.levels_list)[0]
+        matched_subjects = [match_value(subj.strip(), self.subjects_list)[0] for subj in user_subjects.split(",")]
+
+        if isinstance(user_teachers, list):
+            matched_teachers = [teacher.strip() for teacher in user_teachers if teacher] if user_teachers else [None] * len(matched_subjects)
+        elif isinstance(user_teachers, str) and user_teachers:
+            matched_teachers = [teacher.strip() for teacher in user_teachers.split(",")]
+        else:
+            matched_teachers = [None] * len(matched_subjects)
+
+        matched_school = match_value(user_school, self.schools_list)[0]
+        matched_center = match_value(user_center, self.centers_list)[0] if user_center else None
+        center_key = normalize_key(matched_center) if matched_center else None
+
+        for subject in matched_subjects:
+            all_recommendations[subject] = []
+            all_groups_for_selection[subject] = []
+
+        for matched_subject, matched_teacher in zip(matched_subjects, matched_teachers):
+            id_forfait = selected_forfaits.get(matched_subject)
+            type_duree_id = selected_types_duree.get(matched_subject)
+            if not id_forfait or not type_duree_id:
+                output.append(f"Aucun forfait ou type de durée sélectionné pour {matched_subject}.")
+                continue
+
+            key = profile_key(self.catalog_version, matched_level, matched_subject, id_forfait, type_duree_id,
+                              center_key, matched_school, matched_teacher)
+            cached = self.recommendation_cache.get(key)
+            if cached is None:
+                cached = self._recommend_subject(matched_level, matched_subject, matched_teacher, matched_school,
+                                                 center_key, id_forfait, type_duree_id, forfaits_info, rejected_groups)
+                self.recommendation_cache.put(key, cached)
+            messages, recommendations, group_ids = cached
+            output.extend(messages)
+            # Listes copiées : l'appelant peut les modifier sans toucher au cache
+            all_recommendations[matched_subject] = list(recommendations)
+            all_groups_for_selection[matched_subject] = list(group_ids)
+
+        logger.debug(f"get_recommendations: {len(rejected_groups)} groupe(s) rejeté(s)")
+        output.append(f"<b>Les groupes recommandés pour l'étudiant</b> {student_name} :")
+        return output, all_recommendations, all_groups_for_selection, matched_subjects
@@ -0,0 +1,402 @@
+import argparse
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from recommendation_engine import match_value
+from tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+APP_SCRIPT = os.path.join(current_dir, "chatbot_with_history.py")
+DEFAULT_TRANSCRIPTS = os.path.join(parent_dir, "conversation_history.json")
+DEFAULT_REPLAY_DIR = os.path.join(parent_dir, "replays")
+
+# État de fin de conversation comparé d'une exécution à l'autre
+OUTCOME_KEYS = ("step", "matched_subjects", "selected_forfaits", "selected_types_duree", "selected_groups",
+                "tariffs_by_group", "total_tariff_base", "total_with_frais")
+
+USER_MESSAGE = re.compile(r"<div class='user-message'>(.*)</div>", re.DOTALL)
+
+
+# --- Transcripts ---
+
+def load_transcripts(path=DEFAULT_TRANSCRIPTS):
+    """Conversations enregistrées -> [{id, student_name, inputs}] (messages utilisateur dans l'ordre)"""
+    with open(path, encoding="utf-8") as f:
+        conversations = json.load(f)
+    transcripts = []
+    for conversation in conversations:
+        inputs = []
+        for message, is_bot in conversation.get("messages", []):
+            match = None if is_bot else USER_MESSAGE.fullmatch(message.strip())
+            if match:
+                inputs.append(match.group(1))
+        if inputs:
+            transcripts.append({"id": conversation["id"], "student_name": conversation.get("student_name"), "inputs": inputs})
+    return transcripts
+
+
+# --- Substituts de Gemini ---
+
+class StubResponse:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+
+def _prompt_field(prompt, label):
+    match = re.search(rf"{re.escape(label)}(.*)\n", prompt)
+    return match.group(1).strip() if match else ""
+
+
+def _prompt_literal(prompt, label, default):
+    try:
+        return ast.literal_eval(_prompt_field(prompt, label))
+    except (ValueError, SyntaxError):
+        return default
+
+
+def parse_prompt(prompt):
+    """Extrait l'étape, l'entrée et le contexte du prompt de process_with_llm"""
+    step = int(_prompt_field(prompt, "**Étape actuelle**:") or 0)
+    user_input = _prompt_field(prompt, "**Entrée utilisateur**:")
+    if user_input.startswith("'") and user_input.endswith("'"):
+        user_input = user_input[1:-1]
+    return {
+        "step": step,
+        "input": user_input,
+        "responses": _prompt_field(prompt, "**Réponses actuelles**:"),
+        "levels_list": _prompt_field(prompt, "- Niveaux:").split(", "),
+        "subjects_list": _prompt_field(prompt, "- Matières:").split(", "),
+        "schools_list": _prompt_field(prompt, "- Écoles:").split(", "),
+        "centers_list": _prompt_field(prompt, "- Centres:").split(", "),
+        "matched_subjects": _prompt_literal(prompt, "- Matières sélectionnées:", []),
+        "available_forfaits": _prompt_literal(prompt, "- Forfaits disponibles:", {}),
+        "available_types_duree": _prompt_literal(prompt, "- Types de durée:", {}),
+    }
+
+
+def _indices(text):
+    return [int(part) for part in re.findall(r"\d+", text)]
+
+
+def _select(indices, subjects, options_by_subject):
+    """Indices 1..n par matière -> {matière: clé choisie}, None si une sélection est invalide"""
+    if len(indices) != len(subjects):
+        return None
+    selections = {}
+    for subject, index in zip(subjects, indices):
+        options = list(options_by_subject.get(subject, {}))
+        if not 1 <= index <= len(options):
+            return None
+        selections[subject] = options[index - 1]
+    return selections
+
+
+class RuleBasedModel:
+    """Remplaçant déterministe de Gemini : applique le contrat JSON du prompt étape par étape"""
+
+    def generate_content(self, prompt):
+        context = parse_prompt(prompt)
+        step = context["step"]
+        text = context["input"].strip()
+        response = {"step": step, "data": {}, "message": "", "error": None, "suggestions": [], "next_step": step + 1}
+
+        if step == 1:
+            response["data"] = {"student_name": text}
+            response["message"] = f"Bonjour {text.split(' ')[0]} ! Quel est le niveau de l'étudiant ?"
+        elif step == 2:
+            level, valid = match_value(text, context["levels_list"])
+            if valid:
+                response["data"] = {"user_level": level}
+                response["message"] = f"Niveau {level} validé. Quelles sont les matières ?"
+            else:
+                response.update(error=f"Niveau '{text}' non reconnu", next_step=step)
+        elif step == 3:
+            subjects = [match_value(part.strip(), context["subjects_list"]) for part in text.split(",") if part.strip()]
+            if subjects and all(valid for _, valid in subjects):
+                names = [subject for subject, _ in subjects]
+                response["data"] = {"user_subjects": ", ".join(names), "subjects": names}
+                response["message"] = "Matières validées. Quelles sont les notes ?"
+            else:
+                response.update(error="Matière non reconnue", next_step=step)
+        elif step == 4:
+            grades = [float(value) for value in re.findall(r"\d+(?:[.,]\d+)?", text.replace(",", " "))]
+            if any(grade < 0 or grade > 20 for grade in grades):
+                response.update(error="Les notes doivent être entre 0 et 20", next_step=step)
+            else:
+                response["data"] = {"grades": grades}
+                response["message"] = f"Veuillez choisir le type de cours pour chaque matière ({', '.join(context['matched_subjects'])})."
+        elif step == 5:
+            subjects = context["matched_subjects"]
+            lowered = text.lower()
+            if any(word in lowered for word in ("toutes", "tous", "deux")):
+                choices = ["indiv" if "indiv" in lowered else "groupe"] * len(subjects)
+            else:
+                choices = ["indiv" if "indiv" in part else "groupe" for part in lowered.split(",")]
+            response["data"] = {"course_choices": choices}
+            response["next_step"] = 6 if "groupe" in choices else 15
+        elif step == 6:
+            selections = _select(_indices(text), context["matched_subjects"], context["available_forfaits"])
+            if selections is None:
+                response.update(error="Choix de forfaits invalides", next_step=step)
+            else:
+                response["data"] = {"forfait_selections": selections}
+        elif step == 7:
+            selections = _select(_indices(text), context["matched_subjects"], context["available_types_duree"])
+            if selections is None:
+                response.update(error="Choix de types de durée invalides", next_step=step)
+            else:
+                response["data"] = {"type_duree_selections": selections}
+        elif step == 8:
+            empty = text.lower() in ("", "rien", "aucun", "aucune", "non", "pas de préférence")
+            response["data"] = {"user_teachers": "" if empty else text}
+        elif step == 9:
+            school, _ = match_value(text, context["schools_list"])
+            response["data"] = {"user_school": school}
+        elif step == 10:
+            empty = text.lower() in ("", "rien", "aucun", "non", "pas de préférence")
+            center = "" if empty else match_value(text, context["centers_list"])[0]
+            response["data"] = {"user_center": center}
+        elif step == 11:
+            response["data"] = {"group_selections": [str(index) for index in _indices(text)]}
+        # Étapes 12 à 15 : traitées par le code Python de l'application
+
+        return StubResponse(json.dumps(response, ensure_ascii=False))
+
+
+def cassette_key(prompt):
+    """Clé d'enregistrement : étape, entrée et réponses déjà collectées"""
+    context = parse_prompt(prompt)
+    digest = hashlib.sha1(context["responses"].encode("utf-8")).hexdigest()[:12]
+    return f"{context['step']}|{context['input']}|{digest}"
+
+
+class ScriptedModel:
+    """Rejoue des réponses Gemini enregistrées ; repli sur RuleBasedModel pour les prompts inconnus"""
+
+    def __init__(self, cassette, fallback=None):
+        self.cassette = cassette
+        self.fallback = fallback or RuleBasedModel()
+        self.misses = 0
+
+    def generate_content(self, prompt):
+        text = self.cassette.get(cassette_key(prompt))
+        if text is None:
+            self.misses += 1
+            return self.fallback.generate_content(prompt)
+        return StubResponse(text)
+
+
+class RecordingModel:
+    """Enveloppe le vrai modèle Gemini et enregistre ses réponses pour les rejouer hors ligne"""
+
+    def __init__(self, model, cassette):
+        self.model = model
+        self.cassette = cassette
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt):
+        response = self.model.generate_content(prompt)
+        with self._lock:
+            self.cassette[cassette_key(prompt)] = response.text
+        return response
+
+
+@contextmanager
+def stub_gemini(model=None, record=None):
+    """Remplace genai.GenerativeModel le temps du rejeu (un seul modèle partagé par les sessions)"""
+    import google.generativeai as genai
+
+    original_model, original_configure = genai.GenerativeModel, genai.configure
+    if record is not None:
+        genai.GenerativeModel = lambda name, *args, **kwargs: RecordingModel(original_model(name, *args, **kwargs), record)
+    else:
+        genai.GenerativeModel = lambda name, *args, **kwargs: model
+        genai.configure = lambda **kwargs: None
+    try:
+        yield
+    finally:
+        genai.GenerativeModel, genai.configure = original_model, original_configure
+
+
+# --- Rejeu ---
+
+def _state(app, key, default=None):
+    try:
+        return app.session_state[key]
+    except KeyError:
+        return default
+
+
+def _normalized(value):
+    return json.loads(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def replay(transcript, secrets, timeout=60):
+    """Rejoue un transcript dans l'application (sans navigateur) ; retourne latences et état final"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_SCRIPT, default_timeout=timeout)
+    for key, value in secrets.items():
+        app.secrets[key] = value
+    app.run()
+
+    turns = []
+    for user_input in transcript["inputs"]:
+        step = _state(app, "step")
+        if step not in range(1, 16):
+            break
+        input_key = f"input_step_{step}_{_state(app, 'input_counter')}"
+        start = time.perf_counter()
+        app.text_input(key=input_key).input(user_input).run()
+        turns.append({"step": step, "ms": (time.perf_counter() - start) * 1000})
+        if app.exception:
+            return {"id": transcript["id"], "turns": turns, "error": str(app.exception[0].message), "outcome": {}}
+
+    outcome = {key: _normalized(_state(app, key)) for key in OUTCOME_KEYS}
+    return {"id": transcript["id"], "turns": turns, "error": None, "outcome": outcome}
+
+
+def run_replays(transcripts, concurrency=1, repeat=1, secrets=None, timeout=60):
+    """Rejoue chaque transcript `repeat` fois avec `concurrency` sessions simultanées"""
+    jobs = [transcript for _ in range(repeat) for transcript in transcripts]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda transcript: replay(transcript, secrets or {}, timeout), jobs))
+    return results, time.perf_counter() - start
+
+
+def _latency_stats(values):
+    values = sorted(values)
+    return {"count": len(values), "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1), "max_ms": round(values[-1], 1) if values else 0.0}
+
+
+def summarize(results, elapsed, concurrency):
+    latencies = [turn["ms"] for result in results for turn in result["turns"]]
+    by_step = {}
+    for result in results:
+        for turn in result["turns"]:
+            by_step.setdefault(str(turn["step"]), []).append(turn["ms"])
+    return {
+        "replays": len(results),
+        "concurrency": concurrency,
+        "errors": [{"id": result["id"], "error": result["error"]} for result in results if result["error"]],
+        "turns": _latency_stats(latencies),
+        "by_step": {step: _latency_stats(values) for step, values in sorted(by_step.items(), key=lambda item: int(item[0]))},
+        "turns_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def compare_outcomes(results, baseline):
+    """Différences d'état final (tarifs, sélections) par rapport à la référence"""
+    differences = []
+    for result in results:
+        expected = baseline.get(result["id"])
+        if expected is None or result["error"]:
+            continue
+        for key in OUTCOME_KEYS:
+            if result["outcome"].get(key) != expected.get(key):
+                differences.append({"id": result["id"], "key": key, "expected": expected.get(key), "actual": result["outcome"].get(key)})
+    return differences
+
+
+def _load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rejoue les conversations enregistrées avec un Gemini simulé (latence et non-régression)")
+    parser.add_argument("--transcripts", default=DEFAULT_TRANSCRIPTS)
+    parser.add_argument("--mode", choices=("rules", "cassette", "record"), default="rules",
+                        help="rules : réponses déterministes ; cassette : réponses enregistrées ; record : vrai Gemini + enregistrement")
+    parser.add_argument("--cassette", default=os.path.join(DEFAULT_REPLAY_DIR, "cassette.json"))
+    parser.add_argument("--baseline", default=os.path.join(DEFAULT_REPLAY_DIR, "baseline.json"))
+    parser.add_argument("--update-baseline", action="store_true", help="Enregistre l'état final comme nouvelle référence")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--engine-url", help="Rejoue contre le service de recommandation partagé")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Fichier JSON du rapport")
+    args = parser.parse_args()
+
+    # Les logs DEBUG de l'application fausseraient les latences mesurées
+    logging.basicConfig(level=logging.WARNING)
+    # Historique isolé : le rejeu n'écrit pas dans la base des conseillers
+    os.environ.setdefault("CONVERSATION_HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="replay-"), "history.db"))
+
+    transcripts = load_transcripts(args.transcripts)
+    secrets = {"GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "replay")}
+    if args.engine_url:
+        secrets["ENGINE_SERVICE_URL"] = args.engine_url
+
+    model = None
+    recorded = None
+    if args.mode == "record":
+        recorded = _load_json(args.cassette, {})
+    elif args.mode == "cassette":
+        model = ScriptedModel(_load_json(args.cassette, {}))
+    else:
+        model = RuleBasedModel()
+
+    with stub_gemini(model, record=recorded):
+        results, elapsed = run_replays(transcripts, args.concurrency, args.repeat, secrets, args.timeout)
+
+    if recorded is not None:
+        _write_json(args.cassette, recorded)
+        print(f"{len(recorded)} réponse(s) Gemini enregistrée(s) dans {args.cassette}")
+
+    report = summarize(results, elapsed, args.concurrency)
+    if isinstance(model, ScriptedModel):
+        report["cassette_misses"] = model.misses
+
+    baseline = _load_json(args.baseline, {})
+    if args.update_baseline:
+        baseline.update({result["id"]: result["outcome"] for result in results if not result["error"]})
+        _write_json(args.baseline, baseline)
+        print(f"Référence mise à jour : {args.baseline}")
+        report["differences"] = []
+    else:
+        report["differences"] = compare_outcomes(results, baseline)
+
+    print(f"{report['replays']} rejeu(x), {report['turns']['count']} tours, concurrence {args.concurrency} : "
+          f"p50 {report['turns']['p50_ms']} ms, p95 {report['turns']['p95_ms']} ms, {report['turns_per_s']} tours/s")
+    for step, stats in report["by_step"].items():
+        print(f"    étape {step:>2} : p50 {stats['p50_ms']:>8} ms   p95 {stats['p95_ms']:>8} ms   ({stats['count']} tours)")
+    for error in report["errors"]:
+        print(f"Erreur {error['id']} : {error['error']}")
+    for difference in report["differences"]:
+        print(f"Différence {difference['id']} [{difference['key']}] : {difference['expected']} -> {difference['actual']}")
+    if args.output:
+        _write_json(args.output, report)
+
+    if report["errors"] or report["differences"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import logging
+import os
+import random
+import re
+import time
+import unicodedata
+from os.path import commonprefix
+
+from catalog import GroupCatalog, build_vocabularies
+from collection_aliases import AliasedCollection
+from tracing import percentile
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_CHROMA_PATH = os.path.join(parent_dir, "chroma_db5")
+GROUPS_COLLECTION = "groupes_vectorises9"
+
+STOP_WORDS = {"de", "du", "des", "le", "la", "les", "pres", "a", "au", "aux", "en", "et", "pour", "cours", "groupe", "groupes"}
+
+
+def normalize_text(text):
+    """Minuscules sans accents"""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", normalize_text(text)) if token not in STOP_WORDS]
+
+
+def _token_match(query_token, word):
+    # 'maths' ~ 'mathematiques', 'bac' ~ '2bac' : préfixe commun ou suffixe significatif
+    if query_token == word:
+        return True
+    if len(query_token) >= 4 and len(commonprefix([query_token, word])) >= max(4, len(query_token) - 1):
+        return True
+    return len(query_token) >= 3 and word.endswith(query_token)
+
+
+class SearchHit:
+    """Groupe trouvé pour une matière de la requête, avec sa distance vectorielle (None si trouvé hors vecteurs)
+    et son score de fusion pour la recherche hybride"""
+
+    __slots__ = ("group", "subject", "distance", "rank", "score")
+
+    def __init__(self, group, subject, distance, rank, score=None):
+        self.group = group
+        self.subject = subject
+        self.distance = distance
+        self.rank = rank
+        self.score = score
+
+    def as_dict(self):
+        return {"subject": self.subject, "distance": self.distance, "rank": self.rank, "score": self.score,
+                **self.group.as_dict()}
+
+    def __repr__(self):
+        value = self.score if self.score is not None else self.distance
+        return f"SearchHit({self.subject!r}, {self.group.id_cours!r}, {value:.3f})"
+
+
+class GroupSearch:
+    """Recherche sémantique en texte libre sur groupes_vectorises9, avec préfiltres de métadonnées (where)"""
+
+    def __init__(self, client=None, chroma_path=DEFAULT_CHROMA_PATH, model=None, collection_name=GROUPS_COLLECTION, catalog=None):
+        if client is None:
+            import chromadb
+            client = chromadb.PersistentClient(path=chroma_path)
+        # Alias re-résolu à chaque publication : l'instance peut vivre plus longtemps que la période de grâce
+        self.collection = AliasedCollection(client, collection_name, chroma_path)
+        self._model = model
+        if catalog is None:
+            catalog = GroupCatalog(self.collection.get(include=["metadatas"])['metadatas'])
+        self.catalog = catalog
+
+        vocabularies = build_vocabularies(catalog)
+        self.levels = self._index(vocabularies["levels_list"])
+        self.subjects = self._index(vocabularies["subjects_list"])
+        self.centers = self._index(vocabularies["centers_list"])
+        self.days = {normalize_text(group.jour): group.jour for group in catalog if group.jour}
+
+    @staticmethod
+    def _index(values):
+        return [(value, [word for word in tokenize(value) if len(word) >= 2]) for value in values if value]
+
+    @property
+    def model(self):
+        # Modèle chargé à la première requête (service d'embeddings partagé s'il tourne)
+        if self._model is None:
+            from embedding_client import get_embedder
+            self._model = get_embedder()
+        return self._model
+
+    @staticmethod
+    def _best(tokens, index, min_score):
+        """Valeur du vocabulaire couvrant le plus de mots de la requête (None si ambiguë ou trop faible)"""
+        scored = []
+        for value, words in index:
+            score = sum(1 for word in words if any(_token_match(token, word) for token in tokens))
+            if score >= min_score:
+                scored.append((score, value))
+        scored.sort(reverse=True)
+        if not scored or (len(scored) > 1 and scored[0][0] == scored[1][0]):
+            return None
+        return scored[0][1]
+
+    def parse_request(self, text):
+        """Texte libre -> {niveau, matieres, centre, jour} reconnus sans ambiguïté"""
+        tokens = tokenize(text)
+        subjects = []
+        for value, words in self.subjects:
+            if any(_token_match(token, word) for token in tokens for word in words if len(word) >= 4):
+                subjects.append(value)
+        day = next((self.days[token] for token in tokens if token in self.days), None)
+        return {
+            "niveau": self._best(tokens, self.levels, 2),
+            "matieres": subjects,
+            "centre": self._best([token for token in tokens if len(token) >= 4], self.centers, 1),
+            "jour": day,
+        }
+
+    @staticmethod
+    def build_where(filters):
+        """Filtre ChromaDB ; max_students et max_tarif (bornes numériques) supposent le schéma de métadonnées 2"""
+        conditions = [{key: filters[key]} for key in ("niveau", "centre", "jour") if filters.get(key)]
+        if filters.get("matieres"):
+            conditions.append({"matiere": {"$in": list(filters["matieres"])}})
+        if filters.get("max_students") is not None:
+            conditions.append({"num_students": {"$lte": int(filters["max_students"])}})
+        if filters.get("max_tarif") is not None:
+            conditions.append({"tarifunitaire": {"$lte": float(filters["max_tarif"])}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    def _rank(self, subject, metadatas, distances, k):
+        # Enregistrements déjà décodés du catalogue ; seuls les groupes inconnus (ajoutés depuis) sont décodés ici
+        missing = [metadata for metadata in metadatas if self.catalog.get(metadata.get("id_cours")) is None]
+        records = GroupCatalog(missing) if missing else None
+        ranked = []
+        for metadata, distance in zip(metadatas, distances):
+            group = self.catalog.get(metadata.get("id_cours"))
+            if group is None and records is not None:
+                group = records.get(metadata.get("id_cours"))
+            if group is None or (subject and group.matiere != subject):
+                continue
+            ranked.append(SearchHit(group, subject or group.matiere, distance, len(ranked) + 1))
+            if len(ranked) == k:
+                break
+        return ranked
+
+    def search(self, text, k=3, filters=None):
+        """Jusqu'à k groupes par matière demandée.
+
+        Les requêtes de toutes les matières sont encodées en un seul appel à model.encode
+        puis envoyées dans un seul collection.query, préfiltré par les métadonnées reconnues.
+        Une matière dont les vecteurs sont moins proches peut être évincée du budget commun :
+        elle est alors interrogée seule, filtrée sur sa matière.
+        """
+        filters = filters or self.parse_request(text)
+        subjects = filters.get("matieres") or [None]
+        queries = [
+            ", ".join(part for part in (
+                f"Niveau: {filters['niveau']}" if filters.get("niveau") else text,
+                f"Matière: {subject}" if subject else "",
+                f"Centre: {filters['centre']}" if filters.get("centre") else "",
+            ) if part)
+            for subject in subjects
+        ]
+        embeddings = self.model.encode(queries)
+        embeddings = embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings
+
+        results = self.collection.query(query_embeddings=embeddings, n_results=k * len(subjects),
+                                        where=self.build_where(filters), include=["metadatas", "distances"])
+        hits = {}
+        for subject, embedding, metadatas, distances in zip(subjects, embeddings, results["metadatas"], results["distances"]):
+            ranked = self._rank(subject, metadatas, distances, k)
+            if subject and len(ranked) < k and len(subjects) > 1:
+                retry = self.collection.query(query_embeddings=[embedding], n_results=k,
+                                              where=self.build_where({**filters, "matieres": [subject]}),
+                                              include=["metadatas", "distances"])
+                ranked = self._rank(subject, retry["metadatas"][0], retry["distances"][0], k)
+            hits[subject or "*"] = ranked
+        return hits
+
+    def exact_search(self, filters, k=None):
+        """Chemin exact (index niveau/matière du catalogue) pour les mêmes filtres"""
+        hits = {}
+        for subject in filters.get("matieres") or []:
+            groups = self.catalog.find(filters.get("niveau") or "", subject) if filters.get("niveau") else \
+                [group for group in self.catalog if group.matiere == subject]
+            groups = [group for group in groups if
+                      (not filters.get("centre") or group.centre == filters["centre"]) and
+                      (not filters.get("jour") or group.jour == filters["jour"]) and
+                      (filters.get("max_students") is None or group.num_students <= filters["max_students"]) and
+                      (filters.get("max_tarif") is None or (group.tarif_unitaire or 0.0) <= filters["max_tarif"])]
+            hits[subject] = groups[:k] if k else groups
+        return hits
+
+
+def benchmark(search, queries=100, k=3, seed=11):
+    """Rappel@k et latence de la recherche sémantique par rapport au chemin exact.
+
+    Les requêtes sont tirées du catalogue (niveau, matière, centre, jour d'un groupe existant) ;
+    la vérité terrain est l'ensemble des groupes du chemin exact pour ces filtres.
+    """
+    rng = random.Random(seed)
+    groups = list(search.catalog)
+    semantic_ms, exact_ms, recalls = [], [], []
+    for _ in range(queries):
+        group = rng.choice(groups)
+        filters = {"niveau": group.niveau, "matieres": [group.matiere], "centre": group.centre, "jour": group.jour}
+        text = f"{group.matiere} {group.niveau} {group.centre} le {group.jour}"
+
+        start = time.perf_counter()
+        truth = {g.id_cours for g in search.exact_search(filters)[group.matiere]}
+        exact_ms.append((time.perf_counter() - start) * 1000)
+
+        # Requête libre : les filtres sont extraits du texte comme pour un conseiller
+        start = time.perf_counter()
+        hits = search.search(text, k=k)
+        semantic_ms.append((time.perf_counter() - start) * 1000)
+
+        found = {hit.group.id_cours for ranked in hits.values() for hit in ranked}
+        recalls.append(len(found & truth) / min(k, len(truth)) if truth else 1.0)
+
+    semantic_ms.sort()
+    exact_ms.sort()
+    return {
+        "queries": queries,
+        "k": k,
+        f"recall_at_{k}": round(sum(recalls) / len(recalls), 4),
+        "semantic_p50_ms": round(percentile(semantic_ms, 50), 2),
+        "semantic_p95_ms": round(percentile(semantic_ms, 95), 2),
+        "exact_p50_ms": round(percentile(exact_ms, 50), 3),
+        "exact_p95_ms": round(percentile(exact_ms, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche sémantique de groupes en texte libre")
+    parser.add_argument("query", nargs="?", help="Ex : \"maths bac SM près de Maarif le samedi\"")
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--chroma-path", default=DEFAULT_CHROMA_PATH)
+    parser.add_argument("--benchmark", type=int, metavar="N", help="Rappel et latence sur N requêtes tirées du catalogue")
+    parser.add_argument("--max-students", type=int, help="Effectif maximal du groupe (schéma de métadonnées 2)")
+    parser.add_argument("--max-tarif", type=float, help="Tarif unitaire maximal (schéma de métadonnées 2)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    search = GroupSearch(chroma_path=args.chroma_path)
+    if args.benchmark:
+        for key, value in benchmark(search, args.benchmark, args.k).items():
+            print(f"{key:<18} {value}")
+        return
+
+    filters = search.parse_request(args.query or "")
+    filters.update(max_students=args.max_students, max_tarif=args.max_tarif)
+    print(f"Filtres reconnus : {filters}")
+    for subject, hits in search.search(args.query or "", k=args.k, filters=filters).items():
+        print(f"--- {subject}")
+        for hit in hits:
+            group = hit.group
+            print(f"  {hit.rank}. [{group.id_cours}] {group.name_cours} - {group.niveau}, {group.centre}, "
+                  f"{group.jour} {group.heure_debut}-{group.heure_fin} (distance {hit.distance:.3f})")
+
+
+if __name__ == "__main__":
+    main()
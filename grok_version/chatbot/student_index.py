@@ -0,0 +1,272 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import time
+
+import numpy as np
+
+from collection_aliases import resolve_collection
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_INDEX_DIR = os.path.join(parent_dir, "student_index")
+STUDENTS_COLLECTION = "students_vectorises"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+DTYPES = ("float16", "int8")
+RERANK_CANDIDATES = 50
+BLOCK_ROWS = 8192  # lignes décodées à la fois pendant le balayage approché
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=-1, keepdims=True), 1e-12, None)
+
+
+class CompactNameIndex:
+    """Index compact des vecteurs de noms d'élèves.
+
+    Les vecteurs (éventuellement réduits par ACP) sont quantifiés en float16 ou int8 (échelle par dimension)
+    et balayés en mémoire ; les meilleurs candidats sont reclassés avec les vecteurs float32 exacts,
+    lus dans un fichier mappé (seules les lignes reclassées sont chargées).
+    """
+
+    def __init__(self, ids, names, codes, dtype, scales=None, mean=None, components=None, exact=None):
+        self.ids = ids
+        self.names = names
+        self.codes = codes
+        self.dtype = dtype
+        self.scales = scales
+        self.mean = mean
+        self.components = components
+        self.exact = exact
+
+    @classmethod
+    def build(cls, ids, names, embeddings, dtype="int8", pca_dims=None, seed=0):
+        if dtype not in DTYPES:
+            raise ValueError(f"Type de quantification inconnu : {dtype} (attendu : {', '.join(DTYPES)})")
+        exact = _normalize(embeddings)
+        mean = components = None
+        reduced = exact
+        if pca_dims and pca_dims < exact.shape[1]:
+            # ACP apprise sur un échantillon (les noms sont nombreux et homogènes)
+            rng = np.random.default_rng(seed)
+            sample = exact[rng.choice(len(exact), min(len(exact), 20000), replace=False)]
+            mean = sample.mean(axis=0)
+            _, _, vt = np.linalg.svd(sample - mean, full_matrices=False)
+            components = vt[:pca_dims].T.astype(np.float32)
+            reduced = (exact - mean) @ components
+
+        scales = None
+        if dtype == "float16":
+            codes = reduced.astype(np.float16)
+        else:
+            scales = np.clip(np.abs(reduced).max(axis=0) / 127, 1e-12, None).astype(np.float32)
+            codes = np.clip(np.rint(reduced / scales), -127, 127).astype(np.int8)
+        return cls([str(i) for i in ids], list(names), codes, dtype, scales, mean, components, exact)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def memory_bytes(self):
+        """Mémoire résidente du balayage (codes + échelles + ACP), hors vecteurs exacts mappés"""
+        return sum(array.nbytes for array in (self.codes, self.scales, self.mean, self.components) if array is not None)
+
+    def save(self, directory=DEFAULT_INDEX_DIR):
+        """Fichiers .npy écrits puis renommés ; le manifeste est remplacé en dernier"""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"codes": self.codes, "exact": self.exact, "scales": self.scales, "mean": self.mean,
+                  "components": self.components}
+        files = {}
+        for name, array in arrays.items():
+            if array is None:
+                continue
+            path = os.path.join(directory, f"{name}.npy")
+            with open(f"{path}.tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(f"{path}.tmp", path)
+            files[name] = f"{name}.npy"
+        manifest = {"format_version": FORMAT_VERSION, "dtype": self.dtype, "count": len(self), "files": files,
+                    "dims": int(self.codes.shape[1]), "ids": self.ids, "names": self.names}
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+        return directory
+
+    @classmethod
+    def load(cls, directory=DEFAULT_INDEX_DIR):
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Format d'index non supporté : {manifest.get('format_version')}")
+        files = manifest["files"]
+
+        def array(name, mmap_mode=None):
+            return np.load(os.path.join(directory, files[name]), mmap_mode=mmap_mode) if name in files else None
+
+        return cls(manifest["ids"], manifest["names"], array("codes"), manifest["dtype"], array("scales"),
+                   array("mean"), array("components"), array("exact", mmap_mode="r"))
+
+    def _project(self, queries):
+        if self.components is not None:
+            queries = (queries - self.mean) @ self.components
+        if self.scales is not None:
+            # Produit scalaire sur les codes int8 : l'échelle passe du côté de la requête
+            queries = queries * self.scales
+        return queries.astype(np.float32)
+
+    def search(self, query_vectors, k=5, candidates=RERANK_CANDIDATES, rerank=True):
+        """Top-k par requête : [[(id, nom, score)], ...] ; score cosinus exact si rerank"""
+        queries = _normalize(np.atleast_2d(query_vectors))
+        projected = self._project(queries)
+        depth = min(max(k, candidates if rerank else k), len(self))
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = self.codes[start:start + BLOCK_ROWS].astype(np.float32)
+            scores[:, start:start + BLOCK_ROWS] = projected @ block.T
+
+        results = []
+        for row, query in enumerate(queries):
+            top = np.argpartition(-scores[row], depth - 1)[:depth]
+            if rerank and self.exact is not None:
+                ordered = np.sort(top)  # lecture séquentielle du fichier mappé
+                exact_scores = np.asarray(self.exact[ordered]) @ query
+                order = np.argsort(-exact_scores)[:k]
+                top, top_scores = ordered[order], exact_scores[order]
+            else:
+                order = np.argsort(-scores[row][top])[:k]
+                top, top_scores = top[order], scores[row][top[order]]
+            results.append([(self.ids[i], self.names[i], float(score)) for i, score in zip(top, top_scores)])
+        return results
+
+
+def build_from_collection(client, dtype="int8", pca_dims=None, collection_name=STUDENTS_COLLECTION):
+    """Index compact à partir des vecteurs déjà stockés dans students_vectorises"""
+    data = client.get_collection(name=collection_name).get(include=["embeddings", "metadatas"])
+    names = [metadata.get("student_name", "") for metadata in data["metadatas"]]
+    return CompactNameIndex.build(data["ids"], names, data["embeddings"], dtype, pca_dims)
+
+
+def _typo(name, rng):
+    """Variante saisie par un conseiller : casse, caractère supprimé ou prénom/nom inversés"""
+    choice = rng.randrange(3)
+    if choice == 0 and len(name) > 3:
+        position = rng.randrange(len(name))
+        return name[:position] + name[position + 1:]
+    if choice == 1 and " " in name:
+        first, _, last = name.partition(" ")
+        return f"{last} {first}"
+    return name.lower()
+
+
+def hnsw_footprint(chroma_path, collection_name):
+    """Taille sur disque du segment vectoriel (index HNSW : vecteurs, liens du graphe, en-têtes) de la collection,
+    None si rien n'est persisté (petite collection encore dans le tampon de Chroma)"""
+    from chroma_maintenance import inspect_store
+    try:
+        report = inspect_store(chroma_path)
+    except (FileNotFoundError, sqlite3.Error) as e:
+        logger.warning(f"Taille de l'index HNSW non mesurée : {str(e)}")
+        return None
+    size = sum(directory["size"] for directory in report["directories"]
+               if directory["collection"] == collection_name and directory["scope"] == "VECTOR")
+    return size or None
+
+
+def recall_report(client, embedder, configurations, queries=200, k=5, candidates=RERANK_CANDIDATES, seed=3,
+                  collection_name=STUDENTS_COLLECTION, chroma_path=None):
+    """Mémoire et rappel@k de chaque configuration par rapport à la recherche exacte float32,
+    avec l'index HNSW actuel de students_vectorises comme référence.
+
+    La mémoire de l'index actuel est la taille sur disque de son segment HNSW (graphe compris) si chroma_path
+    est donné ; à défaut, seule celle des vecteurs float32 bruts est indiquée, et la ligne est libellée ainsi.
+    """
+    collection = client.get_collection(name=collection_name)
+    data = collection.get(include=["embeddings", "metadatas"])
+    ids = [str(i) for i in data["ids"]]
+    names = [metadata.get("student_name", "") for metadata in data["metadatas"]]
+    exact = _normalize(data["embeddings"])
+
+    rng = random.Random(seed)
+    query_texts = [_typo(names[rng.randrange(len(names))], rng) for _ in range(queries)]
+    query_vectors = _normalize(embedder.encode(query_texts))
+    truth = [set(ids[i] for i in np.argsort(-(exact @ query))[:k]) for query in query_vectors]
+
+    def measure(search):
+        start = time.perf_counter()
+        found = search()
+        latency = (time.perf_counter() - start) * 1000 / len(query_vectors)
+        recall = sum(len(set(hits) & expected) / k for hits, expected in zip(found, truth)) / len(truth)
+        return round(recall, 4), round(latency, 3)
+
+    rows = []
+    hnsw = collection.query(query_embeddings=query_vectors.tolist(), n_results=k, include=[])
+    recall, latency = measure(lambda: hnsw["ids"])
+    hnsw_bytes = hnsw_footprint(chroma_path, collection_name) if chroma_path else None
+    label = "hnsw actuel (disque)" if hnsw_bytes else "hnsw actuel (float32 bruts)"
+    rows.append({"index": label, "memory_mb": round((hnsw_bytes or exact.nbytes) / 1e6, 2),
+                 f"recall_at_{k}": recall, "ms_per_query": latency})
+    for dtype, pca_dims in configurations:
+        index = CompactNameIndex.build(ids, names, exact, dtype, pca_dims)
+        for rerank in (False, True):
+            recall, latency = measure(lambda: [[hit[0] for hit in hits] for hits in
+                                               index.search(query_vectors, k, candidates, rerank)])
+            rows.append({"index": f"{dtype}{f' acp {pca_dims}' if pca_dims else ''}{' + reclassement' if rerank else ''}",
+                         "memory_mb": round(index.memory_bytes() / 1e6, 2), f"recall_at_{k}": recall,
+                         "ms_per_query": latency})
+    return rows
+
+
+def _configuration(value):
+    dtype, _, dims = value.partition(":")
+    return dtype, int(dims) if dims else None
+
+
+def main():
+    import chromadb
+
+    parser = argparse.ArgumentParser(description="Index compact (float16/int8, ACP optionnelle) des vecteurs de noms d'élèves")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="Construit l'index depuis students_vectorises")
+    build_parser.add_argument("--dtype", choices=DTYPES, default="int8")
+    build_parser.add_argument("--pca-dims", type=int, default=None)
+    build_parser.add_argument("--output-dir", default=DEFAULT_INDEX_DIR)
+    report_parser = subparsers.add_parser("report", help="Mémoire économisée et rappel@k face à l'index actuel")
+    report_parser.add_argument("--configurations", nargs="+", type=_configuration,
+                               default=[("float16", None), ("int8", None), ("int8", 128), ("int8", 64)],
+                               help="dtype[:dimensions ACP], ex. float16 int8:128")
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("-k", type=int, default=5)
+    report_parser.add_argument("--candidates", type=int, default=RERANK_CANDIDATES)
+    for subparser in (build_parser, report_parser):
+        subparser.add_argument("--chroma-path", default=os.path.join(parent_dir, "chroma_db5"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    client = chromadb.PersistentClient(path=args.chroma_path)
+    collection_name = resolve_collection(STUDENTS_COLLECTION, args.chroma_path)
+    if args.command == "build":
+        start = time.perf_counter()
+        index = build_from_collection(client, args.dtype, args.pca_dims, collection_name)
+        index.save(args.output_dir)
+        print(f"Index compact enregistré dans {args.output_dir} : {len(index)} élèves, {index.codes.shape[1]} dimensions "
+              f"{args.dtype}, {index.memory_bytes() / 1e6:.2f} Mo ({time.perf_counter() - start:.2f} s)")
+        return
+
+    from embedding_client import get_embedder
+    rows = recall_report(client, get_embedder(), args.configurations, args.queries, args.k, args.candidates,
+                         collection_name=collection_name, chroma_path=args.chroma_path)
+    print(f"{'index':<32} {'mémoire (Mo)':>12} {'rappel@' + str(args.k):>10} {'ms/requête':>11}")
+    for row in rows:
+        print(f"{row['index']:<32} {row['memory_mb']:>12} {row[f'recall_at_{args.k}']:>10} {row['ms_per_query']:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import argparse
+import json
+import logging
+import os
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_TARIFF_MATRIX_PATH = os.path.join(parent_dir, "tariff_matrix.json")
+FORMAT_VERSION = 1
+
+
+class TariffMatrix:
+    """Tarifs unitaires de chaque forfait pour chacun de ses types de durée (cm_offretemporelle).
+
+    Indexée par (id_forfait, type_duree_id) : le prix de n'importe quelle durée se lit en O(1),
+    sans relire les métadonnées des groupes.
+    """
+
+    def __init__(self, forfaits=None, created=None, published=True):
+        # id_forfait -> {type_duree_id: {'name': type_duree, 'tarif_unitaire': tarif}}
+        self.forfaits = forfaits or {}
+        self.created = created
+        # False si déduite du catalogue : les durées sont alors celles des groupes, pas l'offre réelle du forfait
+        self.published = published
+        self.prices = {(id_forfait, type_duree_id): entry['tarif_unitaire']
+                       for id_forfait, durations in self.forfaits.items() for type_duree_id, entry in durations.items()}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Lignes (id_forfait, type_duree_id, type_duree, tarif_unitaire) de cm_offretemporelle"""
+        forfaits = {}
+        for id_forfait, type_duree_id, type_duree, tarif in rows:
+            durations = forfaits.setdefault(str(id_forfait), {})
+            entry = {'name': str(type_duree), 'tarif_unitaire': float(tarif)}
+            previous = durations.setdefault(str(type_duree_id), entry)
+            if previous != entry:
+                logger.warning(f"Offres multiples pour le forfait {id_forfait}, durée {type_duree_id} : "
+                               f"{previous['tarif_unitaire']} conservé, {entry['tarif_unitaire']} ignoré")
+        return cls(forfaits, datetime.now().isoformat(timespec="seconds"))
+
+    @classmethod
+    def from_catalog(cls, catalog):
+        """Matrice déduite des tarifs portés par les groupes (quand aucune matrice n'a été publiée) ;
+        le dernier groupe l'emporte, comme dans build_forfait_tree"""
+        forfaits = {}
+        for group in catalog:
+            if not group.id_forfait:
+                continue
+            durations = forfaits.setdefault(group.id_forfait, {})
+            for type_duree_id, type_duree, tarif in group.tarifs:
+                durations[type_duree_id] = {'name': type_duree, 'tarif_unitaire': tarif}
+        return cls(forfaits, published=False)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def offers(self, id_forfait, type_duree_id):
+        """Vrai si la matrice publiée propose le forfait sur cette durée (tout groupe du forfait est alors tarifable)"""
+        return self.published and (id_forfait, type_duree_id) in self.prices
+
+    def price(self, id_forfait, type_duree_id):
+        """Tarif unitaire, ou None si le forfait n'est pas proposé sur cette durée"""
+        return self.prices.get((id_forfait, type_duree_id))
+
+    def durations(self, id_forfait):
+        return self.forfaits.get(id_forfait, {})
+
+    def save(self, path=DEFAULT_TARIFF_MATRIX_PATH):
+        """Écriture atomique (fichier temporaire puis renommage)"""
+        data = {"format_version": FORMAT_VERSION, "created": self.created, "forfaits": self.forfaits}
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(f"{path}.tmp", path)
+        return path
+
+    @classmethod
+    def load(cls, path=DEFAULT_TARIFF_MATRIX_PATH):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Format de matrice tarifaire non supporté : {data.get('format_version')}")
+        return cls(data["forfaits"], data.get("created"))
+
+
+def load_tariff_matrix(path, catalog):
+    """Matrice publiée par l'ingestion si elle existe, sinon déduite du catalogue"""
+    if path and os.path.exists(path):
+        try:
+            return TariffMatrix.load(path)
+        except (ValueError, KeyError, json.JSONDecodeError) as e:
+            logger.warning(f"Matrice tarifaire {path} ignorée : {str(e)}")
+    return TariffMatrix.from_catalog(catalog)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matrice tarifaire forfait × type de durée")
+    parser.add_argument("id_forfait", nargs="?", help="Affiche les durées et tarifs de ce forfait")
+    parser.add_argument("--path", default=DEFAULT_TARIFF_MATRIX_PATH)
+    args = parser.parse_args()
+
+    matrix = TariffMatrix.load(args.path)
+    print(f"{args.path} : {len(matrix.forfaits)} forfaits, {len(matrix)} tarifs (créée le {matrix.created})")
+    if args.id_forfait:
+        for type_duree_id, entry in sorted(matrix.durations(args.id_forfait).items()):
+            print(f"  {type_duree_id:<12} {entry['name']:<30} {entry['tarif_unitaire']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import logging
+import math
+import threading
+from array import array
+from bisect import bisect_right
+
+logger = logging.getLogger(__name__)
+
+FRAIS_INSCRIPTION = 250
+
+
+class TariffQuoter:
+    """Chiffrage en lot de sélections de groupes, sans mise en forme.
+
+    Les séances restantes sont calculées une fois par groupe (colonne alignée sur le catalogue) ;
+    chaque lot de sélections est ensuite chiffré colonne par colonne : séances × tarif unitaire,
+    meilleure réduction de combinaison, frais d'inscription optionnels. Avec une matrice tarifaire,
+    le tarif unitaire est celui du forfait du groupe pour la durée demandée (n'importe laquelle de ses durées).
+    """
+
+    def __init__(self, catalog, sessions_by_course, combinaisons, reference_ordinal, tariff_matrix=None):
+        self.catalog = catalog
+        self.tariff_matrix = tariff_matrix
+        self.sessions_by_course = sessions_by_course
+        self.reference_ordinal = reference_ordinal
+        self._remaining = None
+        self._lock = threading.Lock()
+
+        # Combinaisons : ensemble des forfaits requis + pourcentage, indexées par forfait
+        self.combinaisons = []
+        self.combinaisons_by_forfait = {}
+        for id_combinaison, pairs in combinaisons.items():
+            index = len(self.combinaisons)
+            forfaits = frozenset(str(pair[0]) for pair in pairs)
+            self.combinaisons.append((id_combinaison, forfaits, float(pairs[0][1])))
+            for id_forfait in forfaits:
+                self.combinaisons_by_forfait.setdefault(id_forfait, []).append(index)
+
+    @property
+    def remaining(self):
+        """Séances restantes par ligne du catalogue (calculées à la première demande)"""
+        if self._remaining is None:
+            with self._lock:
+                if self._remaining is None:
+                    column = array('i')
+                    for group in self.catalog:
+                        dates = self.sessions_by_course.get(group.id_cours)
+                        column.append(len(dates) - bisect_right(dates, self.reference_ordinal) if dates else 0)
+                    self._remaining = column
+        return self._remaining
+
+    def best_discount(self, forfait_ids):
+        """Meilleure réduction dont tous les forfaits sont sélectionnés : (id_combinaison, pourcentage) ou None"""
+        if len(forfait_ids) < 2:
+            return None
+        selected = set(forfait_ids)
+        best = None
+        for index in {index for id_forfait in selected for index in self.combinaisons_by_forfait.get(id_forfait, ())}:
+            id_combinaison, forfaits, percentage = self.combinaisons[index]
+            if forfaits <= selected and (best is None or percentage > best[1] or (percentage == best[1] and index < best[2])):
+                best = (id_combinaison, percentage, index)
+        return best[:2] if best else None
+
+    def quote(self, selections, include_fees=False, fee=FRAIS_INSCRIPTION):
+        """Chiffre une liste de sélections {matière: id_cours | (id_cours, type_duree_id)}.
+
+        Retourne un devis structuré par sélection (même ordre) :
+        {valid, error, lines: {matière: {...}}, base_total, discount, total_after_discount, fees, total}.
+        """
+        remaining = self.remaining
+        tarifs = self.catalog.tarif_unitaire
+
+        # 1. Résolution de toutes les lignes du lot en une passe : (sélection, matière, ligne du catalogue, tarif)
+        rows, owners, subjects, unit_prices, type_ids = array('i'), array('i'), [], array('d'), []
+        errors = [None] * len(selections)
+        for position, selection in enumerate(selections):
+            for subject, value in selection.items():
+                id_cours, type_duree_id = (value[0], value[1]) if isinstance(value, (list, tuple)) else (value, None)
+                group = self.catalog.get(id_cours)
+                if group is None:
+                    errors[position] = errors[position] or f"Erreur : Données non trouvées pour le cours {id_cours}."
+                    continue
+                type_duree_id = type_duree_id or group.type_duree_id
+                if self.tariff_matrix is not None and self.tariff_matrix.published:
+                    price = self.tariff_matrix.price(group.id_forfait, type_duree_id)
+                    if price is None and type_duree_id == group.type_duree_id:
+                        price = tarifs[group.row]  # tarif porté par le groupe pour sa durée par défaut
+                else:
+                    # Matrice déduite du catalogue (le dernier groupe du forfait l'emporte) : tarif propre au groupe
+                    price = tarifs[group.row]
+                if not group.id_forfait or price is None or math.isnan(price):
+                    errors[position] = errors[position] or f"Erreur : Données invalides pour le cours {group.id_cours}."
+                    continue
+                rows.append(group.row)
+                owners.append(position)
+                subjects.append(subject)
+                unit_prices.append(price)
+                type_ids.append(type_duree_id)
+
+        # 2. Colonnes du lot : séances restantes, tarif total
+        sessions = [remaining[row] for row in rows]
+        line_totals = [count * price for count, price in zip(sessions, unit_prices)]
+
+        # 3. Agrégation par sélection
+        quotes = [{"valid": errors[position] is None, "error": errors[position], "lines": {}, "base_total": 0.0,
+                   "discount": None, "total_after_discount": 0.0, "fees": 0.0, "total": 0.0}
+                  for position in range(len(selections))]
+        records = self.catalog.records
+        for i, row in enumerate(rows):
+            quote = quotes[owners[i]]
+            if not quote["valid"]:
+                continue
+            group = records[row]
+            quote["lines"][subjects[i]] = {
+                "id_cours": group.id_cours,
+                "id_forfait": group.id_forfait,
+                "type_duree_id": type_ids[i],
+                "remaining_sessions": sessions[i],
+                "tarif_unitaire": unit_prices[i],
+                "tarif_total": line_totals[i],
+            }
+            quote["base_total"] += line_totals[i]
+
+        for quote in quotes:
+            if not quote["valid"]:
+                quote["lines"] = {}
+                continue
+            total = quote["base_total"]
+            discount = self.best_discount([line["id_forfait"] for line in quote["lines"].values()])
+            if discount:
+                amount = total * (discount[1] / 100)
+                quote["discount"] = {"id_combinaison": discount[0], "percentage": discount[1], "amount": amount}
+                total -= amount
+            quote["total_after_discount"] = total
+            quote["fees"] = float(fee) if include_fees and quote["lines"] else 0.0
+            quote["total"] = total + quote["fees"]
+        return quotes
+
+
+def render_tariff_message(quote, forfait_names, duree_names):
+    """Détail HTML d'un devis (format du message de calculate_tariffs)"""
+    if not quote["valid"]:
+        return quote["error"]
+    message = "<b>Détails des tarifs :</b><br>"
+    for subject, line in quote["lines"].items():
+        message += f"- {subject} ([{line['id_forfait']}] {forfait_names[subject]}, Type de durée : {duree_names[subject]}) : {line['remaining_sessions']} séances restantes, tarif unitaire {line['tarif_unitaire']} DH, tarif total {line['tarif_total']:.2f} DH<br>"
+    message += f"<b>Total de base :</b> {quote['base_total']:.2f} DH<br>"
+    discount = quote["discount"]
+    if discount and discount["amount"] > 0:
+        message += f"Réduction pour combinaison ({discount['id_combinaison']}) : -{discount['amount']:.2f} DH ({discount['percentage']:.2f}%)<br>"
+        message += f"<b>Total après réduction :</b> {quote['total_after_discount']:.2f} DH"
+    else:
+        message += f"<b>Total :</b> {quote['total_after_discount']:.2f} DH"
+    return message
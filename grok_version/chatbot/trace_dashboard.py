@@ -0,0 +1,40 @@
+import streamlit as st
+
+from tracing import DEFAULT_TRACE_FILE, load_traces, summarize
+
+# Page d'administration : latence des tours du chatbot LLM par étape et par action
+st.set_page_config(page_title="Latence des tours", page_icon="⏱️", layout="wide")
+st.title("⏱️ Latence des tours du chatbot")
+
+trace_file = st.sidebar.text_input("Fichier de traces", value=DEFAULT_TRACE_FILE)
+limit = st.sidebar.number_input("Derniers tours analysés (0 = tous)", min_value=0, value=1000, step=100)
+if st.sidebar.button("Rafraîchir"):
+    st.rerun()
+
+records = load_traces(trace_file, limit=limit or None)
+if not records:
+    st.info("Aucune trace enregistrée pour le moment.")
+    st.stop()
+
+summary = summarize(records)
+col_turns, col_p95, col_overhead = st.columns(3)
+col_turns.metric("Tours analysés", summary["turns"])
+col_p95.metric("p95 d'un tour", f"{summary['stages']['total']['p95_ms']:.0f} ms")
+col_overhead.metric("Coût de l'instrumentation", f"{summary['overhead_percent']:.3f} %",
+                    delta="OK" if summary["overhead_percent"] < 1 else "> 1 %",
+                    delta_color="normal" if summary["overhead_percent"] < 1 else "inverse")
+
+
+def _rows(stats, label):
+    return [{label: name, **values} for name, values in sorted(stats.items(), key=lambda item: item[1]["p95_ms"], reverse=True)]
+
+
+st.subheader("Par étape")
+st.dataframe(_rows(summary["stages"], "étape"), use_container_width=True)
+
+st.subheader("Par action (next_action)")
+st.dataframe(_rows(summary["actions"], "next_action"), use_container_width=True)
+
+st.subheader("Derniers tours")
+st.dataframe([{"ts": record["ts"], "next_action": record.get("next_action"), "total_ms": record["total_ms"],
+               **record.get("spans", {})} for record in reversed(records[-50:])], use_container_width=True)
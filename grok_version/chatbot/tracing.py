@@ -0,0 +1,168 @@
+import contextvars
+import glob
+import json
+import logging
+import logging.handlers
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+DEFAULT_TRACE_FILE = os.path.join(parent_dir, "traces", "turns.jsonl")
+
+# Rotation du fichier de traces
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 5
+
+PERCENTILES = (50, 95, 99)
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnTrace:
+    """Durées cumulées des étapes d'un tour (en secondes, converties en ms à l'écriture)"""
+
+    __slots__ = ("turn_id", "started", "spans", "attributes")
+
+    def __init__(self, **attributes):
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.attributes = attributes
+
+    def add(self, name, duration):
+        self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(name):
+    """Mesure une étape du tour courant (sans effet hors d'un tour tracé)"""
+    turn = _current_turn.get()
+    if turn is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        turn.add(name, time.perf_counter() - start)
+
+
+class Tracer:
+    """Enregistre un tour par ligne JSON dans un fichier à rotation"""
+
+    def __init__(self, path=DEFAULT_TRACE_FILE, enabled=True):
+        self.path = path
+        self.enabled = enabled
+        self._logger = None
+        if enabled:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._logger = logging.getLogger(f"{__name__}.sink.{path}")
+            self._logger.propagate = False
+            self._logger.setLevel(logging.INFO)
+            if not self._logger.handlers:
+                handler = logging.handlers.RotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self._logger.addHandler(handler)
+
+    @contextmanager
+    def turn(self, **attributes):
+        if not self.enabled:
+            yield TurnTrace(**attributes)
+            return
+        trace = TurnTrace(**attributes)
+        token = _current_turn.set(trace)
+        error = None
+        try:
+            yield trace
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_turn.reset(token)
+            self._write(trace, error)
+
+    def _write(self, trace, error):
+        total = time.perf_counter() - trace.started
+        write_start = time.perf_counter()
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "turn_id": trace.turn_id,
+            "total_ms": round(total * 1000, 3),
+            "spans": {name: round(duration * 1000, 3) for name, duration in trace.spans.items()},
+            **trace.attributes,
+        }
+        if error:
+            record["error"] = error
+        # Coût de l'instrumentation (sérialisation + écriture) mesuré sur le tour précédent du même processus
+        record["trace_overhead_ms"] = round(getattr(self, "_last_write_ms", 0.0), 3)
+        self._logger.info(json.dumps(record, ensure_ascii=False))
+        self._last_write_ms = (time.perf_counter() - write_start) * 1000
+
+
+def get_tracer(path=DEFAULT_TRACE_FILE):
+    """Traceur partagé par le processus (désactivable avec TRACE_DISABLED=1)"""
+    enabled = os.getenv("TRACE_DISABLED", "0") not in ("1", "true", "True")
+    return Tracer(path, enabled=enabled)
+
+
+# --- Lecture et agrégation ---
+
+def load_traces(path=DEFAULT_TRACE_FILE, limit=None):
+    """Tours enregistrés, du plus ancien au plus récent (fichiers de rotation inclus)"""
+    files = sorted(glob.glob(f"{path}.*"), key=lambda name: int(name.rsplit(".", 1)[-1]) if name.rsplit(".", 1)[-1].isdigit() else 0, reverse=True)
+    files = [name for name in files if name.rsplit(".", 1)[-1].isdigit()]
+    if os.path.exists(path):
+        files.append(path)
+    records = []
+    for name in files:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records[-limit:] if limit else records
+
+
+def percentile(sorted_values, p):
+    """Percentile par rang le plus proche sur une liste triée"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def _stats(values):
+    values = sorted(values)
+    stats = {"count": len(values), "mean_ms": round(sum(values) / len(values), 2) if values else 0.0}
+    for p in PERCENTILES:
+        stats[f"p{p}_ms"] = round(percentile(values, p), 2)
+    return stats
+
+
+def summarize(records):
+    """Statistiques par étape, par code next_action et coût de l'instrumentation"""
+    by_stage = {}
+    by_action = {}
+    overhead = 0.0
+    total = 0.0
+    for record in records:
+        for name, duration in record.get("spans", {}).items():
+            by_stage.setdefault(name, []).append(duration)
+        by_stage.setdefault("total", []).append(record.get("total_ms", 0.0))
+        by_action.setdefault(record.get("next_action") or "inconnu", []).append(record.get("total_ms", 0.0))
+        overhead += record.get("trace_overhead_ms", 0.0)
+        total += record.get("total_ms", 0.0)
+    return {
+        "stages": {name: _stats(values) for name, values in by_stage.items()},
+        "actions": {name: _stats(values) for name, values in by_action.items()},
+        "overhead_percent": round(100 * overhead / total, 4) if total else 0.0,
+        "turns": len(records),
+    }
@@ -1,75 +1,62 @@
+import os
+import sys
 import psycopg2
 from psycopg2 import Error
 from psycopg2.extras import RealDictCursor
 import chromadb
 
-# Initialiser ChromaDB
-client = chromadb.PersistentClient(path="./chroma_db5")
-
-# Connexion à PostgreSQL
-try:
-    conn = psycopg2.connect(
-        dbname="cm_db",
-        user="postgres",
-        password="root",
-        host="localhost",
-        port="5432"
-    )
-    conn.set_client_encoding('UTF8')
+# Module de snapshot du catalogue (partagé avec les chatbots)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot"))
+from catalog_snapshot import publish_snapshot
+from bulk_writer import BulkWriteError, BulkWriter, fetch_batches
+from collection_aliases import CollectionPublisher, ValidationError
+
+SEANCES_QUERY = """
+    SELECT 
+        id AS seance_id, 
+        to_char(START, 'YYYY/MM/DD') AS date_seance, 
+        seance_cours AS id_cours
+    FROM cm_seance
+    WHERE deleted = FALSE AND seance_cours IS NOT NULL AND START > '2024/01/01'
+"""
+
+
+def build_seances(seances_data):
+    # Accéder aux colonnes par nom (RealDictCursor retourne des dictionnaires)
+    return {
+        "ids": [str(row['seance_id']) for row in seances_data],
+        "metadatas": [{"date_seance": row['date_seance'], "id_cours": str(row['id_cours'])} for row in seances_data],
+        "documents": [f"date_seance: {row['date_seance']}, id_cours: {row['id_cours']}" for row in seances_data],
+    }
+
+
+def vectorize_seances(conn, client):
+    """Lit cm_seance par lots, écrit une nouvelle version de seances_vectorises puis bascule l'alias.
+
+    Lève BulkWriteError ou ValidationError si la publication est refusée (la version précédente reste en ligne).
+    """
     cursor = conn.cursor(cursor_factory=RealDictCursor)  # Utiliser RealDictCursor
-    
-    # Exécuter la requête
-    print("Exécution de la requête SQL...")
-    cursor.execute("""
-        SELECT 
-            id AS seance_id, 
-            to_char(START, 'YYYY/MM/DD') AS date_seance, 
-            seance_cours AS id_cours
-        FROM cm_seance
-        WHERE deleted = FALSE AND seance_cours IS NOT NULL AND START > '2024/01/01'
-    """)
-    
-    # Vérifier si des résultats existent
-    if cursor.rowcount == -1 or cursor.rowcount == 0:
-        print("Aucun résultat retourné par la requête. Vérifiez la table cm_seance ou les conditions.")
-        raise Exception("Requête vide ou non exécutée.")
-    
-    # Réinitialiser la collection
     try:
-        client.delete_collection("seances_vectorises")
-        print("Collection seances_vectorises réinitialisée.")
-    except:
-        pass
-    collection_seances = client.create_collection(name="seances_vectorises")
-    
-    MAX_BATCH_SIZE = 5461
-    total_seances = 0
-    seances_12734033 = 0
-    
-    while True:
-        seances_data = cursor.fetchmany(MAX_BATCH_SIZE)
-        if not seances_data:
-            break
-        
-        # Accéder aux colonnes par nom (RealDictCursor retourne des dictionnaires)
-        ids_seances = [str(row['seance_id']) for row in seances_data]  # seance_id
-        metadatas_seances = [{"date_seance": row['date_seance'], "id_cours": str(row['id_cours'])} for row in seances_data]
-        documents_seances = [f"date_seance: {row['date_seance']}, id_cours: {row['id_cours']}" for row in seances_data]
-        
-        # Compter les séances pour 12734033
-        seances_12734033_in_batch = sum(1 for row in seances_data if str(row['id_cours']) == '12734033')
-        seances_12734033 += seances_12734033_in_batch
-        
-        collection_seances.upsert(
-            ids=ids_seances,
-            metadatas=metadatas_seances,
-            documents=documents_seances
-        )
-        total_seances += len(seances_data)
-        print(f"Vectorisé {total_seances} séances... Dont {seances_12734033_in_batch} pour id_cours 12734033 dans ce lot.")
-    
-    print(f"Vectorisation terminée. Total séances : {total_seances}, Total pour 12734033 : {seances_12734033}")
-    
+        # Exécuter la requête
+        print("Exécution de la requête SQL...")
+        cursor.execute(SEANCES_QUERY)
+
+        # Vérifier si des résultats existent
+        if cursor.rowcount == -1 or cursor.rowcount == 0:
+            print("Aucun résultat retourné par la requête. Vérifiez la table cm_seance ou les conditions.")
+            raise Exception("Requête vide ou non exécutée.")
+
+        # Nouvelle version de seances_vectorises (la version publiée reste lisible pendant la construction)
+        publisher = CollectionPublisher(client, "seances_vectorises", chroma_path="./chroma_db5")
+        collection_seances = publisher.create()
+
+        # Lecture, construction et upsert en parallèle, lots à la taille maximale du client
+        writer = BulkWriter(collection_seances, client)
+        stats = writer.write(fetch_batches(cursor, writer.batch_size), build_seances)
+        print(f"Vectorisation terminée. Total séances : {stats['rows']}")
+    finally:
+        cursor.close()
+
     # Vérification post-vectorisation
     seances_data_check = collection_seances.get(include=["metadatas"])
     relevant_seances = [m for m in seances_data_check['metadatas'] if m['id_cours'] == '12734033']
@@ -77,10 +64,41 @@ try:
     for seance in relevant_seances:
         print(f"Séance - ID: {seance.get('id', 'N/A')}, Date: {seance['date_seance']}, id_cours: {seance['id_cours']}")
 
-except Error as e:
-    print(f"Erreur lors de la vectorisation de `seances` : {e}")
-except Exception as e:
-    print(f"Erreur générale : {e}")
-finally:
-    cursor.close()
-    conn.close()
\ No newline at end of file
+    # Validation puis bascule de l'alias
+    publisher.publish(collection_seances, required_keys=("date_seance", "id_cours"))
+    return stats
+
+
+def main():
+    # Initialiser ChromaDB
+    client = chromadb.PersistentClient(path="./chroma_db5")
+    conn = None
+
+    # Connexion à PostgreSQL
+    try:
+        conn = psycopg2.connect(
+            dbname="cm_db",
+            user="postgres",
+            password="root",
+            host="localhost",
+            port="5432"
+        )
+        conn.set_client_encoding('UTF8')
+        vectorize_seances(conn, client)
+
+        # Snapshot du catalogue lu par les chatbots
+        publish_snapshot(client, chroma_path="./chroma_db5")
+
+    except Error as e:
+        print(f"Erreur lors de la vectorisation de `seances` : {e}")
+    except (BulkWriteError, ValidationError) as e:
+        print(f"Publication annulée, la version précédente reste en ligne : {e}")
+    except Exception as e:
+        print(f"Erreur générale : {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 import psycopg2
-from sentence_transformers import SentenceTransformer
 import chromadb
 import os
+import sys
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot"))
+from embedding_client import get_embedder
+from student_index import build_from_collection
+from bulk_writer import BulkWriter, slice_batches
+from collection_aliases import CollectionPublisher, resolve_collection
+
 # Configuration de la base de données (à personnaliser)
 db_config = {
     "host": "localhost",
@@ -22,11 +28,16 @@ JOIN cm_role cr ON cr.id = mrt.id_role
 WHERE cr."name" = 'ROLE_STUDENT';
 """
 
-def get_students_from_db():
-    """Exécute la requête SQL et retourne la liste des étudiants avec leurs IDs."""
+def get_students_from_db(conn=None):
+    """Exécute la requête SQL et retourne la liste des étudiants avec leurs IDs.
+
+    Avec conn (connexion empruntée à un pool), la connexion n'est pas fermée ici.
+    """
+    own_connection = conn is None
     try:
         # Connexion à la base de données
-        conn = psycopg2.connect(**db_config)
+        if own_connection:
+            conn = psycopg2.connect(**db_config)
         cursor = conn.cursor()
         
         # Exécuter la requête
@@ -35,73 +46,68 @@ def get_students_from_db():
         
         # Fermer la connexion
         cursor.close()
-        conn.close()
+        if own_connection:
+            conn.close()
         
         print(f"Récupéré {len(students)} étudiants depuis la base de données.")
         return students
     
     except Exception as e:
+        if not own_connection:
+            raise
         print(f"Erreur lors de la connexion à la base de données : {e}")
         return []
 
-def vectorize_students(students):
+def vectorize_students(students, client=None):
     """Vectorise les noms des étudiants et les stocke dans ChromaDB par lots."""
-    # Initialiser le modèle SentenceTransformer
-    print("Chargement du modèle SentenceTransformer...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Initialiser ChromaDB
-    client = chromadb.PersistentClient(path="./chroma_db5")
-    collection = client.get_or_create_collection(name="students_vectorises")
-    
-    # Vider la collection existante (optionnel)
-    print("Vidage de la collection students_vectorises existante...")
-    client.delete_collection(name="students_vectorises")
-    collection = client.create_collection(name="students_vectorises")
-    
-    # Taille maximale du lot (conservatrice pour éviter les erreurs)
-    batch_size = 5000
-    
-    # Préparer les données
-    ids = []
-    metadatas = []
-    documents = []
-    embeddings = []
-    
-    print("Vectorisation des noms des étudiants...")
-    for student_id, student_name in tqdm(students, desc="Vectorisation"):
-        if not student_name:
-            continue
-        # Générer l'embedding
-        embedding = model.encode(student_name, convert_to_numpy=True).tolist()
-        # Ajouter aux listes
-        ids.append(student_id)
-        metadatas.append({"student_name": student_name})
-        documents.append(student_name)
-        embeddings.append(embedding)
-    
-    # Insérer par lots
-    total_students = len(ids)
-    if total_students == 0:
+    # Entrée vide : aucune version candidate n'est créée
+    students = [(student_id, student_name) for student_id, student_name in students if student_name]
+    if not students:
         print("Aucun étudiant à insérer.")
         return
+
+    # Embeddings : service partagé s'il tourne (embedding_service.py), sinon modèle local
+    print("Chargement du modèle d'embeddings...")
+    model = get_embedder()
     
-    print(f"Insertion de {total_students} étudiants dans ChromaDB par lots de {batch_size}...")
-    for i in tqdm(range(0, total_students, batch_size), desc="Insertion des lots"):
-        batch_ids = ids[i:i + batch_size]
-        batch_metadatas = metadatas[i:i + batch_size]
-        batch_documents = documents[i:i + batch_size]
-        batch_embeddings = embeddings[i:i + batch_size]
-        
-        collection.add(
-            ids=batch_ids,
-            metadatas=batch_metadatas,
-            documents=batch_documents,
-            embeddings=batch_embeddings
-        )
+    # Initialiser ChromaDB
+    if client is None:
+        client = chromadb.PersistentClient(path="./chroma_db5")
+
+    # Nouvelle version de students_vectorises (la version publiée reste lisible pendant la construction)
+    publisher = CollectionPublisher(client, "students_vectorises", chroma_path="./chroma_db5")
+    collection = publisher.create()
+
+    # Encodage et insertion en parallèle, lots à la taille maximale du client
+    def build_students(batch):
+        names = [student_name for _, student_name in batch]
+        return {
+            "ids": [student_id for student_id, _ in batch],
+            "metadatas": [{"student_name": student_name} for student_name in names],
+            "documents": names,
+            "embeddings": model.encode(names),
+        }
+
+    writer = BulkWriter(collection, client)
+    print(f"Vectorisation et insertion de {len(students)} étudiants dans ChromaDB par lots de {writer.batch_size}...")
+    writer.write(tqdm(slice_batches(students, writer.batch_size), total=-(-len(students) // writer.batch_size),
+                      desc="Lots"), build_students)
     
     print("Insertion terminée avec succès.")
 
+    # Validation puis bascule de l'alias vers la nouvelle version
+    publisher.publish(collection, required_keys=("student_name",))
+
+def build_student_index(client):
+    """Index compact des noms (int8 + reclassement exact), enregistré à côté de chroma_db5"""
+    collection = client.get_collection(name=resolve_collection("students_vectorises", "./chroma_db5"))
+    print(f"Total d'étudiants dans students_vectorises ({collection.name}) : {collection.count()}")
+
+    index = build_from_collection(client, dtype="int8", collection_name=collection.name)
+    index.save("./student_index")
+    print(f"Index compact des noms enregistré dans ./student_index ({index.memory_bytes() / 1e6:.2f} Mo)")
+    return "./student_index"
+
 def main():
     # Étape 1 : Récupérer les étudiants depuis la base de données
     students = get_students_from_db()
@@ -113,11 +119,8 @@ def main():
     # Étape 2 : Vectoriser et stocker dans ChromaDB
     vectorize_students(students)
     
-    # Vérification finale
-    # Initialiser ChromaDB
-    client = chromadb.PersistentClient(path="./chroma_db5")
-    collection = client.get_collection(name="students_vectorises")
-    print(f"Total d'étudiants dans students_vectorises : {collection.count()}")
+    # Vérification finale et index compact des noms
+    build_student_index(chromadb.PersistentClient(path="./chroma_db5"))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
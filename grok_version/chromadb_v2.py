@@ -1,23 +1,18 @@
+import os
+import sys
 import pandas as pd
 import chromadb
-from sentence_transformers import SentenceTransformer
 import psycopg2
 from psycopg2 import Error
 
-# Connexion à PostgreSQL 9.6
-try:
-    conn = psycopg2.connect(
-        dbname="cm_db",
-        user="postgres",
-        password="root",
-        host="localhost",
-        port="5432"
-    )
-    conn.set_client_encoding('UTF8')
-    print("Connexion à la base de données réussie.")
-except Error as e:
-    print(f"Erreur lors de la connexion à PostgreSQL : {e}")
-    exit()
+# Module de snapshot du catalogue (partagé avec les chatbots)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot"))
+from catalog_snapshot import publish_snapshot
+from collection_aliases import CollectionPublisher, ValidationError
+from embedding_client import get_embedder
+from lexical_index import BM25Index
+from metadata_schema import SCHEMA_KEY, build_group_metadata
+from tariff_matrix import TariffMatrix
 
 # Nouvelle requête SQL avec id_forfait
 query = """
@@ -75,141 +70,137 @@ GROUP BY cc.id, tea.id, cn.id, cm.id, st.id, ce.id, cc2.id, ct.id, cf.id, co.id,
 ORDER BY cc.datecreation DESC;
 """
 
-# Charger les données dans un DataFrame
-try:
+# Matrice tarifaire : toutes les offres de chaque forfait
+tariff_query = """
+SELECT 
+    co.offregeneric_id AS id_forfait,
+    cftd.id AS type_duree_id,
+    cftd.name AS type_duree,
+    co.tarifunitaire
+FROM cm_offretemporelle co
+JOIN cm_forfait cf ON cf.id = co.offregeneric_id
+JOIN cm_forfait_type_duree cftd ON cftd.id = co.periode_id
+WHERE co.deleted = FALSE
+AND cf.deleted = FALSE
+AND cftd.deleted = FALSE
+AND co.tarifunitaire != 0
+ORDER BY co.offregeneric_id, cftd.id, co.id DESC;
+"""
+
+
+COLLECTION_NAME = "groupes_vectorises9"
+TARIFF_MATRIX_PATH = os.path.join(".", "tariff_matrix.json")
+
+
+def connect():
+    """Connexion à PostgreSQL 9.6"""
+    conn = psycopg2.connect(
+        dbname="cm_db",
+        user="postgres",
+        password="root",
+        host="localhost",
+        port="5432"
+    )
+    conn.set_client_encoding('UTF8')
+    return conn
+
+
+def load_groups(conn):
+    """Extraction : une ligne par (groupe, élève, offre)"""
     df = pd.read_sql_query(query, conn)
     print(f"Données chargées avec succès : {len(df)} lignes récupérées.")
-except Error as e:
-    print(f"Erreur lors de l'exécution de la requête SQL : {e}")
-    conn.close()
-    exit()
+    return df
 
-# Étape 1 : Calculer le nombre d'étudiants par id_cours
-students_per_group = df.groupby('id_cours')['student'].apply(lambda x: len(set(x))).to_dict()
 
-# Étape 2 : Regrouper les écoles par id_cours
-schools_per_group = df.groupby('id_cours')['ecole'].apply(lambda x: ", ".join(x.dropna())).to_dict()
+def build_groups(df):
+    """Transformation : (ids, documents, metadatas), une entrée par id_cours"""
+    # Étape 1 : Regrouper les écoles par id_cours
+    schools_per_group = df.groupby('id_cours')['ecole'].apply(lambda x: ", ".join(x.dropna())).to_dict()
 
-# Étape 3 : Regrouper les étudiants par id_cours
-students_by_group = df.groupby('id_cours')['student'].apply(lambda x: ", ".join(set(x.dropna()))).to_dict()
+    # Étape 2 : Regrouper les étudiants par id_cours
+    students_by_group = df.groupby('id_cours')['student'].apply(lambda x: ", ".join(set(x.dropna()))).to_dict()
 
-# Étape 4 : Regrouper les types de durée, IDs forfait et tarifs par id_cours
-duree_tarifs_per_group = df.groupby('id_cours').apply(
-    lambda x: ";".join(
-        x['type_duree'] + ":" + x['id_forfait'].astype(str) + ":" + x['tarifunitaire'].astype(str)
-    )
-).to_dict()
-
-# Initialiser ChromaDB
-client = chromadb.PersistentClient(path="./chroma_db5")
-# groupes_vectorises8 sans le nom_forfait , groupes_vectorises9 avce nom_forfait
-collection_name = "groupes_vectorises9"
-try:
-    client.delete_collection(collection_name)
-except:
-    pass
-collection = client.create_collection(name=collection_name)
-
-# Initialiser le modèle pour les embeddings
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Préparer les données pour ChromaDB
-documents = []
-metadatas = []
-ids = []
-
-for id_cours, group in df.groupby('id_cours'):
-    # Vérifier que le groupe est associé à un seul centre
-    unique_centres = group['centre'].unique()
-    if len(unique_centres) != 1:
-        print(f"Erreur : Le groupe {id_cours} est associé à plusieurs centres : {unique_centres}")
-        continue
-    centre = unique_centres[0]
-
-    # Description du groupe
-    description = (
-        f"Niveau: {group['niveau'].iloc[0]}, "
-        f"Matière: {group['matiere'].iloc[0]}, "
-        f"Centre: {centre}, "
-        f"Enseignant: {group['teacher'].iloc[0]}, "
-        f"Écoles: {schools_per_group[id_cours]}"
-    ).encode('utf-8').decode('utf-8')
-    
-    # Liste des étudiants pour ce groupe
-    students = students_by_group.get(id_cours, "")
-    
-    # Nombre d'étudiants pour ce groupe
-    num_students = students_per_group.get(id_cours, 0)
-    
-    # Nombre total d'étudiants (via nb_students)
-    total_students = group['nb_students'].iloc[0]
-    
-    # Forfait
-    id_forfait = str(group['id_forfait'].iloc[0])
-    nom_forfait = str(group['nom_forfait'].iloc[0]).encode('utf-8').decode('utf-8')
-    
-    # Types de durée à partir de duree_tarifs_per_group
-    duree_tarifs = duree_tarifs_per_group.get(id_cours, "")
-    type_duree = None
-    type_duree_id = None
-    tarif_unitaire = None
-    if duree_tarifs:
-        # Prendre la première entrée de duree_tarifs pour les champs individuels
-        first_entry = duree_tarifs.split(';')[0]
-        try:
-            parts = first_entry.split(':')
-            if len(parts) == 3:
-                type_duree = parts[0]
-                type_duree_id = f"{id_forfait}_1"  # Générer un ID temporaire
-                tarif_unitaire = parts[2]
-            else:
-                print(f"Format invalide dans duree_tarifs pour id_cours={id_cours}: {first_entry}")
-        except Exception as e:
-            print(f"Erreur de traitement de duree_tarifs pour id_cours={id_cours}: {first_entry}, erreur={e}")
-    
-    # Vérifier les données
-    if not type_duree or not type_duree_id:
-        print(f"Attention : type_duree ou type_duree_id manquant pour id_cours={id_cours}, id_forfait={id_forfait}")
-    
-    # Métadonnées
-    metadata = {
-        "id_cours": str(id_cours),
-        "name_cours": str(group['name_cours'].iloc[0]).encode('utf-8').decode('utf-8'),
-        "id_forfait": id_forfait,
-        "nom_forfait": nom_forfait,
-        "num_students": str(num_students),
-        "total_students": str(total_students),
-        "student": students.encode('utf-8').decode('utf-8'),
-        "ecole": schools_per_group[id_cours].encode('utf-8').decode('utf-8'),
-        "centre": str(centre).encode('utf-8').decode('utf-8'),
-        "teacher": str(group['teacher'].iloc[0]).encode('utf-8').decode('utf-8'),
-        "date_debut": str(group['date_debut'].iloc[0]),
-        "date_fin": str(group['date_fin'].iloc[0]),
-        "heure_debut": str(group['heure_debut'].iloc[0]),
-        "heure_fin": str(group['heure_fin'].iloc[0]),
-        "jour": str(group['jour'].iloc[0]),
-        "niveau": str(group['niveau'].iloc[0]).encode('utf-8').decode('utf-8'),
-        "matiere": str(group['matiere'].iloc[0]).encode('utf-8').decode('utf-8'),
-        "type_duree": type_duree or "Inconnu",
-        "type_duree_id": type_duree_id or "0",
-        "tarifunitaire": tarif_unitaire or "0.0",
-        "duree_tarifs": duree_tarifs
-    }
-    
-    # Ajouter à ChromaDB
-    documents.append(description)
-    metadatas.append(metadata)
-    ids.append(str(id_cours))
-
-# Générer les embeddings
-try:
-    embeddings = model.encode(documents).tolist()
-except Exception as e:
-    print(f"Erreur lors de la génération des embeddings : {e}")
-    exit()
-
-# Insérer dans ChromaDB
-try:
+    # Étape 3 : Regrouper les types de durée, IDs forfait et tarifs par id_cours (entrées déjà décomposées)
+    duree_tarifs_per_group = df.groupby('id_cours').apply(
+        lambda x: list(zip(x['type_duree_id'].astype(str), x['type_duree'], x['id_forfait'].astype(str),
+                           x['tarifunitaire'].astype(float)))
+    ).to_dict()
+
+    documents = []
+    metadatas = []
+    ids = []
+
+    for id_cours, group in df.groupby('id_cours'):
+        # Vérifier que le groupe est associé à un seul centre
+        unique_centres = group['centre'].unique()
+        if len(unique_centres) != 1:
+            print(f"Erreur : Le groupe {id_cours} est associé à plusieurs centres : {unique_centres}")
+            continue
+        centre = unique_centres[0]
+
+        # Description du groupe
+        description = (
+            f"Niveau: {group['niveau'].iloc[0]}, "
+            f"Matière: {group['matiere'].iloc[0]}, "
+            f"Centre: {centre}, "
+            f"Enseignant: {group['teacher'].iloc[0]}, "
+            f"Écoles: {schools_per_group[id_cours]}"
+        ).encode('utf-8').decode('utf-8')
+
+        # Élèves du groupe avec leur école (une entrée par élève)
+        students = [
+            (str(student), str(rows['ecole'].dropna().iloc[0]) if rows['ecole'].notna().any() else "Inconnu")
+            for student, rows in group.dropna(subset=['student']).groupby('student', sort=True)
+        ]
+
+        # Forfait
+        id_forfait = str(group['id_forfait'].iloc[0])
+
+        # Types de durée et tarifs : (type_duree_id, type_duree, id_forfait, tarif_unitaire)
+        duree_tarifs = duree_tarifs_per_group.get(id_cours, [])
+        if not duree_tarifs:
+            print(f"Attention : type_duree ou type_duree_id manquant pour id_cours={id_cours}, id_forfait={id_forfait}")
+
+        # Métadonnées typées (schéma versionné, voir chatbot/metadata_schema.py)
+        metadata = build_group_metadata({
+            "id_cours": id_cours,
+            "name_cours": group['name_cours'].iloc[0],
+            "id_forfait": id_forfait,
+            "nom_forfait": group['nom_forfait'].iloc[0],
+            "total_students": int(group['nb_students'].iloc[0]),
+            "student": students_by_group.get(id_cours, ""),
+            "ecole": schools_per_group[id_cours],
+            "centre": centre,
+            "teacher": group['teacher'].iloc[0],
+            "date_debut": group['date_debut'].iloc[0],
+            "date_fin": group['date_fin'].iloc[0],
+            "heure_debut": group['heure_debut'].iloc[0],
+            "heure_fin": group['heure_fin'].iloc[0],
+            "jour": group['jour'].iloc[0],
+            "niveau": group['niveau'].iloc[0],
+            "matiere": group['matiere'].iloc[0],
+        }, students, duree_tarifs)
+
+        documents.append(description)
+        metadatas.append(metadata)
+        ids.append(str(id_cours))
+    return ids, documents, metadatas
+
+
+def embed_documents(documents):
+    """Embeddings : service partagé s'il tourne (embedding_service.py), sinon modèle local"""
+    embeddings = get_embedder().encode(documents)
+    return embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings
+
+
+def publish_groups(client, ids, documents, metadatas, embeddings):
+    """Insertion dans une collection versionnée, validation, bascule de l'alias et index BM25.
+
+    Les chatbots lisent la version publiée pendant la construction ; lève ValidationError si la nouvelle
+    version est refusée (la précédente reste en ligne).
+    """
+    publisher = CollectionPublisher(client, COLLECTION_NAME, chroma_path="./chroma_db5")
+    collection = publisher.create()
     collection.add(
         documents=documents,
         embeddings=embeddings,
@@ -217,10 +208,75 @@ try:
         ids=ids
     )
     print("Données insérées dans ChromaDB avec succès.")
-except Exception as e:
-    print(f"Erreur lors de l'insertion dans ChromaDB : {e}")
-    exit()
+    publisher.publish(collection, required_keys=("id_cours", "niveau", "matiere", "centre", "id_forfait", SCHEMA_KEY))
+
+    # Index BM25 des descriptions, enregistré à côté de chroma_db5 (recherche hybride)
+    bm25_path = BM25Index.build(ids, metadatas).save(os.path.join(".", f"bm25_{COLLECTION_NAME}.json"))
+    print(f"Index BM25 enregistré dans {bm25_path}")
+    return collection.name
+
+
+def build_tariff_matrix(conn, path=TARIFF_MATRIX_PATH):
+    """Matrice tarifaire forfait × type de durée (toutes les offres, pas seulement la première par groupe)"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(tariff_query)
+        tariff_matrix = TariffMatrix.from_rows(cursor.fetchall())
+    finally:
+        cursor.close()
+    tariff_path = tariff_matrix.save(path)
+    print(f"Matrice tarifaire enregistrée dans {tariff_path} : {len(tariff_matrix.forfaits)} forfaits, {len(tariff_matrix)} tarifs")
+    return tariff_path
+
+
+def main():
+    try:
+        conn = connect()
+        print("Connexion à la base de données réussie.")
+    except Error as e:
+        print(f"Erreur lors de la connexion à PostgreSQL : {e}")
+        exit()
+
+    # Charger les données dans un DataFrame
+    try:
+        df = load_groups(conn)
+    except Error as e:
+        print(f"Erreur lors de l'exécution de la requête SQL : {e}")
+        conn.close()
+        exit()
+
+    ids, documents, metadatas = build_groups(df)
+
+    # Générer les embeddings
+    try:
+        embeddings = embed_documents(documents)
+    except Exception as e:
+        print(f"Erreur lors de la génération des embeddings : {e}")
+        exit()
+
+    # Initialiser ChromaDB
+    client = chromadb.PersistentClient(path="./chroma_db5")
+    try:
+        publish_groups(client, ids, documents, metadatas, embeddings)
+    except ValidationError as e:
+        print(f"Publication annulée, la version précédente reste en ligne : {e}")
+        conn.close()
+        exit()
+    except Exception as e:
+        print(f"Erreur lors de l'insertion dans ChromaDB : {e}")
+        exit()
+    print("Vectorisation terminée !")
+
+    try:
+        build_tariff_matrix(conn)
+    except Error as e:
+        print(f"Erreur lors de la construction de la matrice tarifaire : {e}")
+
+    # Publier le snapshot du catalogue lu par les chatbots
+    publish_snapshot(client, chroma_path="./chroma_db5", tariff_matrix_path=TARIFF_MATRIX_PATH)
+    conn.close()
+    print("Connexion à la base de données fermée.")
+
 
-print("Vectorisation terminée !")
-conn.close()
-print("Connexion à la base de données fermée.")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+
+import chromadb
+from psycopg2.pool import ThreadedConnectionPool
+
+# Modules partagés avec les chatbots ; les scripts d'ingestion fournissent les étapes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot"))
+from catalog_snapshot import publish_snapshot
+from ingestion_pipeline import Checkpoint, PipelineError, Stage, run_pipeline
+import chromadb_seance
+import chromadb_students
+import chromadb_v1
+import chromadb_v2
+import chromadb_v3_tr_com_se
+
+db_config = {
+    "host": "localhost",
+    "port": "5432",
+    "database": "cm_db",
+    "user": "postgres",
+    "password": "root"
+}
+
+CHECKPOINT_DIR = os.path.join(".", "ingestion_checkpoint")
+
+
+class IngestionContext:
+    """Ressources partagées par les étapes : pool de connexions PostgreSQL et client ChromaDB"""
+
+    def __init__(self, pool, client):
+        self.pool = pool
+        self.client = client
+
+    @contextmanager
+    def connection(self):
+        conn = self.pool.getconn()
+        try:
+            conn.set_client_encoding('UTF8')
+            yield conn
+        finally:
+            # Lectures seules : la connexion revient au pool hors transaction, même après une erreur
+            conn.rollback()
+            self.pool.putconn(conn)
+
+
+def _with_connection(func):
+    def stage(context, inputs):
+        with context.connection() as conn:
+            return func(conn, context.client)
+    return stage
+
+
+def build_stages(legacy=False):
+    """Graphe extract → transform → embed → publish des cinq scripts d'ingestion.
+
+    Les extractions indépendantes partent ensemble ; le snapshot du catalogue n'est publié qu'une fois,
+    après les groupes, la matrice tarifaire, les séances et les combinaisons.
+    """
+    stages = [
+        # Groupes (chromadb_v2.py) et matrice tarifaire
+        Stage("groups.extract", _with_connection(lambda conn, client: chromadb_v2.load_groups(conn))),
+        Stage("groups.transform", lambda context, inputs: chromadb_v2.build_groups(inputs["groups.extract"]), ["groups.extract"]),
+        Stage("groups.embed", lambda context, inputs: chromadb_v2.embed_documents(inputs["groups.transform"][1]), ["groups.transform"]),
+        Stage("groups.publish", lambda context, inputs: chromadb_v2.publish_groups(context.client, *inputs["groups.transform"], inputs["groups.embed"]),
+              ["groups.transform", "groups.embed"]),
+        Stage("tariffs.extract", _with_connection(lambda conn, client: chromadb_v2.build_tariff_matrix(conn))),
+
+        # Tarifs, combinaisons et séances (chromadb_v3_tr_com_se.py, chromadb_seance.py) : lecture par lots et écriture en continu
+        Stage("tarifs.publish", _with_connection(chromadb_v3_tr_com_se.vectorize_tarifs)),
+        Stage("combinaisons.publish", _with_connection(chromadb_v3_tr_com_se.vectorize_combinaisons)),
+        Stage("seances.publish", _with_connection(chromadb_seance.vectorize_seances)),
+
+        # Élèves (chromadb_students.py) : encodage des noms dans les lots du BulkWriter
+        Stage("students.extract", _with_connection(lambda conn, client: chromadb_students.get_students_from_db(conn))),
+        Stage("students.publish", lambda context, inputs: chromadb_students.vectorize_students(inputs["students.extract"], context.client),
+              ["students.extract"]),
+        Stage("students.index", lambda context, inputs: chromadb_students.build_student_index(context.client), ["students.publish"]),
+
+        Stage("catalog.snapshot", lambda context, inputs: publish_snapshot(context.client, chroma_path="./chroma_db5",
+                                                                         tariff_matrix_path=inputs["tariffs.extract"]),
+              ["groups.publish", "tariffs.extract", "seances.publish", "combinaisons.publish"]),
+    ]
+    if legacy:
+        # Collection historique groupes_vectorises5 (chromadb_v1.py), lue par chatbot_streamlit3.py
+        stages += [
+            Stage("legacy.extract", _with_connection(lambda conn, client: chromadb_v1.load_groups(conn))),
+            Stage("legacy.transform", lambda context, inputs: chromadb_v1.build_groups(inputs["legacy.extract"]), ["legacy.extract"]),
+            Stage("legacy.embed", lambda context, inputs: chromadb_v1.embed_documents(inputs["legacy.transform"][1]), ["legacy.transform"]),
+            Stage("legacy.publish", lambda context, inputs: chromadb_v1.write_groups(context.client, *inputs["legacy.transform"], inputs["legacy.embed"]),
+                  ["legacy.transform", "legacy.embed"]),
+        ]
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion complète PostgreSQL → ChromaDB avec reprise sur erreur")
+    parser.add_argument("--workers", type=int, default=4, help="Étapes exécutées en parallèle (et taille du pool de connexions)")
+    parser.add_argument("--restart", action="store_true", help="Ignore le point de reprise et relance toutes les étapes")
+    parser.add_argument("--legacy", action="store_true", help="Reconstruit aussi groupes_vectorises5 (chromadb_v1.py)")
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR)
+    args = parser.parse_args()
+
+    pool = ThreadedConnectionPool(1, args.workers, **db_config)
+    context = IngestionContext(pool, chromadb.PersistentClient(path="./chroma_db5"))
+    try:
+        run_pipeline(build_stages(args.legacy), context, Checkpoint(args.checkpoint_dir), workers=args.workers, restart=args.restart)
+        print("Ingestion terminée !")
+    except PipelineError as e:
+        print(f"Ingestion interrompue : {e}")
+        sys.exit(1)
+    finally:
+        pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
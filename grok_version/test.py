@@ -1,8 +1,14 @@
+import os
+import sys
+
 import chromadb
 
-# Connexion à ChromaDB
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "chatbot"))
+from collection_aliases import resolve_collection
+
+# Connexion à ChromaDB (version publiée de l'alias groupes_vectorises9)
 client = chromadb.PersistentClient(path="./chroma_db5")
-collection = client.get_collection(name="groupes_vectorises9")
+collection = client.get_collection(name=resolve_collection("groupes_vectorises9", "./chroma_db5"))
 
 # Récupérer toutes les métadonnées
 all_groups = collection.get(include=["metadatas"])